@@ -0,0 +1,199 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from typing import List, Optional
+from dotenv import load_dotenv
+
+from metrics import counter
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+_basedir = os.path.abspath(os.path.dirname(__file__))
+
+# LLM analysis cache configuration
+ANALYSIS_CACHE_ENABLED = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ANALYSIS_CACHE_DB_PATH = os.getenv("ANALYSIS_CACHE_DB_PATH", os.path.join(_basedir, "uploads", "analysis.sqlite3"))
+ANALYSIS_CACHE_TTL_SECONDS = int(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", str(90 * 24 * 3600)))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "50000"))
+# Defaults for lookups that do not name them; must match the workflow's "OpenAI Analysis" node
+ANALYSIS_MODEL = os.getenv("ANALYSIS_MODEL", "gpt-3.5-turbo")
+ANALYSIS_PROMPT_VERSION = os.getenv("ANALYSIS_PROMPT_VERSION", "1")
+# Shorter normalized texts (scanned or image-only PDFs) get no key: their analyses do not come from the text
+ANALYSIS_MIN_TEXT_LENGTH = int(os.getenv("ANALYSIS_MIN_TEXT_LENGTH", "100"))
+# Expired and excess entries are purged once every this many writes
+ANALYSIS_CACHE_PURGE_INTERVAL = 200
+# Texts per lookup request
+ANALYSIS_LOOKUP_MAX_TEXTS = 100
+
+# Resume fields an analysis consists of
+ANALYSIS_FIELDS = ("full_name", "email", "phone", "skills", "experience_years", "last_job_title")
+
+ANALYSIS_CACHE_LOOKUPS = counter(
+    "analysis_cache_lookups_total", "LLM analysis cache lookups by result", ("result",))
+
+# Characters that PDF producers insert or drop without changing what the text says
+_INVISIBLE = dict.fromkeys(map(ord, "\u00ad\u200b\u200c\u200d\u2060\ufeff"))
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    """Canonical form of extracted resume text for cache keys.
+
+    Compatibility-normalizes Unicode (ligatures, full-width forms), drops
+    soft hyphens and zero-width characters, and collapses all whitespace, so
+    a re-exported PDF or another text extractor yields the same key while
+    any change to the words themselves does not.
+    """
+    text = unicodedata.normalize("NFKC", text).translate(_INVISIBLE)
+    return _WHITESPACE.sub(" ", text).strip()
+
+def analysis_key(text: str, model: str = ANALYSIS_MODEL,
+                 prompt_version: str = ANALYSIS_PROMPT_VERSION) -> Optional[str]:
+    """SHA-256 over the model, the prompt version and the normalized text.
+
+    None when the normalized text is shorter than ANALYSIS_MIN_TEXT_LENGTH:
+    every blank or near-blank text would share one key, and the analysis
+    cached for the first would be served for all the others.
+    """
+    normalized = normalize_text(text)
+    if len(normalized) < ANALYSIS_MIN_TEXT_LENGTH:
+        return None
+    digest = hashlib.sha256()
+    for part in (model, prompt_version, normalized):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class AnalysisCache:
+    """SQLite-backed cache of LLM resume analyses by ``analysis_key``.
+
+    The workflow looks a resume's text up before calling OpenAI and skips
+    the call on a hit; analyses it did run come back with their key on
+    ``POST /resumes`` and are stored here. Entries expire after
+    ``ttl_seconds`` and the least recently used ones are evicted beyond
+    ``max_entries``. The file can be shared by the worker processes on one
+    host.
+    """
+
+    def __init__(self, db_path: str = ANALYSIS_CACHE_DB_PATH, ttl_seconds: int = ANALYSIS_CACHE_TTL_SECONDS,
+                 max_entries: int = ANALYSIS_CACHE_MAX_ENTRIES):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS analyses (
+                cache_key TEXT PRIMARY KEY,
+                analysis TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_last_used ON analyses(last_used_at)")
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return the cached analysis for a key, counting a hit or a miss"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT analysis, created_at FROM analyses WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                ANALYSIS_CACHE_LOOKUPS.labels("miss").inc()
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE analyses SET last_used_at = ?, hits = hits + 1 WHERE cache_key = ?",
+                               (now, key))
+        ANALYSIS_CACHE_LOOKUPS.labels("hit").inc()
+        return json.loads(row[0])
+
+    def lookup(self, texts: List[str], model: str = ANALYSIS_MODEL,
+               prompt_version: str = ANALYSIS_PROMPT_VERSION) -> List[dict]:
+        """Key and cached analysis (or None) for each resume text; texts too short to key get neither"""
+        results = []
+        for text in texts:
+            key = analysis_key(text, model, prompt_version)
+            if key is None:
+                ANALYSIS_CACHE_LOOKUPS.labels("skipped").inc()
+                results.append({"analysis_key": None, "hit": False, "analysis": None})
+                continue
+            analysis = self.get(key)
+            results.append({"analysis_key": key, "hit": analysis is not None, "analysis": analysis})
+        return results
+
+    def put(self, key: str, analysis: dict):
+        """Store the analysis for a key, replacing an older one"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analyses (cache_key, analysis, created_at, last_used_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(analysis, default=str), now, now)
+            )
+            self.stored += 1
+            self._writes += 1
+            if self._writes % ANALYSIS_CACHE_PURGE_INTERVAL == 0:
+                self._purge(now)
+
+    def _purge(self, now: float):
+        expired = self._conn.execute(
+            "DELETE FROM analyses WHERE created_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        excess = self._conn.execute(
+            "DELETE FROM analyses WHERE cache_key IN (SELECT cache_key FROM analyses "
+            "ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+        ).rowcount
+        if expired or excess:
+            logger.info("Analysis cache purged %s expired and %s least recently used entries", expired, excess)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stored": self.stored,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+# Global instance
+analysis_cache: Optional[AnalysisCache] = None
+
+def get_analysis_cache() -> Optional[AnalysisCache]:
+    """Get or create the analysis cache, or None when it is disabled"""
+    global analysis_cache
+    if not ANALYSIS_CACHE_ENABLED:
+        return None
+    if analysis_cache is None:
+        analysis_cache = AnalysisCache()
+    return analysis_cache
+
+def close_analysis_cache():
+    """Close the analysis cache database connection"""
+    global analysis_cache
+    if analysis_cache is not None:
+        analysis_cache.close()
+        analysis_cache = None
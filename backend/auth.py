@@ -1,6 +1,12 @@
+import hmac
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
-from fastapi import HTTPException, status, Depends
+from typing import Optional, Tuple
+from fastapi import HTTPException, Header, Query, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
 from passlib.context import CryptContext
@@ -9,6 +15,8 @@ import os
 from dotenv import load_dotenv
 import logging
 
+from metrics import AUTH_SECONDS, timed
+
 load_dotenv()
 
 # Set up logging
@@ -21,17 +29,36 @@ if SECRET_KEY == "your-secret-key-change-in-production":
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60  # Increased to 1 hour for easier testing
 
+# Precomputed bcrypt hash of the demo user's password ("admin123"); generate a new one with
+# python -c "from passlib.context import CryptContext; print(CryptContext(schemes=['bcrypt']).hash('...'))"
+ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "admin")
+ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "admin@example.com")
+ADMIN_PASSWORD_HASH = os.getenv("ADMIN_PASSWORD_HASH", "$2b$12$S1aWHhq6/st2wevteIBxTuIAK2VGFg0zVTcCF3KF75vgvNglC5QQW")
+# Threads available for bcrypt verification; extra logins wait for a free one
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+
+# Shared secret the n8n workflow sends as X-N8N-Token when it calls back into the API
+N8N_CALLBACK_TOKEN = os.getenv("N8N_CALLBACK_TOKEN")
+
+# Verified-token cache; a size of 0 disables it
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "1024"))
+AUTH_TOKEN_CACHE_TTL = float(os.getenv("AUTH_TOKEN_CACHE_TTL", "300"))
+
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # Security scheme
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+
+# Bounded pool that keeps deliberately slow bcrypt checks off the event loop
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
 
 # Hardcoded user for demo purposes
 HARDCODED_USER = {
-    "username": "admin",
-    "email": "admin@example.com",
-    "hashed_password": pwd_context.hash("admin123")
+    "username": ADMIN_USERNAME,
+    "email": ADMIN_EMAIL,
+    "hashed_password": ADMIN_PASSWORD_HASH
 }
 
 class Token(BaseModel):
@@ -48,13 +75,73 @@ class User(BaseModel):
 class UserInDB(User):
     hashed_password: str
 
+class TokenCache:
+    """Bounded LRU cache of verified access tokens.
+
+    An entry lives for at most ``ttl`` seconds and never past the token's own
+    ``exp`` claim, so a cached token stops authenticating exactly when a full
+    decode would start rejecting it.
+    """
+
+    def __init__(self, max_size: int = AUTH_TOKEN_CACHE_SIZE, ttl: float = AUTH_TOKEN_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, UserInDB]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[UserInDB]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, user = entry
+            if time.time() >= expires_at:
+                del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return user
+
+    def put(self, token: str, user: UserInDB, exp: Optional[float]):
+        if self.max_size <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        if exp is not None:
+            expires_at = min(expires_at, exp)
+        with self._lock:
+            self._entries[token] = (expires_at, user)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+token_cache = TokenCache()
+
+# User objects are built once instead of on every authenticated request
+_users = {HARDCODED_USER["username"]: UserInDB(**HARDCODED_USER)}
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_user(username: str):
-    if username == HARDCODED_USER["username"]:
-        return UserInDB(**HARDCODED_USER)
-    return None
+    return _users.get(username)
 
 def authenticate_user(username: str, password: str):
     user = get_user(username)
@@ -64,6 +151,24 @@ def authenticate_user(username: str, password: str):
         return False
     return user
 
+@timed(AUTH_SECONDS, "password", outcome=lambda user: "ok" if user else "rejected")
+async def authenticate_user_async(username: str, password: str):
+    """Like authenticate_user, but verifies the password on the bounded password executor"""
+    user = get_user(username)
+    if not user:
+        return False
+    loop = asyncio.get_running_loop()
+    if not await loop.run_in_executor(password_executor, verify_password, password, user.hashed_password):
+        return False
+    return user
+
+def load_password_hasher():
+    """Load the bcrypt backend, which passlib otherwise does on the first login"""
+    pwd_context.handler().get_backend()
+
+def shutdown_password_executor():
+    password_executor.shutdown(wait=False, cancel_futures=True)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -74,33 +179,67 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+@timed(AUTH_SECONDS, "jwt")
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    token = credentials.credentials
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        logger.info(f"Validating JWT token: {credentials.credentials[:20]}...")
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
-        logger.info(f"Token payload: {payload}")
         if username is None:
             logger.error("No username found in token payload")
             raise credentials_exception
         token_data = TokenData(username=username)
-        logger.info(f"Token data: {token_data}")
     except JWTError as e:
-        logger.error(f"JWT decode error: {str(e)}")
+        # Client errors; kept below ERROR so a flood of bad tokens is rate limited in the logs
+        logger.warning("JWT decode error: %s", e)
         raise credentials_exception
     except Exception as e:
-        logger.error(f"Unexpected error in token validation: {str(e)}")
+        logger.error("Unexpected error in token validation: %s", e)
         raise credentials_exception
     
     user = get_user(username=token_data.username)
     if user is None:
-        logger.error(f"User not found: {token_data.username}")
+        logger.warning("User not found: %s", token_data.username)
         raise credentials_exception
     
-    logger.info(f"User authenticated successfully: {user.username}")
+    token_cache.put(token, user, payload.get("exp"))
+    # Debug only and lazily formatted: this runs on every authenticated request
+    logger.debug("User authenticated successfully: %s", user.username)
     return user
+
+async def get_stream_user(access_token: Optional[str] = Query(None),
+                          credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)):
+    """Authorize event streams: a Bearer token, or ``?access_token=`` for browser EventSource, which cannot set headers"""
+    if credentials is None and access_token:
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=access_token)
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await get_current_user(credentials)
+
+@timed(AUTH_SECONDS, "callback")
+async def get_callback_caller(x_n8n_token: Optional[str] = Header(None),
+                              credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)) -> str:
+    """Authorize endpoints n8n calls back into: the shared X-N8N-Token, or a regular JWT"""
+    if N8N_CALLBACK_TOKEN and x_n8n_token and hmac.compare_digest(x_n8n_token, N8N_CALLBACK_TOKEN):
+        return "n8n"
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user = await get_current_user(credentials)
+    return user.username
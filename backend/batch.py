@@ -0,0 +1,280 @@
+import os
+import json
+import uuid
+import asyncio
+import logging
+import hashlib
+import zipfile
+import tempfile
+from typing import AsyncIterator, BinaryIO, List, Optional, Tuple
+from fastapi import UploadFile, HTTPException, status
+from dotenv import load_dotenv
+
+from storage import get_storage
+from upload import ALLOWED_EXTENSIONS, trigger_n8n_batch_webhook, webhook_file_entry
+from dedup import DedupIndex, get_dedup_index
+from jobs import STAGING_DIR
+from pdf_extract import get_pdf_extractor
+from validation import PDF_MAGIC, PDF_MAGIC_WINDOW, precheck_pdf
+from metrics import UPLOAD_REJECTIONS, UPLOAD_SIZE_BYTES, UPLOAD_STAGE_SECONDS, timed
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Batch upload configuration
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "500"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+BATCH_MAX_ENTRY_SIZE = int(os.getenv("BATCH_MAX_ENTRY_SIZE", str(20 * 1024 * 1024)))
+BATCH_SPOOL_CHUNK_SIZE = 64 * 1024
+ZIP_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed"}
+
+class BatchEntry:
+    """One resume in a batch: either a plain uploaded file or a member of a ZIP archive."""
+
+    def __init__(self, index: int, filename: str, content_type: Optional[str],
+                 upload_file: Optional[UploadFile] = None, archive: Optional[zipfile.ZipFile] = None,
+                 zip_info: Optional[zipfile.ZipInfo] = None, error: Optional[str] = None):
+        self.index = index
+        self.filename = filename
+        self.content_type = content_type or "application/pdf"
+        self.upload_file = upload_file
+        self.archive = archive
+        self.zip_info = zip_info
+        self.error = error
+
+def _is_zip(upload_file: UploadFile) -> bool:
+    return (os.path.splitext(upload_file.filename or "")[1].lower() == ".zip"
+            or upload_file.content_type in ZIP_CONTENT_TYPES)
+
+def _validate(filename: str, size: Optional[int]) -> Optional[str]:
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in ALLOWED_EXTENSIONS:
+        return f"File type not allowed. Only {', '.join(ALLOWED_EXTENSIONS)} files are accepted."
+    if size is not None and size > BATCH_MAX_ENTRY_SIZE:
+        return f"File exceeds the maximum size of {BATCH_MAX_ENTRY_SIZE} bytes."
+    return None
+
+def prepare_batch(files: List[UploadFile]) -> List[BatchEntry]:
+    """Expand uploaded files and ZIP archives into validated batch entries.
+
+    Only ZIP central directories are read here; request-level problems raise
+    an HTTPException before the streaming response starts, while per-file
+    problems are recorded on the entry and reported in its result line.
+    """
+    entries: List[BatchEntry] = []
+    for upload_file in files:
+        if _is_zip(upload_file):
+            try:
+                archive = zipfile.ZipFile(upload_file.file)
+            except zipfile.BadZipFile:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"{upload_file.filename} is not a valid ZIP archive"
+                )
+            for info in archive.infolist():
+                name = os.path.basename(info.filename)
+                if info.is_dir() or not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+                    continue
+                entries.append(BatchEntry(len(entries), name, "application/pdf", archive=archive, zip_info=info,
+                                          error=_validate(name, info.file_size)))
+        else:
+            entries.append(BatchEntry(len(entries), upload_file.filename, upload_file.content_type,
+                                      upload_file=upload_file,
+                                      error=_validate(upload_file.filename, getattr(upload_file, 'size', None))))
+        if len(entries) > BATCH_MAX_FILES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Batch exceeds the maximum of {BATCH_MAX_FILES} files"
+            )
+
+    if not entries:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No files provided")
+    return entries
+
+@timed(UPLOAD_STAGE_SECONDS, "batch_read")
+def _open_entry(entry: BatchEntry) -> Tuple[BinaryIO, str]:
+    """Spool the entry to a named file in the staging directory and return it with its SHA-256.
+
+    The file is hashed while copying and removed when it is closed; a process
+    that dies first leaves it to the job queue's orphan cleanup.
+    """
+    if entry.upload_file is not None:
+        source = entry.upload_file.file
+        source.seek(0)
+        return _spool(source)
+    with entry.archive.open(entry.zip_info) as source:
+        return _spool(source)
+
+def _spool(source: BinaryIO) -> Tuple[BinaryIO, str]:
+    spool = tempfile.NamedTemporaryFile(dir=STAGING_DIR, prefix="batch-", suffix=".pdf")
+    digest = hashlib.sha256()
+    try:
+        # The declared size (e.g. in a ZIP header) is not trusted; enforce the cap while copying
+        copied = 0
+        while True:
+            chunk = source.read(BATCH_SPOOL_CHUNK_SIZE)
+            if not chunk:
+                break
+            if not copied and PDF_MAGIC not in chunk[:PDF_MAGIC_WINDOW]:
+                UPLOAD_REJECTIONS.labels("not_pdf").inc()
+                raise ValueError("File is not a PDF document.")
+            copied += len(chunk)
+            if copied > BATCH_MAX_ENTRY_SIZE:
+                raise ValueError(f"File exceeds the maximum size of {BATCH_MAX_ENTRY_SIZE} bytes.")
+            digest.update(chunk)
+            spool.write(chunk)
+        if not copied:
+            raise ValueError("File is empty.")
+        spool.flush()
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    UPLOAD_SIZE_BYTES.labels("batch").observe(copied)
+    return spool, digest.hexdigest()
+
+def _record_uploads(dedup_index: DedupIndex, stored: List[Tuple[str, dict, str]]):
+    for content_hash, drive_file_info, filename in stored:
+        dedup_index.record_upload(content_hash, drive_file_info, filename)
+
+async def _queue_batch(batch_id: str, uploaded: List[dict], stored: List[Tuple[str, dict, str]],
+                       dedup_index: Optional[DedupIndex]) -> dict:
+    """Queue the batch webhook for the stored files, then record them in the dedup index.
+
+    Files are only recorded once their webhook is in the outbox: a file
+    stored by a batch that never got that far is accepted again on its next
+    upload instead of being answered as a duplicate that n8n never saw.
+    """
+    if not uploaded:
+        return {"status": "skipped", "message": "No files were uploaded"}
+    try:
+        webhook_status = await trigger_n8n_batch_webhook(batch_id, uploaded)
+    except Exception as e:
+        logger.error("Batch %s: could not queue the n8n webhook: %s", batch_id, e, extra={"batch_id": batch_id})
+        return {"status": "error", "message": f"Failed to queue the n8n webhook: {e}"}
+    if dedup_index is not None:
+        await asyncio.to_thread(_record_uploads, dedup_index, stored)
+    return webhook_status
+
+def _result(entry: BatchEntry, result_status: str, drive_file_info: Optional[dict] = None,
+            error: Optional[str] = None, content_hash: Optional[str] = None) -> dict:
+    result = {"type": "file", "index": entry.index, "filename": entry.filename, "status": result_status}
+    if content_hash is not None:
+        result["content_hash"] = content_hash
+    if drive_file_info is not None:
+        result.update({
+            "drive_file_id": drive_file_info.get('file_id'),
+            "drive_link": drive_file_info.get('web_view_link'),
+            "size": drive_file_info.get('size')
+        })
+    if error is not None:
+        result["error"] = error
+    return result
+
+async def stream_batch(entries: List[BatchEntry]) -> AsyncIterator[str]:
+    """Store batch entries with bounded concurrency, yielding NDJSON results as they finish.
+
+    ZIP members are extracted one at a time, and at most BATCH_MAX_CONCURRENCY
+    entries are open or uploading at once. Each entry gets the PDF structure
+    pre-check of a single upload and is rejected if it fails. Entries whose
+    content hash is already in the dedup index are reported as duplicates
+    without being uploaded. After every entry has finished, a single batched
+    webhook is queued for n8n for the new files and a summary line closes the
+    stream. If the client disconnects first, the webhook is still queued for
+    the files stored by then.
+    """
+    batch_id = uuid.uuid4().hex
+    storage = get_storage()
+    dedup_index = get_dedup_index()
+    pdf_extractor = get_pdf_extractor()
+    results: asyncio.Queue = asyncio.Queue()
+    slots = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    uploaded = []
+    stored = []
+    tasks = []
+    logger.info("Starting batch %s with %d files", batch_id, len(entries), extra={"batch_id": batch_id})
+
+    async def upload_entry(entry: BatchEntry, file_obj: BinaryIO, content_hash: str):
+        extraction = None
+        try:
+            if pdf_extractor is not None:
+                # The extraction worker reads the spooled file by path while it is stored
+                extraction = asyncio.create_task(pdf_extractor.extract(file_obj.name, entry.filename))
+            drive_file_info = await storage.store(file_obj, entry.filename, entry.content_type, content_hash,
+                                                  path=file_obj.name)
+            extracted = await extraction if extraction is not None else None
+            uploaded.append(webhook_file_entry(drive_file_info, entry.filename, content_hash, extracted))
+            stored.append((content_hash, drive_file_info, entry.filename))
+            await results.put(_result(entry, "uploaded", drive_file_info, content_hash=content_hash))
+        except asyncio.TimeoutError:
+            await results.put(_result(entry, "failed", error="Storing the file timed out"))
+        except Exception as e:
+            logger.error("Batch %s: upload of %s failed: %s", batch_id, entry.filename, e, extra={"batch_id": batch_id})
+            await results.put(_result(entry, "failed", error=str(e)))
+        finally:
+            if extraction is not None:
+                extraction.cancel()
+            file_obj.close()
+            slots.release()
+
+    async def produce():
+        for entry in entries:
+            if entry.error:
+                await results.put(_result(entry, "rejected", error=entry.error))
+                continue
+            await slots.acquire()
+            try:
+                file_obj, content_hash = await asyncio.to_thread(_open_entry, entry)
+            except Exception as e:
+                slots.release()
+                await results.put(_result(entry, "rejected", error=str(e)))
+                continue
+
+            try:
+                await precheck_pdf(file_obj.name, entry.filename)
+            except HTTPException as e:
+                file_obj.close()
+                slots.release()
+                await results.put(_result(entry, "rejected", error=e.detail))
+                continue
+
+            duplicate = None
+            if dedup_index is not None:
+                duplicate = await asyncio.to_thread(dedup_index.lookup, content_hash)
+            if duplicate is not None and duplicate["drive_file_id"]:
+                file_obj.close()
+                slots.release()
+                drive_file_info = {'file_id': duplicate["drive_file_id"], 'web_view_link': duplicate["drive_link"],
+                                   'size': duplicate["size"]}
+                result = _result(entry, "duplicate", drive_file_info, content_hash=content_hash)
+                result["analysis"] = duplicate["analysis"]
+                await results.put(result)
+                continue
+            tasks.append(asyncio.create_task(upload_entry(entry, file_obj, content_hash)))
+        await asyncio.gather(*tasks)
+        await results.put(None)
+
+    producer = asyncio.create_task(produce())
+    counts = {"uploaded": 0, "duplicate": 0, "failed": 0, "rejected": 0}
+    try:
+        while True:
+            result = await results.get()
+            if result is None:
+                break
+            counts[result["status"]] += 1
+            yield json.dumps(result) + "\n"
+    finally:
+        # Stop early if the client disconnected mid-stream
+        for task in [producer, *tasks]:
+            if not task.done():
+                task.cancel()
+        for archive in {entry.archive for entry in entries if entry.archive is not None}:
+            archive.close()
+        # Shielded, so the files stored so far still reach n8n when the client has gone
+        webhook_status = await asyncio.shield(
+            asyncio.create_task(_queue_batch(batch_id, uploaded, stored, dedup_index)))
+
+    logger.info("Batch %s finished: %s", batch_id, counts, extra={"batch_id": batch_id})
+    yield json.dumps({"type": "summary", "batch_id": batch_id, **counts, "webhook_status": webhook_status}) + "\n"
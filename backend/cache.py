@@ -0,0 +1,403 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from fastapi.encoders import jsonable_encoder
+from dotenv import load_dotenv
+
+from workers import MULTI_WORKER
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+_basedir = os.path.abspath(os.path.dirname(__file__))
+
+# Result cache configuration
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# "memory" for the in-process LRU, "sqlite" for a file shared by the worker processes on a host,
+# "redis" for any Redis-protocol server
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite" if MULTI_WORKER else "memory").lower()
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", os.path.join(_basedir, "uploads", "result_cache.sqlite3"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "resume-analyzer:")
+# Expired and excess SQLite entries are purged once every this many writes
+CACHE_PURGE_INTERVAL = 500
+
+def make_key(namespace: str, params: Dict[str, Any]) -> str:
+    """Build a stable cache key from already-normalized query parameters.
+
+    None values are dropped and keys are sorted, so equivalent queries share
+    an entry; long parameter sets are hashed to keep keys short.
+    """
+    canonical = json.dumps({k: v for k, v in params.items() if v is not None}, sort_keys=True,
+                           separators=(",", ":"), default=str)
+    if len(canonical) > 200:
+        canonical = hashlib.sha256(canonical.encode()).hexdigest()
+    return f"{namespace}:{canonical}"
+
+class MemoryCacheBackend:
+    """In-process LRU with per-entry TTL and tag-based invalidation."""
+    shared = False
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any, Tuple[str, ...]]]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() >= entry[0]:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    async def set(self, key: str, value: Any, ttl: float, tags: Tuple[str, ...]):
+        self._remove(key)
+        self._entries[key] = (time.monotonic() + ttl, value, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> int:
+        removed = 0
+        for tag in tags:
+            for key in self._tags.pop(tag, set()):
+                if key in self._entries:
+                    self._remove(key)
+                    removed += 1
+        return removed
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    async def close(self):
+        self._entries.clear()
+        self._tags.clear()
+
+    def size(self) -> Optional[int]:
+        return len(self._entries)
+
+class SqliteCacheBackend:
+    """Cache entries in a SQLite file shared by the worker processes on one host.
+
+    Values are stored as JSON with an expiry time, and each (tag, key) pair is
+    a row, so invalidating a tag in one process is seen by the next read in
+    every other. A generation counter bumped by each invalidation lets a
+    process detect that another one invalidated while it was loading. Beyond
+    ``max_entries`` the entries closest to expiry are dropped first.
+    """
+    shared = True
+
+    def __init__(self, db_path: str = CACHE_DB_PATH, max_entries: int = CACHE_MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_cache_entries_expires ON cache_entries(expires_at);
+            CREATE TABLE IF NOT EXISTS cache_tags (
+                tag TEXT NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (tag, key)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_cache_tags_key ON cache_tags(key);
+            CREATE TABLE IF NOT EXISTS cache_generation (id INTEGER PRIMARY KEY CHECK (id = 0), value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO cache_generation (id, value) VALUES (0, 0);
+        """)
+
+    def _get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() >= row[1]:
+            return None
+        return json.loads(row[0])
+
+    def _set(self, key: str, value: Any, ttl: float, tags: Tuple[str, ...]):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM cache_tags WHERE key = ?", (key,))
+                self._conn.execute("INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                                   (key, json.dumps(value), now + ttl))
+                self._conn.executemany("INSERT OR IGNORE INTO cache_tags (tag, key) VALUES (?, ?)",
+                                       [(tag, key) for tag in tags])
+                self._writes += 1
+                if self._writes % CACHE_PURGE_INTERVAL == 0:
+                    self._purge(now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _purge(self, now: float):
+        self._conn.execute(
+            "DELETE FROM cache_entries WHERE expires_at <= ? OR key IN (SELECT key FROM cache_entries "
+            "ORDER BY expires_at DESC LIMIT -1 OFFSET ?)", (now, self.max_entries)
+        )
+        self._conn.execute("DELETE FROM cache_tags WHERE key NOT IN (SELECT key FROM cache_entries)")
+
+    def _invalidate_tags(self, tags: List[str]) -> int:
+        placeholders = ",".join("?" * len(tags))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("UPDATE cache_generation SET value = value + 1 WHERE id = 0")
+                keys = [row[0] for row in self._conn.execute(
+                    f"SELECT DISTINCT key FROM cache_tags WHERE tag IN ({placeholders})", tags)]
+                self._conn.executemany("DELETE FROM cache_entries WHERE key = ?", [(key,) for key in keys])
+                self._conn.executemany("DELETE FROM cache_tags WHERE key = ?", [(key,) for key in keys])
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(keys)
+
+    def _generation(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT value FROM cache_generation WHERE id = 0").fetchone()[0]
+
+    async def get(self, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: Any, ttl: float, tags: Tuple[str, ...]):
+        await asyncio.to_thread(self._set, key, value, ttl, tags)
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> int:
+        tags = list(tags)
+        return await asyncio.to_thread(self._invalidate_tags, tags) if tags else 0
+
+    async def generation(self) -> int:
+        """Invalidation counter shared by every process using the file"""
+        return await asyncio.to_thread(self._generation)
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def size(self) -> Optional[int]:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+
+class RedisCacheBackend:
+    """Cache entries on a Redis-protocol server, shared by every API process.
+
+    Values are stored as JSON with a TTL; each tag is a Redis set of the keys
+    carrying it. Any client exposing the redis.asyncio API can be passed in,
+    which lets a local stand-in replace a real server.
+    """
+    shared = True
+
+    def __init__(self, client, prefix: str = CACHE_KEY_PREFIX):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str = CACHE_REDIS_URL) -> "RedisCacheBackend":
+        import redis.asyncio as redis
+
+        return cls(redis.from_url(url))
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl: float, tags: Tuple[str, ...]):
+        ttl_ms = max(1, int(ttl * 1000))
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.set(self.prefix + key, json.dumps(value), px=ttl_ms)
+            for tag in tags:
+                tag_key = f"{self.prefix}tag:{tag}"
+                pipe.sadd(tag_key, self.prefix + key)
+                pipe.pexpire(tag_key, ttl_ms)
+            await pipe.execute()
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> int:
+        removed = 0
+        for tag in tags:
+            tag_key = f"{self.prefix}tag:{tag}"
+            keys = await self.client.smembers(tag_key)
+            if keys:
+                removed += await self.client.delete(*keys)
+            await self.client.delete(tag_key)
+        return removed
+
+    async def close(self):
+        await self.client.close()
+
+    def size(self) -> Optional[int]:
+        return None
+
+class ResultCache:
+    """Read-through cache in front of database lookups.
+
+    ``get_or_load`` returns the cached value for a key or calls the loader,
+    caching its result under the given tags; concurrent misses for the same
+    key share one load. None results are not cached. Backend errors are
+    logged and treated as misses, so the cache can never take reads down.
+    """
+
+    def __init__(self, backend, ttl: float = CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.invalidated = 0
+        self._hit_seconds = 0.0
+        self._miss_seconds = 0.0
+        self._loading: Dict[str, asyncio.Future] = {}
+        # Bumped on every invalidation; a load that overlapped one is not cached
+        self._generation = 0
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]], tags: Iterable[str] = ()) -> Any:
+        started = time.perf_counter()
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Result cache read failed for %s: %s", key, e)
+            value = None
+        if value is not None:
+            self.hits += 1
+            self._hit_seconds += time.perf_counter() - started
+            return value
+
+        self.misses += 1
+        loading = self._loading.get(key)
+        if loading is not None:
+            try:
+                value = await asyncio.shield(loading)
+            except asyncio.CancelledError:
+                if not loading.cancelled():
+                    raise
+                # The request that was loading the value went away (e.g. its client disconnected); load it here
+                return await self.get_or_load(key, loader, tags)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._loading[key] = future
+            try:
+                generation = await self._current_generation()
+                value = jsonable_encoder(await loader())
+                future.set_result(value)
+            except Exception as e:
+                future.set_exception(e)
+                # Waiters re-raise it; mark it retrieved so it is not reported as unhandled
+                future.exception()
+                raise
+            finally:
+                # Cancelled (or interrupted) before a result: release the waiters instead of leaving them hanging
+                if not future.done():
+                    future.cancel()
+                self._loading.pop(key, None)
+            if value is not None and generation == await self._current_generation():
+                try:
+                    await self.backend.set(key, value, self.ttl, tuple(tags))
+                except Exception as e:
+                    self.errors += 1
+                    logger.warning("Result cache write failed for %s: %s", key, e)
+        self._miss_seconds += time.perf_counter() - started
+        return value
+
+    @property
+    def shared(self) -> bool:
+        """Whether every worker process reads and invalidates the same entries"""
+        return self.backend.shared
+
+    async def _current_generation(self) -> Tuple[int, int]:
+        # A shared backend also counts invalidations made by the other processes
+        generation = getattr(self.backend, "generation", None)
+        try:
+            return self._generation, await generation() if generation is not None else 0
+        except Exception:
+            return self._generation, -1
+
+    async def invalidate(self, tags: Iterable[str]):
+        tags = list(tags)
+        if not tags:
+            return
+        self._generation += 1
+        try:
+            self.invalidated += await self.backend.invalidate_tags(tags)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Result cache invalidation failed for %s tags: %s", len(tags), e)
+
+    async def close(self):
+        await self.backend.close()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": self.backend.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "errors": self.errors,
+            "invalidated": self.invalidated,
+            "avg_hit_ms": round(self._hit_seconds / self.hits * 1000, 3) if self.hits else 0.0,
+            "avg_miss_ms": round(self._miss_seconds / self.misses * 1000, 3) if self.misses else 0.0
+        }
+
+# Global instance
+result_cache: Optional[ResultCache] = None
+
+def get_result_cache() -> ResultCache:
+    """Get or create the result cache for the configured backend"""
+    global result_cache
+    if result_cache is None:
+        if not CACHE_ENABLED:
+            # A zero-capacity LRU drops every entry right away, so each lookup loads
+            result_cache = ResultCache(MemoryCacheBackend(max_entries=0))
+        elif CACHE_BACKEND == "sqlite":
+            result_cache = ResultCache(SqliteCacheBackend())
+            logger.info("Result cache using the shared SQLite backend")
+        elif CACHE_BACKEND == "redis":
+            try:
+                result_cache = ResultCache(RedisCacheBackend.from_url())
+                logger.info("Result cache using Redis backend")
+            except ImportError:
+                logger.warning("CACHE_BACKEND=redis but the redis package is not installed; using the in-memory cache")
+                result_cache = ResultCache(MemoryCacheBackend())
+        else:
+            result_cache = ResultCache(MemoryCacheBackend())
+    return result_cache
+
+async def close_result_cache():
+    """Close the result cache backend"""
+    global result_cache
+    if result_cache is not None:
+        await result_cache.close()
+        result_cache = None
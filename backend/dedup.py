@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import BinaryIO, Optional
+from dotenv import load_dotenv
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+_basedir = os.path.abspath(os.path.dirname(__file__))
+
+# Deduplication configuration
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+DEDUP_DB_PATH = os.getenv("DEDUP_DB_PATH", os.path.join(_basedir, "uploads", "dedup.sqlite3"))
+DEDUP_TTL_SECONDS = int(os.getenv("DEDUP_TTL_SECONDS", str(30 * 24 * 3600)))
+DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", "100000"))
+# Expired and excess entries are purged once every this many writes
+DEDUP_PURGE_INTERVAL = 500
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def hash_file(file_obj: BinaryIO) -> str:
+    """Return the SHA-256 hex digest of a seekable file, reading it in chunks"""
+    digest = hashlib.sha256()
+    file_obj.seek(0)
+    for chunk in iter(lambda: file_obj.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+class DedupIndex:
+    """SQLite-backed index from resume content hash to its Drive file and analysis.
+
+    An entry is reserved with only a job id while the first copy is still being
+    processed, and completed with the Drive file info once it is uploaded.
+    Entries expire after ``ttl_seconds`` and the least recently used ones are
+    evicted beyond ``max_entries``.
+    """
+
+    def __init__(self, db_path: str = DEDUP_DB_PATH, ttl_seconds: int = DEDUP_TTL_SECONDS,
+                 max_entries: int = DEDUP_MAX_ENTRIES):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS resume_hashes (
+                content_hash TEXT PRIMARY KEY,
+                job_id TEXT,
+                filename TEXT,
+                drive_file_id TEXT,
+                drive_link TEXT,
+                size TEXT,
+                analysis TEXT,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_resume_hashes_last_used ON resume_hashes(last_used_at)")
+
+    def lookup(self, content_hash: str) -> Optional[dict]:
+        """Return the entry for a hash, counting a hit or a miss"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id, filename, drive_file_id, drive_link, size, analysis, created_at "
+                "FROM resume_hashes WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+            if row is None or now - row[6] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE resume_hashes SET last_used_at = ? WHERE content_hash = ?", (now, content_hash))
+        return {
+            "content_hash": content_hash,
+            "job_id": row[0],
+            "filename": row[1],
+            "drive_file_id": row[2],
+            "drive_link": row[3],
+            "size": row[4],
+            "analysis": json.loads(row[5]) if row[5] else None
+        }
+
+    def reserve(self, content_hash: str, job_id: str, filename: str):
+        """Claim a hash for a job that is about to upload the first copy"""
+        self._write(
+            "INSERT OR REPLACE INTO resume_hashes (content_hash, job_id, filename, created_at, last_used_at) "
+            "VALUES (?, ?, ?, ?, ?)", (content_hash, job_id, filename)
+        )
+
+    def record_upload(self, content_hash: str, drive_file_info: dict, filename: str, job_id: Optional[str] = None):
+        """Store the Drive file a hash was uploaded to"""
+        self._write(
+            "INSERT INTO resume_hashes (content_hash, job_id, filename, drive_file_id, drive_link, size, "
+            "created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(content_hash) DO UPDATE SET job_id = excluded.job_id, filename = excluded.filename, "
+            "drive_file_id = excluded.drive_file_id, drive_link = excluded.drive_link, size = excluded.size, "
+            "created_at = excluded.created_at, last_used_at = excluded.last_used_at",
+            (content_hash, job_id, filename, drive_file_info.get('file_id'),
+             drive_file_info.get('web_view_link'), drive_file_info.get('size'))
+        )
+
+    def record_analysis(self, content_hash: str, analysis: dict):
+        """Attach the analysis result for a hash so duplicates can return it directly"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE resume_hashes SET analysis = ?, last_used_at = ? WHERE content_hash = ?",
+                (json.dumps(analysis, default=str), now, content_hash)
+            )
+
+    def _write(self, sql: str, params: tuple):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(sql, params + (now, now))
+            self._writes += 1
+            if self._writes % DEDUP_PURGE_INTERVAL == 0:
+                self._purge(now)
+
+    def _purge(self, now: float):
+        expired = self._conn.execute(
+            "DELETE FROM resume_hashes WHERE created_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        excess = self._conn.execute(
+            "DELETE FROM resume_hashes WHERE content_hash IN (SELECT content_hash FROM resume_hashes "
+            "ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+        ).rowcount
+        if expired or excess:
+            logger.info("Dedup index purged %s expired and %s least recently used entries", expired, excess)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM resume_hashes").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "entries": entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+# Global instance
+dedup_index: Optional[DedupIndex] = None
+
+def get_dedup_index() -> Optional[DedupIndex]:
+    """Get or create the dedup index, or None when deduplication is disabled"""
+    global dedup_index
+    if not DEDUP_ENABLED:
+        return None
+    if dedup_index is None:
+        dedup_index = DedupIndex()
+    return dedup_index
+
+def close_dedup_index():
+    """Close the dedup index database connection"""
+    global dedup_index
+    if dedup_index is not None:
+        dedup_index.close()
+        dedup_index = None
@@ -0,0 +1,166 @@
+import os
+import time
+import contextvars
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+from dotenv import load_dotenv
+
+from metrics import gauge
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Drive worker pool configuration
+DRIVE_MAX_WORKERS = int(os.getenv('DRIVE_MAX_WORKERS', '8'))
+DRIVE_MAX_INFLIGHT_UPLOADS = int(os.getenv('DRIVE_MAX_INFLIGHT_UPLOADS', '4'))
+DRIVE_CALL_TIMEOUT = float(os.getenv('DRIVE_CALL_TIMEOUT', '120'))
+
+class DriveWorkerPool:
+    """Runs blocking Google Drive calls on a dedicated thread pool.
+
+    Uploads additionally take one of ``max_inflight_uploads`` slots, so a burst
+    of large files cannot occupy every worker. A slot is only released once the
+    worker thread has actually finished, even if the caller already timed out.
+    """
+
+    def __init__(self, max_workers: int = DRIVE_MAX_WORKERS,
+                 max_inflight_uploads: int = DRIVE_MAX_INFLIGHT_UPLOADS,
+                 timeout: float = DRIVE_CALL_TIMEOUT):
+        self.max_workers = max_workers
+        self.max_inflight_uploads = max_inflight_uploads
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='drive-worker')
+        self._upload_slots = asyncio.Semaphore(max_inflight_uploads)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._started = 0
+        self._completed = 0
+        self._failed = 0
+        self._timed_out = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    async def run(self, func: Callable, *args, timeout: Optional[float] = None, upload: bool = False, **kwargs):
+        """Run ``func(*args, **kwargs)`` on the pool and await its result.
+
+        Raises ``asyncio.TimeoutError`` if the call does not finish within
+        ``timeout`` seconds (defaults to the pool timeout), counting time spent
+        waiting for a worker or an upload slot.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        enqueued_at = time.monotonic()
+        with self._lock:
+            self._queued += 1
+        try:
+            return await asyncio.wait_for(self._submit(func, args, kwargs, enqueued_at, upload), timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._timed_out += 1
+            logger.error("Drive call %s timed out after %ss", getattr(func, '__name__', func), timeout)
+            raise
+
+    async def _submit(self, func: Callable, args: tuple, kwargs: dict, enqueued_at: float, upload: bool):
+        loop = asyncio.get_running_loop()
+        if upload:
+            try:
+                await self._upload_slots.acquire()
+            except asyncio.CancelledError:
+                # Timed out while waiting for an upload slot
+                with self._lock:
+                    self._queued -= 1
+                raise
+
+        started = threading.Event()
+
+        def call():
+            wait = time.monotonic() - enqueued_at
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._started += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+            started.set()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        def on_done(future):
+            with self._lock:
+                if not started.is_set():
+                    # Cancelled before a worker picked it up
+                    self._queued -= 1
+                elif future.cancelled() or future.exception() is not None:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+            if upload and not loop.is_closed():
+                try:
+                    loop.call_soon_threadsafe(self._upload_slots.release)
+                except RuntimeError:
+                    # The loop closed while the call was finishing (shutdown); nobody waits for the slot
+                    pass
+
+        try:
+            # Carry the caller's correlation id into the worker thread
+            future = self._executor.submit(contextvars.copy_context().run, call)
+        except Exception:
+            with self._lock:
+                self._queued -= 1
+            if upload:
+                self._upload_slots.release()
+            raise
+        future.add_done_callback(on_done)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        """Return queue depth, wait time and throughput counters"""
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_inflight_uploads': self.max_inflight_uploads,
+                'queue_depth': self._queued,
+                'running': self._running,
+                'completed': self._completed,
+                'failed': self._failed,
+                'timed_out': self._timed_out,
+                'avg_wait_seconds': round(self._total_wait / self._started, 4) if self._started else 0.0,
+                'max_wait_seconds': round(self._max_wait, 4)
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+# Global instance
+drive_pool = None
+
+def get_drive_pool() -> DriveWorkerPool:
+    """Get or create the Drive worker pool"""
+    global drive_pool
+    if drive_pool is None:
+        drive_pool = DriveWorkerPool()
+    return drive_pool
+
+def _drive_pool_samples() -> dict:
+    if drive_pool is None:
+        return {}
+    stats = drive_pool.stats()
+    return {("queued",): stats["queue_depth"], ("running",): stats["running"]}
+
+DRIVE_POOL_CALLS = gauge("drive_pool_calls", "Google Drive calls waiting for or running on the worker pool",
+                         ("state",), function=_drive_pool_samples)
+
+def shutdown_drive_pool():
+    """Shut down the Drive worker pool, waiting for running calls to finish"""
+    global drive_pool
+    if drive_pool is not None:
+        drive_pool.shutdown()
+        drive_pool = None
@@ -0,0 +1,186 @@
+import os
+import json
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncpg
+from dotenv import load_dotenv
+
+from database import DATABASE_URL
+from workers import MULTI_WORKER, worker_id
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Cross-process resume notifications; needed whenever more than one API process serves the same database
+RESUME_EVENTS_ENABLED = os.getenv("RESUME_EVENTS_ENABLED", "true" if MULTI_WORKER else "false").lower() in (
+    "1", "true", "yes")
+RESUME_EVENTS_CHANNEL = "resumes_stored"
+RESUME_EVENTS_RECONNECT_DELAY = 5.0
+# Keeps each payload well under PostgreSQL's 8000-byte NOTIFY limit
+RESUME_EVENTS_MAX_IDS = 500
+
+StoredHandler = Callable[[List[int]], Awaitable[None]]
+ReconnectHandler = Callable[[], Awaitable[None]]
+EventHandler = Callable[[dict], None]
+
+# Extra channels the listener connection subscribes to, registered before the events start
+_event_listeners: Dict[str, EventHandler] = {}
+
+def listen_for_events(channel: str, callback: EventHandler):
+    """Pass events other processes send on ``channel`` to ``callback``, from the next (re)connect on"""
+    _event_listeners[channel] = callback
+
+class ResumeEvents:
+    """Tells the other API processes which resumes this one stored.
+
+    Each process LISTENs on a dedicated connection; ``publish`` NOTIFYs the
+    ids of committed rows, and every other process passes them to ``handler``
+    so it can update its in-memory indexes and cache. Notifications a process
+    sends are ignored by itself. NOTIFY is not queued for disconnected
+    listeners, so after a reconnect ``on_reconnect`` is called to catch up.
+
+    Other cross-process events share the connection: channels registered
+    with ``listen_for_events`` are listened on too, their events (JSON
+    objects) passed to the registered callback, and ``notify`` sends one.
+    """
+
+    def __init__(self, handler: StoredHandler, on_reconnect: Optional[ReconnectHandler] = None,
+                 dsn: str = DATABASE_URL, channel: str = RESUME_EVENTS_CHANNEL):
+        self.handler = handler
+        self.on_reconnect = on_reconnect
+        self.dsn = dsn
+        self.channel = channel
+        self.connected = False
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+        self._task: Optional[asyncio.Task] = None
+        self._handlers = set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._handlers:
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+
+    async def _run(self):
+        first = True
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _connection: closed.set())
+                await connection.add_listener(self.channel, self._on_notification)
+                for channel, callback in _event_listeners.items():
+                    await connection.add_listener(channel, self._event_listener(callback))
+                self.connected = True
+                logger.info("Listening for stored resumes on channel %s", self.channel)
+                if not first and self.on_reconnect is not None:
+                    await self.on_reconnect()
+                first = False
+                await closed.wait()
+                logger.warning("Resume event connection closed; reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error("Resume event listener failed: %s", e)
+            finally:
+                self.connected = False
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(RESUME_EVENTS_RECONNECT_DELAY)
+
+    def _on_notification(self, connection, pid: int, channel: str, payload: str):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning("Ignoring malformed resume event: %s", payload)
+            return
+        if event.get("origin") == worker_id() or not event.get("ids"):
+            return
+        self.received += 1
+        task = asyncio.create_task(self._handle(event["ids"]))
+        self._handlers.add(task)
+        task.add_done_callback(self._handlers.discard)
+
+    def _event_listener(self, callback: EventHandler):
+        def on_event(connection, pid: int, channel: str, payload: str):
+            try:
+                event = json.loads(payload)
+            except ValueError:
+                logger.warning("Ignoring malformed event on %s: %s", channel, payload)
+                return
+            if event.get("origin") == worker_id():
+                return
+            self.received += 1
+            try:
+                callback(event)
+            except Exception as e:
+                self.errors += 1
+                logger.error("Could not apply event from channel %s: %s", channel, e)
+        return on_event
+
+    async def _handle(self, ids: List[int]):
+        try:
+            await self.handler(ids)
+        except Exception as e:
+            self.errors += 1
+            logger.error("Could not apply %d resumes stored by another worker: %s", len(ids), e)
+
+    async def publish(self, pool, ids: List[int]):
+        """Notify the other processes of committed resume ids"""
+        async with pool.acquire() as connection:
+            for start in range(0, len(ids), RESUME_EVENTS_MAX_IDS):
+                payload = json.dumps({"origin": worker_id(), "ids": ids[start:start + RESUME_EVENTS_MAX_IDS]},
+                                     separators=(",", ":"))
+                await connection.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+        self.published += 1
+
+    async def notify(self, pool, channel: str, event: dict):
+        """Send ``event`` to the other processes listening on ``channel``"""
+        payload = json.dumps({**event, "origin": worker_id()}, separators=(",", ":"), default=str)
+        async with pool.acquire() as connection:
+            await connection.execute("SELECT pg_notify($1, $2)", channel, payload)
+        self.published += 1
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.connected,
+            "published": self.published,
+            "received": self.received,
+            "errors": self.errors
+        }
+
+# Global instance, owned by the app startup/shutdown hooks
+resume_events: Optional[ResumeEvents] = None
+
+def start_resume_events(handler: StoredHandler, on_reconnect: Optional[ReconnectHandler] = None):
+    """Start listening for resumes stored by other processes, if enabled"""
+    global resume_events
+    if RESUME_EVENTS_ENABLED and resume_events is None:
+        resume_events = ResumeEvents(handler, on_reconnect)
+        resume_events.start()
+
+async def stop_resume_events():
+    global resume_events
+    if resume_events is not None:
+        await resume_events.stop()
+        resume_events = None
+
+def get_resume_events() -> Optional[ResumeEvents]:
+    """Get the resume event channel, or None when running as a single process"""
+    return resume_events
+
+def resume_events_stats() -> Optional[dict]:
+    return resume_events.stats() if resume_events is not None else None
@@ -0,0 +1,242 @@
+import os
+import re
+from collections import deque
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from skills import SKILLS, text_aliases
+
+load_dotenv()
+
+# Fields at or above this confidence are trusted; the rest are left to the LLM
+FIELD_CONFIDENCE_THRESHOLD = float(os.getenv("FIELD_CONFIDENCE_THRESHOLD", "0.8"))
+
+RESUME_FIELDS = ("full_name", "email", "phone", "skills", "experience_years", "last_job_title")
+
+EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+PHONE_RE = re.compile(r"(?<![\w+])(\+?\d{1,3}[\s.-]?)?(\(?\d{2,4}\)?[\s.-]?)?\d{3,4}[\s.-]?\d{3,4}(?!\w)")
+NAME_RE = re.compile(r"^[A-Z][A-Za-z'.-]+(?:\s+[A-Z][A-Za-z'.-]+){1,3}$")
+EXPLICIT_YEARS_RE = re.compile(
+    r"(\d{1,2}(?:\.\d)?)\s*\+?\s*(?:years|yrs)\.?\s+(?:of\s+)?(?:professional\s+|work\s+|industry\s+|relevant\s+)?experience",
+    re.IGNORECASE
+)
+MONTHS = {m: i for i, m in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), start=1)}
+_DATE = r"(?:(?P<{p}m>[A-Za-z]{{3}})[a-z]*\.?\s+|(?P<{p}n>\d{{1,2}})/)?(?P<{p}y>(?:19|20)\d{{2}})"
+DATE_RANGE_RE = re.compile(
+    _DATE.format(p="s") + r"\s*(?:-|–|—|to)\s*(?:" + _DATE.format(p="e") + r"|(?P<present>present|current|now))",
+    re.IGNORECASE
+)
+TITLE_WORDS_RE = re.compile(
+    r"\b(engineer|developer|programmer|manager|analyst|designer|scientist|consultant|architect|lead|"
+    r"director|specialist|administrator|intern|officer|coordinator|head|vp|president|founder|devops|sre)\b",
+    re.IGNORECASE
+)
+EXPERIENCE_HEADING_RE = re.compile(
+    r"^(?:(?:work|professional)\s+)?(?:experience|employment(?:\s+history)?)\s*:?$", re.IGNORECASE
+)
+TITLE_SEPARATOR_RE = re.compile(r"\s+(?:-|–|—|\||@|at)\s+|,")
+NON_NAME_WORDS = {"resume", "curriculum", "vitae", "cv", "profile", "summary", "contact", "experience",
+                  "education", "skills", "objective"}
+
+class SkillMatcher:
+    """Aho-Corasick automaton that finds every dictionary skill in one pass over the text.
+
+    Patterns are matched case-insensitively and only on word boundaries; when
+    matches overlap (e.g. "React" inside "React Native") the longest one wins.
+    ``aliases`` maps alternative spellings to the skill reported for them.
+    """
+
+    def __init__(self, skills: Iterable[str], aliases: Optional[Dict[str, str]] = None):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[int, str]]] = [[]]
+        for skill in skills:
+            self._add(skill.lower(), skill)
+        for alias, skill in (aliases or {}).items():
+            self._add(alias.lower(), skill)
+        self._build()
+
+    def _add(self, pattern: str, skill: str):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((len(pattern), skill))
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def _scan(self, text: str) -> List[str]:
+        """Skills of every non-overlapping match, in order"""
+        lowered = text.lower()
+        matches = []
+        state = 0
+        for end, char in enumerate(lowered, start=1):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for length, skill in self._output[state]:
+                start = end - length
+                if (start == 0 or not lowered[start - 1].isalnum()) and (end == len(lowered) or not lowered[end].isalnum()):
+                    matches.append((start, end, skill))
+
+        # Keep the longest of overlapping matches
+        matches.sort(key=lambda m: (m[0], -(m[1] - m[0])))
+        found = []
+        covered_until = -1
+        for start, end, skill in matches:
+            if start < covered_until:
+                continue
+            covered_until = end
+            found.append(skill)
+        return found
+
+    def find(self, text: str) -> List[str]:
+        """Return matched skills in order of first appearance"""
+        return list(dict.fromkeys(self._scan(text)))
+
+    def count(self, text: str) -> Dict[str, int]:
+        """Return how often each skill is mentioned"""
+        counts: Dict[str, int] = {}
+        for skill in self._scan(text):
+            counts[skill] = counts.get(skill, 0) + 1
+        return counts
+
+skill_matcher = SkillMatcher(SKILLS, text_aliases())
+
+def _field(value, confidence: float) -> dict:
+    return {"value": value, "confidence": round(confidence, 2)}
+
+def _extract_email(text: str) -> dict:
+    emails = list(dict.fromkeys(m.lower() for m in EMAIL_RE.findall(text)))
+    if not emails:
+        return _field(None, 0.0)
+    return _field(emails[0], 0.99 if len(emails) == 1 else 0.85)
+
+def _extract_phone(text: str) -> dict:
+    phones = []
+    for match in PHONE_RE.finditer(text):
+        candidate = match.group(0).strip()
+        digits = re.sub(r"\D", "", candidate)
+        # Skip things that look like years or date ranges
+        if 7 <= len(digits) <= 15 and not DATE_RANGE_RE.search(candidate):
+            phones.append(candidate)
+    phones = list(dict.fromkeys(phones))
+    if not phones:
+        return _field(None, 0.0)
+    return _field(phones[0], 0.95 if len(phones) == 1 else 0.8)
+
+def _extract_name(lines: List[str]) -> dict:
+    for position, line in enumerate(lines[:5]):
+        words = line.lower().split()
+        if NAME_RE.match(line) and not NON_NAME_WORDS.intersection(words) and not TITLE_WORDS_RE.search(line):
+            return _field(line, 0.85 if position == 0 else 0.7)
+    return _field(None, 0.0)
+
+def _extract_skills(text: str) -> dict:
+    skills = skill_matcher.find(text)
+    if len(skills) >= 5:
+        confidence = 0.9
+    elif len(skills) >= 3:
+        confidence = 0.8
+    elif skills:
+        confidence = 0.6
+    else:
+        confidence = 0.0
+    return _field(skills, confidence)
+
+def _month_index(month: Optional[str], number: Optional[str], year: str) -> int:
+    if month:
+        month_number = MONTHS.get(month[:3].lower(), 1)
+    elif number:
+        month_number = min(max(int(number), 1), 12)
+    else:
+        month_number = 1
+    return int(year) * 12 + month_number - 1
+
+def _extract_experience_years(text: str, today: Optional[date] = None) -> dict:
+    explicit = [float(m) for m in EXPLICIT_YEARS_RE.findall(text)]
+    if explicit:
+        return _field(max(explicit), 0.9)
+
+    today = today or date.today()
+    now = today.year * 12 + today.month - 1
+    spans = []
+    for match in DATE_RANGE_RE.finditer(text):
+        start = _month_index(match.group("sm"), match.group("sn"), match.group("sy"))
+        if match.group("present"):
+            end = now
+        else:
+            end = _month_index(match.group("em"), match.group("en"), match.group("ey"))
+        if start <= end <= now:
+            spans.append((start, end))
+    if not spans:
+        return _field(None, 0.0)
+
+    # Merge overlapping positions so concurrent jobs are not double counted
+    spans.sort()
+    months = 0
+    current_start, current_end = spans[0]
+    for start, end in spans[1:]:
+        if start <= current_end:
+            current_end = max(current_end, end)
+        else:
+            months += current_end - current_start
+            current_start, current_end = start, end
+    months += current_end - current_start
+    return _field(round(months / 12, 1), 0.7)
+
+def _extract_last_job_title(lines: List[str]) -> dict:
+    in_experience = False
+    fallback = None
+    for line in lines:
+        if EXPERIENCE_HEADING_RE.match(line):
+            in_experience = True
+            continue
+        # Drop trailing company / date parts such as "Senior Engineer - Acme, 2019 - Present"
+        title = TITLE_SEPARATOR_RE.split(line)[0].strip()
+        if len(title.split()) > 6 or "@" in title or not TITLE_WORDS_RE.search(title):
+            continue
+        if in_experience:
+            return _field(title, 0.75)
+        if fallback is None:
+            fallback = title
+    return _field(fallback, 0.5) if fallback else _field(None, 0.0)
+
+def extract_fields(text: str) -> Dict[str, dict]:
+    """Extract the resumes table fields from resume text.
+
+    Returns ``{field: {"value": ..., "confidence": 0.0-1.0}}`` for every
+    field in RESUME_FIELDS.
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    return {
+        "full_name": _extract_name(lines),
+        "email": _extract_email(text),
+        "phone": _extract_phone(text),
+        "skills": _extract_skills(text),
+        "experience_years": _extract_experience_years(text),
+        "last_job_title": _extract_last_job_title(lines)
+    }
+
+def split_by_confidence(fields: Dict[str, dict], threshold: float = FIELD_CONFIDENCE_THRESHOLD) -> Tuple[dict, list]:
+    """Split extracted fields into trusted local values and the names left for the LLM"""
+    local = {name: field["value"] for name, field in fields.items() if field["confidence"] >= threshold}
+    return local, [name for name in RESUME_FIELDS if name not in local]
@@ -2,15 +2,16 @@ import os
 import io
 import json
 import logging
-from typing import Optional
-from google.oauth2 import service_account
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
+import threading
+from typing import TYPE_CHECKING, BinaryIO, Optional
 from dotenv import load_dotenv
 
+from drive_pool import get_drive_pool
+from metrics import UPLOAD_STAGE_SECONDS, timed
+
+if TYPE_CHECKING:
+    import google_auth_httplib2
+
 # Set up logging
 logger = logging.getLogger(__name__)
 
@@ -24,14 +25,56 @@ SCOPES = ['https://www.googleapis.com/auth/drive.file']
 CREDENTIALS_FILE = os.path.join(_basedir, 'credentials.json')
 FOLDER_ID = os.getenv('GOOGLE_DRIVE_FOLDER_ID', '')
 
+# Streaming upload configuration. Drive requires every resumable chunk except
+# the last one to be a multiple of 256 KiB.
+DRIVE_CHUNK_ALIGNMENT = 256 * 1024
+DRIVE_UPLOAD_CHUNK_SIZE = int(os.getenv('DRIVE_UPLOAD_CHUNK_SIZE', str(2 * 1024 * 1024)))
+# Upper bound on the bytes a single upload may hold in memory at once.
+DRIVE_UPLOAD_MAX_MEMORY = int(os.getenv('DRIVE_UPLOAD_MAX_MEMORY', str(8 * 1024 * 1024)))
+DRIVE_UPLOAD_NUM_RETRIES = int(os.getenv('DRIVE_UPLOAD_NUM_RETRIES', '3'))
+# Point the client at a local fake Drive server (e.g. http://localhost:9000/) for testing.
+DRIVE_API_ENDPOINT = os.getenv('DRIVE_API_ENDPOINT', '')
+# Drive v3 discovery document to build the client from. Unset, the copy bundled with
+# google-api-python-client is used; the client never fetches it over the network.
+DRIVE_DISCOVERY_DOCUMENT = os.getenv('DRIVE_DISCOVERY_DOCUMENT', '')
+
+def resolve_chunk_size(chunk_size: Optional[int] = None) -> int:
+    """Clamp a requested chunk size to the memory limit and Drive's 256 KiB alignment."""
+    size = min(chunk_size or DRIVE_UPLOAD_CHUNK_SIZE, DRIVE_UPLOAD_MAX_MEMORY)
+    return max(DRIVE_CHUNK_ALIGNMENT, size - size % DRIVE_CHUNK_ALIGNMENT)
+
+def _build_client(credentials):
+    """Build the Drive v3 client from a local discovery document"""
+    from googleapiclient.discovery import build, build_from_document
+
+    client_options = {'api_endpoint': DRIVE_API_ENDPOINT} if DRIVE_API_ENDPOINT else None
+    if DRIVE_DISCOVERY_DOCUMENT:
+        with open(DRIVE_DISCOVERY_DOCUMENT) as f:
+            return build_from_document(f.read(), credentials=credentials, client_options=client_options)
+    return build('drive', 'v3', credentials=credentials, client_options=client_options, static_discovery=True,
+                 cache_discovery=False)
+
 class GoogleDriveService:
+    """Google Drive client.
+
+    The Google client libraries are imported on first use rather than with
+    this module, which keeps them off the API's import path; they load when
+    the service is first created, at startup or in the background warm-up.
+    """
+
     def __init__(self):
         self.service = None
         self.folder_id = FOLDER_ID
+        self._credentials = None
+        # httplib2 connections are not thread-safe, so each Drive worker thread gets its own
+        self._local = threading.local()
         self._authenticate()
     
     def _authenticate(self):
         """Authenticates the service with Google Drive using a service account."""
+        from google.oauth2 import service_account
+        from google.auth.credentials import AnonymousCredentials
+
         creds = None
         
         # Method 1: Look for credentials.json (must be a service account key)
@@ -42,8 +85,8 @@ class GoogleDriveService:
                 )
                 logger.info("Successfully authenticated using credentials.json (service account).")
             except Exception as e:
-                logger.error(f"Failed to load service account from credentials.json: {e}. "
-                             "Ensure it is a valid service account key file.")
+                logger.error("Failed to load service account from credentials.json: %s. "
+                             "Ensure it is a valid service account key file.", e)
         
         # Method 2: Fallback to environment variable
         if not creds:
@@ -56,43 +99,79 @@ class GoogleDriveService:
                     )
                     logger.info("Successfully authenticated using GOOGLE_SERVICE_ACCOUNT_KEY env var.")
                 except Exception as e:
-                    logger.error(f"Failed to load service account from environment variable: {e}")
+                    logger.error("Failed to load service account from environment variable: %s", e)
             else:
                 logger.info("Neither credentials.json nor GOOGLE_SERVICE_ACCOUNT_KEY were found or valid.")
 
+        # Method 3: A local fake Drive endpoint does not need real credentials
+        if not creds and DRIVE_API_ENDPOINT:
+            creds = AnonymousCredentials()
+            logger.info("Using anonymous credentials for Drive endpoint %s.", DRIVE_API_ENDPOINT)
+
         if not creds:
             raise Exception("Failed to authenticate with Google Drive. "
                             "Please provide a valid service account via credentials.json or "
                             "the GOOGLE_SERVICE_ACCOUNT_KEY environment variable.")
         
+        self._credentials = creds
         try:
-            self.service = build('drive', 'v3', credentials=creds)
+            self.service = _build_client(creds)
             logger.info("Google Drive service client built successfully.")
         except Exception as e:
-            logger.error(f"Error building Google Drive service client: {e}")
+            logger.error("Error building Google Drive service client: %s", e)
             raise Exception("Failed to build Google Drive service client.")
     
+    def _http(self) -> 'google_auth_httplib2.AuthorizedHttp':
+        """Return an authorized HTTP connection owned by the calling thread"""
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            import google_auth_httplib2
+            import httplib2
+
+            http = google_auth_httplib2.AuthorizedHttp(self._credentials, http=httplib2.Http())
+            self._local.http = http
+        return http
+    
     def upload_file(self, file_content: bytes, filename: str, mime_type: str = 'application/pdf') -> dict:
-        """Upload file to Google Drive and return file info"""
+        """Upload in-memory file content to Google Drive and return file info"""
+        return self.upload_stream(io.BytesIO(file_content), filename, mime_type)
+
+    def upload_stream(self, file_obj: BinaryIO, filename: str, mime_type: str = 'application/pdf',
+                      chunk_size: Optional[int] = None) -> dict:
+        """Stream a seekable file object to Google Drive through a resumable upload session.
+
+        The file is read and sent one chunk at a time, so at most ``chunk_size``
+        bytes of it are held in memory regardless of the file size.
+        """
         if not self.service:
             raise Exception("Google Drive service is not available.")
+        from googleapiclient.http import MediaIoBaseUpload
+
         try:
-            logger.info(f"Uploading file to Google Drive: {filename}")
+            chunk_size = resolve_chunk_size(chunk_size)
+            logger.info("Uploading file to Google Drive: %s (chunk size: %d bytes)", filename, chunk_size)
             
             file_metadata = {
                 'name': filename,
                 'parents': [self.folder_id] if self.folder_id else []
             }
             
-            media = MediaIoBaseUpload(io.BytesIO(file_content), mimetype=mime_type, resumable=True)
+            file_obj.seek(0)
+            media = MediaIoBaseUpload(file_obj, mimetype=mime_type, chunksize=chunk_size, resumable=True)
             
-            file = self.service.files().create(
+            request = self.service.files().create(
                 body=file_metadata,
                 media_body=media,
                 fields='id,name,webViewLink,webContentLink,size'
-            ).execute()
+            )
+            file = None
+            while file is None:
+                progress, file = request.next_chunk(http=self._http(), num_retries=DRIVE_UPLOAD_NUM_RETRIES)
+                if progress:
+                    logger.debug("Uploaded %d/%d bytes of %s", progress.resumable_progress, progress.total_size, filename)
             
-            logger.info(f"File uploaded successfully to Google Drive: {file.get('name')} (ID: {file.get('id')})")
+            logger.info("File uploaded successfully to Google Drive: %s (ID: %s)", file.get('name'), file.get('id'),
+                        extra={"drive_file_id": file.get('id')})
             
             return {
                 'file_id': file.get('id'),
@@ -103,17 +182,17 @@ class GoogleDriveService:
                 'drive_url': f"https://drive.google.com/file/d/{file.get('id')}/view"
             }
         except Exception as e:
-            logger.error(f"Error uploading file to Google Drive: {e}")
+            logger.error("Error uploading file to Google Drive: %s", e)
             raise Exception(f"Failed to upload file to Google Drive: {str(e)}")
     
     def delete_file(self, file_id: str) -> bool:
         """Delete file from Google Drive"""
         try:
-            self.service.files().delete(fileId=file_id).execute()
-            logger.info(f"File deleted from Google Drive: {file_id}")
+            self.service.files().delete(fileId=file_id).execute(http=self._http())
+            logger.info("File deleted from Google Drive: %s", file_id)
             return True
         except Exception as e:
-            logger.error(f"Error deleting file from Google Drive: {e}")
+            logger.error("Error deleting file from Google Drive: %s", e)
             return False
     
     def get_file_info(self, file_id: str) -> Optional[dict]:
@@ -122,7 +201,7 @@ class GoogleDriveService:
             file = self.service.files().get(
                 fileId=file_id,
                 fields='id,name,webViewLink,webContentLink,size,createdTime,modifiedTime'
-            ).execute()
+            ).execute(http=self._http())
             
             return {
                 'file_id': file.get('id'),
@@ -134,15 +213,53 @@ class GoogleDriveService:
                 'modified_time': file.get('modifiedTime')
             }
         except Exception as e:
-            logger.error(f"Error getting file info from Google Drive: {e}")
+            logger.error("Error getting file info from Google Drive: %s", e)
             return None
+    
+    # Async variants run the blocking calls above on the Drive worker pool so
+    # they never stall the event loop.
+    
+    @timed(UPLOAD_STAGE_SECONDS, "drive_upload")
+    async def upload_stream_async(self, file_obj: BinaryIO, filename: str, mime_type: str = 'application/pdf',
+                                  chunk_size: Optional[int] = None, timeout: Optional[float] = None) -> dict:
+        return await get_drive_pool().run(self.upload_stream, file_obj, filename, mime_type, chunk_size,
+                                          timeout=timeout, upload=True)
+    
+    async def delete_file_async(self, file_id: str, timeout: Optional[float] = None) -> bool:
+        return await get_drive_pool().run(self.delete_file, file_id, timeout=timeout)
+    
+    async def get_file_info_async(self, file_id: str, timeout: Optional[float] = None) -> Optional[dict]:
+        return await get_drive_pool().run(self.get_file_info, file_id, timeout=timeout)
 
-# Global instance
+# Global instance, one per worker process
 drive_service = None
+_drive_service_pid = None
+_drive_service_lock = threading.Lock()
 
 def get_drive_service() -> GoogleDriveService:
-    """Get or create Google Drive service instance"""
-    global drive_service
-    if drive_service is None:
-        drive_service = GoogleDriveService()
-    return drive_service 
\ No newline at end of file
+    """Get or create this process's Google Drive service instance.
+
+    Created once under a lock, so Drive worker threads racing on first use
+    share one client; a client inherited through a fork is not reused, since
+    its connections belong to the parent.
+    """
+    global drive_service, _drive_service_pid
+    if drive_service is None or _drive_service_pid not in (None, os.getpid()):
+        with _drive_service_lock:
+            if drive_service is None or _drive_service_pid not in (None, os.getpid()):
+                drive_service = GoogleDriveService()
+                _drive_service_pid = os.getpid()
+    return drive_service
+
+def close_drive_service():
+    """Drop this process's Drive client and close its connections"""
+    global drive_service, _drive_service_pid
+    with _drive_service_lock:
+        client = getattr(drive_service, "service", None)
+        if client is not None:
+            try:
+                client.close()
+            except Exception as e:
+                logger.warning("Error closing Google Drive service client: %s", e)
+        drive_service = None
+        _drive_service_pid = None
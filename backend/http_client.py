@@ -0,0 +1,119 @@
+import os
+import asyncio
+import logging
+from typing import Dict, Optional
+import httpx
+from dotenv import load_dotenv
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Outbound HTTP configuration for n8n webhook dispatch
+N8N_WEBHOOK_TIMEOUT = float(os.getenv("N8N_WEBHOOK_TIMEOUT", "30"))
+N8N_HTTP_MAX_CONNECTIONS = int(os.getenv("N8N_HTTP_MAX_CONNECTIONS", "100"))
+N8N_HTTP_MAX_KEEPALIVE = int(os.getenv("N8N_HTTP_MAX_KEEPALIVE", "20"))
+N8N_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("N8N_HTTP_KEEPALIVE_EXPIRY", "30"))
+N8N_HTTP_MAX_PER_HOST = int(os.getenv("N8N_HTTP_MAX_PER_HOST", "20"))
+N8N_HTTP2 = os.getenv("N8N_HTTP2", "false").lower() in ("1", "true", "yes")
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body wrapper that frees a per-host slot once the body is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, semaphore: asyncio.Semaphore):
+        self._stream = stream
+        self._semaphore = semaphore
+        self._released = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._semaphore.release()
+
+class HostLimitedTransport(httpx.AsyncBaseTransport):
+    """Caps concurrent requests per host on top of the pool-wide httpx limits."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, max_per_host: int):
+        self._transport = transport
+        self._max_per_host = max_per_host
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key = f"{request.url.scheme}://{request.url.host}:{request.url.port}"
+        semaphore = self._semaphores.get(key)
+        if semaphore is None:
+            semaphore = self._semaphores[key] = asyncio.Semaphore(self._max_per_host)
+        await semaphore.acquire()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            semaphore.release()
+            raise
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReleasingStream(response.stream, semaphore),
+            extensions=response.extensions
+        )
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def create_http_client() -> httpx.AsyncClient:
+    """Build a pooled AsyncClient configured from the N8N_HTTP_* settings."""
+    http2 = N8N_HTTP2
+    if http2 and not _http2_available():
+        logger.warning("N8N_HTTP2 is enabled but the 'h2' package is not installed; falling back to HTTP/1.1")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=N8N_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=N8N_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=N8N_HTTP_KEEPALIVE_EXPIRY
+    )
+    transport = HostLimitedTransport(
+        httpx.AsyncHTTPTransport(limits=limits, http2=http2),
+        max_per_host=N8N_HTTP_MAX_PER_HOST
+    )
+    return httpx.AsyncClient(transport=transport, timeout=N8N_WEBHOOK_TIMEOUT)
+
+# Global instance, owned by the app startup/shutdown hooks
+http_client: Optional[httpx.AsyncClient] = None
+
+async def start_http_client() -> httpx.AsyncClient:
+    """Create the shared outbound HTTP client"""
+    global http_client
+    if http_client is None:
+        http_client = create_http_client()
+        logger.info("Shared HTTP client started.")
+    return http_client
+
+async def close_http_client():
+    """Close the shared HTTP client and its connection pool"""
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+        logger.info("Shared HTTP client closed.")
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get the shared HTTP client, creating it if the app hooks have not run (e.g. in scripts)"""
+    global http_client
+    if http_client is None:
+        http_client = create_http_client()
+    return http_client
@@ -0,0 +1,399 @@
+import os
+import re
+import time
+import uuid
+import random
+import hashlib
+import asyncio
+import logging
+from datetime import datetime
+from typing import Awaitable, BinaryIO, Callable, Dict, Optional, Tuple
+from pydantic import BaseModel
+from dotenv import load_dotenv
+
+from metrics import UPLOAD_STAGE_SECONDS, gauge, timed
+from log_config import correlation_id
+from workers import MULTI_WORKER, worker_id, worker_registry
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+_basedir = os.path.abspath(os.path.dirname(__file__))
+
+# Job queue configuration
+STAGING_DIR = os.getenv("UPLOAD_STAGING_DIR", os.path.join(_basedir, "uploads", "staging"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_MAX_SIZE = int(os.getenv("JOB_QUEUE_MAX_SIZE", "1000"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", "2"))
+JOB_RETRY_MAX_DELAY = float(os.getenv("JOB_RETRY_MAX_DELAY", "300"))
+# How often a worker process looks for jobs left behind by a sibling that exited; 0 only checks on startup
+JOB_RECOVERY_INTERVAL = float(os.getenv("JOB_RECOVERY_INTERVAL", "30" if MULTI_WORKER else "0"))
+# Staged files without a job record are removed once this old (another process may still be enqueuing them)
+JOB_ORPHAN_FILE_AGE = 3600
+# Records of completed and failed jobs are kept this long for /jobs/{job_id}, then deleted
+JOB_RECORD_RETENTION = float(os.getenv("JOB_RECORD_RETENTION", str(7 * 24 * 3600)))
+# How often finished job records are expired when no recovery pass does it
+JOB_CLEANUP_INTERVAL = 3600
+
+STAGING_CHUNK_SIZE = 1024 * 1024
+
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+PENDING_STATUSES = {"queued", "processing", "retrying"}
+
+class Job(BaseModel):
+    job_id: str
+    filename: str
+    content_type: Optional[str] = None
+    size: int = 0
+    content_hash: Optional[str] = None
+    page_count: Optional[int] = None
+    status: str = "queued"
+    attempts: int = 0
+    created_at: datetime
+    updated_at: datetime
+    # Stored file; the drive_* names predate the other storage backends
+    drive_file_id: Optional[str] = None
+    drive_link: Optional[str] = None
+    storage_backend: Optional[str] = None
+    webhook_status: Optional[dict] = None
+    error: Optional[str] = None
+    # Correlation id of the request that submitted the job
+    correlation_id: Optional[str] = None
+    # Worker process processing the job
+    owner: Optional[str] = None
+
+class QueueFullError(Exception):
+    pass
+
+JobHandler = Callable[[Job, str], Awaitable[None]]
+StatusHandler = Callable[[Job], Awaitable[None]]
+
+class JobQueue:
+    """Durable upload job queue processed by a pool of asyncio worker tasks.
+
+    Every accepted upload is written to the staging directory as ``<job_id>.pdf``
+    together with a ``<job_id>.json`` status record, so pending jobs survive a
+    restart and are re-enqueued on startup. The handler receives the job and the
+    path of its staged file; raising from it schedules a retry with exponential
+    backoff until ``max_attempts`` is reached. ``on_status``, if given, is
+    awaited with the job after each status change has been persisted.
+
+    Several worker processes can share one staging directory: each job record
+    names the worker that owns it, and a worker only recovers jobs whose owner
+    is no longer running (see ``workers.worker_registry``), on startup and then
+    every ``recovery_interval`` seconds. Staged files are deleted once a job
+    completes or finally fails; its record is kept for JOB_RECORD_RETENTION.
+    """
+
+    def __init__(self, handler: JobHandler, staging_dir: str = STAGING_DIR, workers: int = JOB_WORKERS,
+                 max_queue_size: int = JOB_QUEUE_MAX_SIZE, max_attempts: int = JOB_MAX_ATTEMPTS,
+                 recovery_interval: float = JOB_RECOVERY_INTERVAL, on_status: Optional[StatusHandler] = None):
+        self.handler = handler
+        self.on_status = on_status
+        self.staging_dir = staging_dir
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self.max_attempts = max_attempts
+        self.recovery_interval = recovery_interval
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._jobs: Dict[str, Job] = {}
+        self._tasks = []
+        self._retry_handles = set()
+        self._completed = 0
+        self._failed = 0
+        self._recovered = 0
+
+    def _file_path(self, job_id: str) -> str:
+        return os.path.join(self.staging_dir, f"{job_id}.pdf")
+
+    def _record_path(self, job_id: str) -> str:
+        return os.path.join(self.staging_dir, f"{job_id}.json")
+
+    def _save(self, job: Job):
+        """Atomically persist the job record next to its staged file"""
+        job.updated_at = datetime.utcnow()
+        tmp_path = self._record_path(job.job_id) + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(job.json())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._record_path(job.job_id))
+
+    async def _update(self, job: Job):
+        """Persist a status change and report it to ``on_status``"""
+        await asyncio.to_thread(self._save, job)
+        if self.on_status is not None:
+            try:
+                await self.on_status(job)
+            except Exception as e:
+                logger.error("Status listener failed for job %s: %s", job.job_id, e, extra={"job_id": job.job_id})
+
+    def _write_staged_file(self, job_id: str, source: BinaryIO) -> Tuple[int, str]:
+        """Copy the upload into staging, hashing it on the way; returns (size, sha256)"""
+        tmp_path = self._file_path(job_id) + ".tmp"
+        digest = hashlib.sha256()
+        size = 0
+        source.seek(0)
+        with open(tmp_path, "wb") as f:
+            for chunk in iter(lambda: source.read(STAGING_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._file_path(job_id))
+        return size, digest.hexdigest()
+
+    async def start(self):
+        """Create the staging directory, recover orphaned pending jobs and start the workers"""
+        os.makedirs(self.staging_dir, exist_ok=True)
+        await self._recover(startup=True)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._recovery_loop()))
+        logger.info("Job queue started with %s workers.", self.workers)
+
+    async def _recover(self, startup: bool = False):
+        recovered = await asyncio.to_thread(self._adopt_orphans, startup)
+        for job in recovered:
+            self._jobs[job.job_id] = job
+            self._queue.put_nowait(job.job_id)
+        if recovered:
+            self._recovered += len(recovered)
+            logger.info("Recovered %s pending upload jobs from %s", len(recovered), self.staging_dir)
+
+    async def _recovery_loop(self):
+        # Without recovery the pass still runs now and then to expire finished job records
+        interval = self.recovery_interval if self.recovery_interval > 0 else JOB_CLEANUP_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if self.recovery_interval > 0:
+                    await self._recover()
+                else:
+                    await asyncio.to_thread(self._expire_records)
+            except Exception as e:
+                logger.error("Upload job recovery failed: %s", e)
+
+    def _expire_records(self, names: Optional[set] = None, now: Optional[float] = None) -> set:
+        """Delete finished job records past JOB_RECORD_RETENTION; returns the names left in staging"""
+        names = set(os.listdir(self.staging_dir)) if names is None else names
+        now = time.time() if now is None else now
+        expired = 0
+        for name in list(names):
+            # A record without a staged file belongs to a completed or failed job
+            if not name.endswith(".json") or name[:-5] + ".pdf" in names:
+                continue
+            path = os.path.join(self.staging_dir, name)
+            try:
+                if now - os.path.getmtime(path) > JOB_RECORD_RETENTION:
+                    os.remove(path)
+                    names.discard(name)
+                    expired += 1
+            except OSError:
+                pass
+        if expired:
+            logger.info("Expired %d finished upload job records", expired)
+        return names
+
+    def _adopt_orphans(self, startup: bool = False) -> list:
+        """Take over pending jobs whose owning worker is gone, recording this worker as their owner"""
+        pending = []
+        now = time.time()
+        names = self._expire_records(now=now)
+        with worker_registry() as live:
+            for name in names:
+                if name.endswith(".pdf") and name[:-4] + ".json" not in names:
+                    # Staged but never enqueued (duplicate or crash before enqueue)
+                    path = os.path.join(self.staging_dir, name)
+                    try:
+                        if (startup and not MULTI_WORKER) or now - os.path.getmtime(path) > JOB_ORPHAN_FILE_AGE:
+                            os.remove(path)
+                    except OSError:
+                        pass
+                    continue
+                # Only records with a staged file can still be pending
+                if not name.endswith(".json") or name[:-5] + ".pdf" not in names or name[:-5] in self._jobs:
+                    continue
+                try:
+                    job = Job.parse_file(os.path.join(self.staging_dir, name))
+                except Exception as e:
+                    logger.error("Skipping unreadable job record %s: %s", name, e)
+                    continue
+                if job.status in PENDING_STATUSES and job.owner not in live:
+                    job.status = "queued"
+                    job.owner = worker_id()
+                    self._save(job)
+                    pending.append(job)
+        return pending
+
+    async def stop(self):
+        """Stop the workers; unfinished jobs stay staged and are recovered on next start"""
+        for handle in self._retry_handles:
+            handle.cancel()
+        self._retry_handles.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @timed(UPLOAD_STAGE_SECONDS, "stage_file")
+    async def stage(self, source: BinaryIO, filename: str, content_type: Optional[str] = None) -> Job:
+        """Durably copy an upload into staging, computing its SHA-256 as it streams.
+
+        The job is not queued yet; follow up with ``enqueue`` or ``discard``.
+        """
+        if len(self._jobs) >= self.max_queue_size:
+            raise QueueFullError(f"Upload queue is full ({self.max_queue_size} pending jobs)")
+
+        now = datetime.utcnow()
+        job = Job(job_id=uuid.uuid4().hex, filename=filename, content_type=content_type,
+                  created_at=now, updated_at=now, correlation_id=correlation_id.get(), owner=worker_id())
+        job.size, job.content_hash = await asyncio.to_thread(self._write_staged_file, job.job_id, source)
+        return job
+
+    async def enqueue(self, job: Job):
+        """Persist the record of a staged job and queue it for processing"""
+        await self._update(job)
+        self._jobs[job.job_id] = job
+        self._queue.put_nowait(job.job_id)
+        logger.info("Queued upload job %s for %s (%d bytes)", job.job_id, job.filename, job.size,
+                    extra={"job_id": job.job_id})
+
+    def staged_path(self, job: Job) -> str:
+        """Path of a job's staged file"""
+        return self._file_path(job.job_id)
+
+    async def discard(self, job: Job):
+        """Remove the staged file of a job that will not be processed"""
+        await asyncio.to_thread(self._remove_staged_file, job.job_id)
+
+    def _remove_staged_file(self, job_id: str):
+        try:
+            os.remove(self._file_path(job_id))
+        except OSError:
+            pass
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Look up a job by id, falling back to its on-disk record"""
+        if not JOB_ID_PATTERN.match(job_id):
+            return None
+        job = self._jobs.get(job_id)
+        if job is None and os.path.exists(self._record_path(job_id)):
+            job = Job.parse_file(self._record_path(job_id))
+        return job
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize(),
+            "pending": len(self._jobs),
+            "scheduled_retries": len(self._retry_handles),
+            "completed": self._completed,
+            "failed": self._failed,
+            "recovered": self._recovered
+        }
+
+    async def _worker(self, index: int):
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs[job_id]
+            # Log records written while processing carry the id of the request that submitted the job
+            token = correlation_id.set(job.correlation_id or job_id)
+            try:
+                await self._process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Job worker %d crashed on job %s: %s", index, job_id, e, extra={"job_id": job_id})
+            finally:
+                correlation_id.reset(token)
+                self._queue.task_done()
+
+    async def _process(self, job: Job):
+        job.status = "processing"
+        job.attempts += 1
+        await self._update(job)
+        try:
+            await self.handler(job, self._file_path(job.job_id))
+        except Exception as e:
+            job.error = str(e)
+            if job.attempts >= self.max_attempts:
+                job.status = "failed"
+                self._failed += 1
+                self._jobs.pop(job.job_id, None)
+                logger.error("Job %s failed after %d attempts: %s", job.job_id, job.attempts, e,
+                             extra={"job_id": job.job_id})
+                await self._update(job)
+                # Nothing will retry the job, so its staged bytes only take up space
+                await asyncio.to_thread(self._remove_staged_file, job.job_id)
+                return
+            else:
+                job.status = "retrying"
+                delay = self._backoff(job.attempts)
+                logger.warning("Job %s attempt %d failed: %s; retrying in %.1fs", job.job_id, job.attempts, e, delay,
+                               extra={"job_id": job.job_id})
+                self._schedule_retry(job.job_id, delay)
+            await self._update(job)
+            return
+
+        job.status = "completed"
+        job.error = None
+        await self._update(job)
+        self._completed += 1
+        # Finished jobs are served from their on-disk record from now on
+        self._jobs.pop(job.job_id, None)
+        # The staged bytes are no longer needed once Drive has them
+        await asyncio.to_thread(self._remove_staged_file, job.job_id)
+        logger.info("Job %s completed", job.job_id, extra={"job_id": job.job_id})
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(JOB_RETRY_MAX_DELAY, JOB_RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+
+    def _schedule_retry(self, job_id: str, delay: float):
+        loop = asyncio.get_running_loop()
+
+        def requeue():
+            self._retry_handles.discard(handle)
+            self._queue.put_nowait(job_id)
+
+        handle = loop.call_later(delay, requeue)
+        self._retry_handles.add(handle)
+
+# Global instance, owned by the app startup/shutdown hooks
+job_queue: Optional[JobQueue] = None
+
+async def start_job_queue(handler: JobHandler, on_status: Optional[StatusHandler] = None) -> JobQueue:
+    """Create and start the upload job queue"""
+    global job_queue
+    if job_queue is None:
+        job_queue = JobQueue(handler, on_status=on_status)
+        await job_queue.start()
+    return job_queue
+
+async def stop_job_queue():
+    """Stop the upload job queue workers"""
+    global job_queue
+    if job_queue is not None:
+        await job_queue.stop()
+        job_queue = None
+
+def get_job_queue() -> JobQueue:
+    """Get the running upload job queue"""
+    if job_queue is None:
+        raise Exception("Upload job queue is not running.")
+    return job_queue
+
+def _job_queue_samples() -> dict:
+    if job_queue is None:
+        return {}
+    stats = job_queue.stats()
+    return {("queued",): stats["queue_depth"], ("pending",): stats["pending"],
+            ("retrying",): stats["scheduled_retries"]}
+
+JOB_QUEUE_JOBS = gauge("upload_jobs", "Upload jobs by state, read at scrape time", ("state",),
+                       function=_job_queue_samples)
@@ -0,0 +1,245 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import queue
+import logging
+import threading
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Logging configuration
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # "json" or "text"
+# Records waiting for the writer thread; when full, new records are dropped rather than blocking requests
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Each call site below ERROR emits at most this many records per window; 0 disables the limit
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", "20"))
+LOG_RATE_LIMIT_WINDOW = float(os.getenv("LOG_RATE_LIMIT_WINDOW", "1"))
+
+REQUEST_ID_HEADER = "X-Request-ID"
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,128}$")
+
+# Correlation id of the request or job being handled
+correlation_id: ContextVar[Optional[str]] = ContextVar("correlation_id", default=None)
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message", "asctime", "correlation_id", "suppressed"}
+
+def new_correlation_id() -> str:
+    return uuid.uuid4().hex
+
+class CorrelationIdFilter(logging.Filter):
+    """Stamps each record with the current correlation id"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.correlation_id = correlation_id.get()
+        return True
+
+class RateLimitFilter(logging.Filter):
+    """Caps how often each logging call site emits records below ERROR.
+
+    Call sites are identified by file and line, so a per-request line is
+    limited as one regardless of its arguments. The number of records dropped
+    in a window is attached as ``suppressed`` to the next record let through.
+    """
+
+    def __init__(self, limit: int = LOG_RATE_LIMIT, window: float = LOG_RATE_LIMIT_WINDOW):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.dropped = 0
+        # (pathname, lineno) -> [window start, emitted, suppressed]
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.limit <= 0 or record.levelno >= logging.ERROR:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= self.window:
+                if site is not None and site[2]:
+                    record.suppressed = site[2]
+                self._sites[key] = [now, 1, 0]
+                return True
+            if site[1] < self.limit:
+                site[1] += 1
+                return True
+            site[2] += 1
+            self.dropped += 1
+            return False
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the message, correlation id and any ``extra`` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if getattr(record, "correlation_id", None):
+            entry["correlation_id"] = record.correlation_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(correlation_id)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, "correlation_id"):
+            record.correlation_id = None
+        line = super().format(record)
+        if getattr(record, "suppressed", 0):
+            line += f" ({record.suppressed} similar records suppressed)"
+        return line
+
+class AsyncQueueHandler(QueueHandler):
+    """Hands records to the writer thread without blocking the caller.
+
+    Only the message interpolation happens on the calling thread (arguments
+    may change after the call returns); JSON encoding and the write itself
+    run on the listener thread.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class BlockingStopQueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # The queue may be full at shutdown; wait for the writer thread to make room
+        self.queue.put(self._sentinel)
+
+# Global logging pipeline
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[AsyncQueueHandler] = None
+_rate_limit_filter: Optional[RateLimitFilter] = None
+_stream_handler: Optional[logging.Handler] = None
+
+def configure_logging():
+    """Route all logging through a bounded queue drained by a background writer thread"""
+    global _listener, _queue_handler, _rate_limit_filter, _stream_handler
+    if _listener is not None:
+        return
+
+    _stream_handler = logging.StreamHandler(sys.stderr)
+    _stream_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _queue_handler = AsyncQueueHandler(log_queue)
+    _queue_handler.addFilter(CorrelationIdFilter())
+    _rate_limit_filter = RateLimitFilter()
+    _queue_handler.addFilter(_rate_limit_filter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    # uvicorn installs its own synchronous stderr handlers; send its records through the queue as well
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+    # Process and thread details are not written, so skip collecting them for every record
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    logging.logThreads = False
+
+    _listener = BlockingStopQueueListener(log_queue, _stream_handler, respect_handler_level=True)
+    _listener.start()
+
+def stop_logging():
+    """Flush queued records and go back to writing synchronously"""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    root = logging.getLogger()
+    root.removeHandler(_queue_handler)
+    for log_filter in _queue_handler.filters:
+        _stream_handler.addFilter(log_filter)
+    root.addHandler(_stream_handler)
+    _queue_handler = None
+
+def logging_stats() -> dict:
+    return {
+        "format": LOG_FORMAT,
+        "level": LOG_LEVEL,
+        "queued": _queue_handler.queue.qsize() if _queue_handler is not None else 0,
+        "dropped_queue_full": _queue_handler.dropped if _queue_handler is not None else 0,
+        "suppressed_by_rate_limit": _rate_limit_filter.dropped if _rate_limit_filter is not None else 0
+    }
+
+class CorrelationIdMiddleware:
+    """ASGI middleware giving each request a correlation id.
+
+    A well-formed incoming ``X-Request-ID`` is reused, otherwise a new id is
+    generated; either way it is echoed in the response headers and set for
+    every log record written while the request is handled.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                candidate = value.decode("latin-1")
+                if REQUEST_ID_PATTERN.match(candidate):
+                    request_id = candidate
+                break
+        request_id = request_id or new_correlation_id()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        token = correlation_id.set(request_id)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            correlation_id.reset(token)
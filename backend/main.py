@@ -1,18 +1,51 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, status, UploadFile, File, Form
 from fastapi.security import HTTPBearer
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from contextlib import asynccontextmanager
 from datetime import timedelta
+from typing import List, Optional, Union
 import os
+import math
+import asyncio
 import logging
 from dotenv import load_dotenv
-from pydantic import BaseModel
+from pydantic import BaseModel, confloat, conint, conlist, constr
 
-from auth import authenticate_user, create_access_token, get_current_user, Token, User
-from upload import upload_resume
-from google_drive import get_drive_service, GoogleDriveService
+from auth import (authenticate_user_async, create_access_token, get_callback_caller, get_current_user,
+                  get_stream_user, shutdown_password_executor, token_cache, Token, User)
+from rate_limit import login_ip_limiter, login_user_limiter, record_login_success, reserve_login_attempt
+from upload import upload_resume, process_upload_job
+from batch import prepare_batch, stream_batch
+from google_drive import close_drive_service
+from drive_pool import get_drive_pool, shutdown_drive_pool
+from http_client import start_http_client, close_http_client
+from jobs import get_job_queue, start_job_queue, stop_job_queue
+from outbox import get_webhook_outbox, start_webhook_outbox, stop_webhook_outbox
+from dedup import get_dedup_index, close_dedup_index
+from analysis_cache import (ANALYSIS_LOOKUP_MAX_TEXTS, ANALYSIS_MODEL, ANALYSIS_PROMPT_VERSION, close_analysis_cache,
+                            get_analysis_cache)
+from pdf_extract import shutdown_pdf_extractor
+from database import (ResumeRecord, batch_writer_stats, close_database, get_resume_store, resume_store_stats,
+                      start_database)
+from skills import close_skill_index, skill_index_stats, start_skill_index
+from ranking import (MATCH_MAX_DESCRIPTION_CHARS, MATCH_MAX_TOP_K, close_ranking_index, ranking_index_stats,
+                     start_ranking_index)
+from resumes import (find_resumes_by_email, get_resume, ingest_resumes, match_resumes, search_resumes,
+                     start_resume_sync)
+from events import resume_events_stats, stop_resume_events
+from cache import close_result_cache, get_result_cache
+from metrics import (CONTENT_TYPE, MetricsMiddleware, render_metrics, start_metrics_snapshots,
+                     stop_metrics_snapshots)
+from log_config import CorrelationIdMiddleware, configure_logging, logging_stats, stop_logging
+from storage import get_storage
+from progress import get_progress_broadcaster, publish_job_status, start_progress_events, stream_job_progress
+from validation import UploadLimitMiddleware
+from startup import start_warm_up, startup_stats, stop_warm_up
+from workers import API_HOST, API_PORT, WEB_CONCURRENCY, register_worker, unregister_worker, worker_stats
 
 # Set up logging
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 load_dotenv()
@@ -22,12 +55,71 @@ class LoginRequest(BaseModel):
     username: str
     password: str
 
+class AnalysisLookupRequest(BaseModel):
+    texts: conlist(str, min_items=1, max_items=ANALYSIS_LOOKUP_MAX_TEXTS)
+    model: constr(min_length=1, max_length=100) = ANALYSIS_MODEL
+    prompt_version: constr(min_length=1, max_length=100) = ANALYSIS_PROMPT_VERSION
+
+class MatchRequest(BaseModel):
+    job_description: constr(min_length=1, max_length=MATCH_MAX_DESCRIPTION_CHARS)
+    top_k: conint(ge=1, le=MATCH_MAX_TOP_K) = 20
+    min_experience: Optional[confloat(ge=0)] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop this process's service clients.
+
+    Runs once in every worker process, so each worker owns its own Drive
+    client, HTTP client, database pool and indexes; state the workers must
+    agree on lives in shared files or PostgreSQL instead.
+    """
+    register_worker()
+    await start_http_client()
+    start_warm_up()
+    start_progress_events()
+    try:
+        await start_database()
+        start_skill_index(get_resume_store().iter_skills())
+        start_ranking_index(get_resume_store().iter_match_features)
+        await start_resume_sync()
+    except Exception as e:
+        logger.error("Could not connect to PostgreSQL on startup: %s", e)
+    await start_webhook_outbox()
+    await start_job_queue(process_upload_job, on_status=publish_job_status)
+    start_metrics_snapshots()
+
+    yield
+
+    await stop_warm_up()
+    await stop_metrics_snapshots()
+    await stop_job_queue()
+    await stop_webhook_outbox()
+    await stop_resume_events()
+    await close_skill_index()
+    await close_ranking_index()
+    await close_database()
+    await close_result_cache()
+    close_dedup_index()
+    close_analysis_cache()
+    shutdown_pdf_extractor()
+    shutdown_password_executor()
+    await close_http_client()
+    logger.info("Shutting down Google Drive worker pool...")
+    shutdown_drive_pool()
+    close_drive_service()
+    unregister_worker()
+    stop_logging()
+
 app = FastAPI(
     title="Resume Analyzer API",
     description="Secure API for uploading and analyzing resumes using n8n automation",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Cap upload request bodies before they are parsed; inside CORS so rejections stay readable cross-origin
+app.add_middleware(UploadLimitMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -35,16 +127,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
-@app.on_event("startup")
-async def startup_event():
-    logger.info("Starting up and initializing Google Drive Service...")
-    try:
-        get_drive_service()
-        logger.info("Google Drive Service initialized on startup.")
-    except Exception as e:
-        logger.error(f"Could not initialize Google Drive Service on startup: {e}")
+# Request latency metrics
+app.add_middleware(MetricsMiddleware)
+
+# Correlation ids for log records; added last so it wraps every other middleware
+app.add_middleware(CorrelationIdMiddleware)
 
 @app.get("/")
 async def root():
@@ -53,17 +143,40 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "login": "/auth/login",
-            "upload": "/upload (requires authentication)"
+            "upload": "/upload (requires authentication)",
+            "upload_batch": "/upload/batch (requires authentication)",
+            "jobs": "/jobs/{job_id} (requires authentication)",
+            "store_resumes": "/resumes (n8n callback token or JWT)",
+            "search": "/resumes/search (requires authentication)",
+            "resume": "/resumes/{resume_id} (requires authentication)",
+            "by_email": "/resumes?email= (requires authentication)",
+            "match": "/match (requires authentication)",
+            "webhook_delivery": "/webhooks/deliveries/{delivery_id} (requires authentication)",
+            "dead_letters": "/webhooks/dead-letters (requires authentication)",
+            "metrics": "/metrics"
         }
     }
 
 @app.post("/auth/login", response_model=Token)
-async def login(login_data: LoginRequest):
+async def login(login_data: LoginRequest, request: Request):
     """Login endpoint with hardcoded user validation"""
-    logger.info(f"Login attempt for user: {login_data.username}")
-    user = authenticate_user(login_data.username, login_data.password)
+    logger.info("Login attempt for user: %s", login_data.username)
+    client_ip = request.client.host if request.client else "unknown"
+    # Counted, or rejected, before any password hashing happens, so a concurrent burst cannot pass the check
+    retry_after = await asyncio.to_thread(reserve_login_attempt, client_ip, login_data.username)
+    if retry_after is not None:
+        logger.warning("Rate limited login attempt for user: %s from %s", login_data.username, client_ip)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts, try again later",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+    
+    user = await authenticate_user_async(login_data.username, login_data.password)
+    if user:
+        await asyncio.to_thread(record_login_success, login_data.username)
     if not user:
-        logger.warning(f"Failed login attempt for user: {login_data.username}")
+        logger.warning("Failed login attempt for user: %s", login_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -75,36 +188,179 @@ async def login(login_data: LoginRequest):
         data={"sub": user.username}, expires_delta=access_token_expires
     )
     
-    logger.info(f"Successful login for user: {login_data.username}")
+    logger.info("Successful login for user: %s", login_data.username)
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.post("/upload")
+@app.post("/upload", status_code=status.HTTP_202_ACCEPTED)
 async def upload_resume_endpoint(
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
-    drive_service: GoogleDriveService = Depends(get_drive_service)
+    current_user: User = Depends(get_current_user)
 ):
-    """Upload resume endpoint - requires JWT authentication"""
-    logger.info(f"Upload request from user: {current_user.username}")
-    logger.info(f"File details: {file.filename}, {file.content_type}, {file.size if hasattr(file, 'size') else 'unknown size'}")
+    """Upload resume endpoint - requires JWT authentication.
+
+    The file is staged locally and processed in the background; poll
+    /jobs/{job_id} for the Drive upload and webhook outcome.
+    """
+    logger.info("Upload request from user: %s (%s, %s, %s bytes)", current_user.username, file.filename,
+                file.content_type, getattr(file, "size", None))
     
     try:
-        result = await upload_resume(file, drive_service)
-        logger.info(f"Upload successful for user: {current_user.username}")
+        result = await upload_resume(file, get_job_queue())
+        logger.info("Upload accepted for user: %s", current_user.username)
         return result
     except HTTPException as e:
         raise e
     except Exception as e:
-        logger.error(f"Upload failed for user {current_user.username}: {str(e)}")
+        logger.error("Upload failed for user %s: %s", current_user.username, e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An unexpected error occurred during file upload: {str(e)}"
         )
 
+@app.post("/upload/batch")
+async def upload_batch_endpoint(
+    files: List[UploadFile] = File(...),
+    current_user: User = Depends(get_current_user)
+):
+    """Batch upload endpoint - requires JWT authentication.
+
+    Accepts many PDFs and/or ZIP archives of PDFs and streams one NDJSON result
+    line per file as it finishes, followed by a summary line.
+    """
+    logger.info("Batch upload request from user: %s (%d parts)", current_user.username, len(files))
+    entries = prepare_batch(files)
+    return StreamingResponse(stream_batch(entries), media_type="application/x-ndjson")
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str, current_user: User = Depends(get_current_user)):
+    """Upload job status endpoint - requires JWT authentication"""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    delivery_id = (job.webhook_status or {}).get("delivery_id")
+    if delivery_id:
+        # Report where the queued webhook is now rather than the state recorded when it was queued
+        delivery = await asyncio.to_thread(get_webhook_outbox().get, delivery_id)
+        if delivery is not None:
+            job = job.copy(update={"webhook_status": {**job.webhook_status, **delivery}})
+    return job
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, current_user: User = Depends(get_stream_user)):
+    """Upload progress as server-sent events - requires JWT authentication (header or ?access_token=).
+
+    Sends ``status`` events as the job moves through the queue, then the
+    ``analysis`` event once n8n has stored the resume, and closes; a job
+    whose file was analyzed before gets the stored analysis right away.
+    """
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    # No caching or proxy buffering, so each event reaches the client when it is sent
+    return StreamingResponse(stream_job_progress(job), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/files/{file_id}")
+async def download_stored_file(file_id: str, caller: str = Depends(get_callback_caller)):
+    """Download a stored resume - for the n8n workflow (X-N8N-Token) or JWT authentication.
+
+    Local files are sent directly, or through the proxy with X-Accel-Redirect
+    when configured; S3 and Drive files redirect to the store's own URL.
+    """
+    return await get_storage().download(file_id)
+
+@app.get("/webhooks/deliveries/{delivery_id}")
+async def get_webhook_delivery(delivery_id: str, current_user: User = Depends(get_current_user)):
+    """Delivery state of a queued n8n webhook - requires JWT authentication"""
+    delivery = await asyncio.to_thread(get_webhook_outbox().get, delivery_id)
+    if delivery is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Delivery not found")
+    return delivery
+
+@app.get("/webhooks/dead-letters")
+async def list_dead_letters(
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: User = Depends(get_current_user)
+):
+    """Webhook deliveries that exhausted their retries - requires JWT authentication"""
+    return {"deliveries": await asyncio.to_thread(get_webhook_outbox().dead_letters, limit)}
+
+@app.post("/webhooks/dead-letters/{delivery_id}/retry")
+async def retry_dead_letter(delivery_id: str, current_user: User = Depends(get_current_user)):
+    """Requeue a dead-lettered webhook with a fresh retry budget - requires JWT authentication"""
+    if not await get_webhook_outbox().retry(delivery_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Dead letter not found")
+    return {"delivery_id": delivery_id, "status": "pending"}
+
+@app.post("/resumes", status_code=status.HTTP_201_CREATED)
+async def store_resumes(
+    records: Union[List[ResumeRecord], ResumeRecord],
+    caller: str = Depends(get_callback_caller)
+):
+    """Store analyzed resumes - called by the n8n workflow with its callback token.
+
+    Accepts one record or a list; rows are written to PostgreSQL in batches.
+    """
+    if not isinstance(records, list):
+        records = [records]
+    return await ingest_resumes(records)
+
+@app.post("/analysis/lookup")
+async def lookup_analysis(request: AnalysisLookupRequest, caller: str = Depends(get_callback_caller)):
+    """Look resume texts up in the LLM analysis cache - called by the n8n workflow before OpenAI.
+
+    Returns each text's ``analysis_key`` and, on a hit, the cached analysis.
+    Send the key back with the resume on ``POST /resumes`` after a miss so
+    the new analysis is cached. Texts too short to key, such as those of
+    scanned PDFs, get no key and are never cached.
+    """
+    analysis_cache = get_analysis_cache()
+    if analysis_cache is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Analysis cache is disabled")
+    results = await asyncio.to_thread(analysis_cache.lookup, request.texts, request.model, request.prompt_version)
+    return {
+        "model": request.model,
+        "prompt_version": request.prompt_version,
+        "hits": sum(result["hit"] for result in results),
+        "results": results
+    }
+
+@app.get("/resumes/search")
+async def search(
+    skills: Optional[List[str]] = Query(None, description="Skill to filter by; repeat for several"),
+    match: str = Query("all", regex="^(all|any)$", description="Require all listed skills or any of them"),
+    min_experience: Optional[float] = Query(None, ge=0),
+    max_experience: Optional[float] = Query(None, ge=0),
+    q: Optional[str] = Query(None, max_length=200, description="Full-text query over name, job title and resume text"),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[int] = Query(None, description="next_cursor from the previous page"),
+    current_user: User = Depends(get_current_user)
+):
+    """Search analyzed resumes - requires JWT authentication. Newest first, keyset paginated."""
+    return await search_resumes(skills, match, min_experience, max_experience, q, limit, cursor)
+
+@app.get("/resumes")
+async def resumes_by_email(
+    email: str = Query(..., min_length=3, max_length=320),
+    current_user: User = Depends(get_current_user)
+):
+    """Resumes for an email address - requires JWT authentication"""
+    return await find_resumes_by_email(email)
+
+@app.get("/resumes/{resume_id}")
+async def resume_by_id(resume_id: int, current_user: User = Depends(get_current_user)):
+    """Single resume by id - requires JWT authentication"""
+    return await get_resume(resume_id)
+
+@app.post("/match")
+async def match(request: MatchRequest, current_user: User = Depends(get_current_user)):
+    """Rank stored resumes against a job description - requires JWT authentication"""
+    return await match_resumes(request.job_description, request.top_k, request.min_experience)
+
 @app.get("/test-auth")
 async def test_auth(current_user: User = Depends(get_current_user)):
     """Test endpoint to verify JWT authentication"""
-    logger.info(f"Auth test successful for user: {current_user.username}")
+    logger.info("Auth test successful for user: %s", current_user.username)
     return {"message": "Authentication successful", "user": current_user.username}
 
 @app.get("/test-basic")
@@ -122,7 +378,7 @@ async def test_post():
 @app.post("/simple-upload")
 async def simple_upload_endpoint(file: UploadFile = File(...)):
     """Simple upload endpoint without authentication for testing"""
-    logger.info(f"Simple upload request for file: {file.filename}")
+    logger.info("Simple upload request for file: %s", file.filename)
     try:
         return {
             "message": "Simple upload successful",
@@ -131,7 +387,7 @@ async def simple_upload_endpoint(file: UploadFile = File(...)):
             "size": file.size if hasattr(file, 'size') else 'unknown'
         }
     except Exception as e:
-        logger.error(f"Simple upload failed: {str(e)}")
+        logger.error("Simple upload failed: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Simple upload failed: {str(e)}"
@@ -140,7 +396,7 @@ async def simple_upload_endpoint(file: UploadFile = File(...)):
 @app.post("/test-upload")
 async def test_upload_endpoint(file: UploadFile = File(...)):
     """Test upload endpoint without authentication"""
-    logger.info(f"Test upload request for file: {file.filename}")
+    logger.info("Test upload request for file: %s", file.filename)
     try:
         # Just return file info without saving
         return {
@@ -150,17 +406,58 @@ async def test_upload_endpoint(file: UploadFile = File(...)):
             "size": file.size if hasattr(file, 'size') else 'unknown'
         }
     except Exception as e:
-        logger.error(f"Test upload failed: {str(e)}")
+        logger.error("Test upload failed: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Test upload failed: {str(e)}"
         )
 
+def _sqlite_stats() -> dict:
+    """Health figures that are read from SQLite files, collected together off the event loop"""
+    dedup_index = get_dedup_index()
+    analysis_cache = get_analysis_cache()
+    return {
+        "dedup": dedup_index.stats() if dedup_index is not None else None,
+        "analysis_cache": analysis_cache.stats() if analysis_cache is not None else None,
+        "login_rate_limit": {"ip": login_ip_limiter.stats(), "user": login_user_limiter.stats()},
+        "result_cache": get_result_cache().stats(),
+        "webhook_outbox": get_webhook_outbox().stats()
+    }
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "service": "resume-analyzer-api"}
+    stored = await asyncio.to_thread(_sqlite_stats)
+    return {
+        "status": "healthy",
+        "service": "resume-analyzer-api",
+        "drive_pool": get_drive_pool().stats(),
+        "storage": get_storage().stats(),
+        "job_queue": get_job_queue().stats(),
+        "dedup": stored["dedup"],
+        "analysis_cache": stored["analysis_cache"],
+        "token_cache": token_cache.stats(),
+        "login_rate_limit": stored["login_rate_limit"],
+        "database": resume_store_stats(),
+        "batch_writer": batch_writer_stats(),
+        "result_cache": stored["result_cache"],
+        "skill_index": skill_index_stats(),
+        "ranking_index": ranking_index_stats(),
+        "webhook_outbox": stored["webhook_outbox"],
+        "resume_events": resume_events_stats(),
+        "progress": get_progress_broadcaster().stats(),
+        "worker": worker_stats(),
+        "startup": startup_stats(),
+        "logging": logging_stats()
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics for the upload pipeline, auth and request latency"""
+    # Some gauges are read from SQLite at scrape time
+    return Response(await asyncio.to_thread(render_metrics), media_type=CONTENT_TYPE)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Worker processes import the app themselves, so it is passed by name
+    uvicorn.run("main:app", host=API_HOST, port=API_PORT, workers=WEB_CONCURRENCY)
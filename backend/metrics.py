@@ -0,0 +1,435 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+import functools
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from dotenv import load_dotenv
+
+from workers import MULTI_WORKER, WORKER_RUN_DIR, live_workers, worker_id
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Metrics configuration
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# With several worker processes each one writes its samples here and /metrics adds them up
+METRICS_SNAPSHOT_DIR = os.getenv("METRICS_SNAPSHOT_DIR", os.path.join(WORKER_RUN_DIR, "metrics"))
+METRICS_SNAPSHOT_INTERVAL = float(os.getenv("METRICS_SNAPSHOT_INTERVAL", "5"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 2_500_000, 5_000_000, 10_000_000,
+                25_000_000, 50_000_000)
+
+# Starlette appends "; charset=utf-8" to text media types
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> object:
+        """The child for one combination of label values, created on first use"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self):
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self) -> Dict[Tuple[str, ...], object]:
+        """Plain sample values by label values, as written to snapshots"""
+        return {values: child.value for values, child in list(self._children.items())}
+
+    @staticmethod
+    def _merge(current, other):
+        return current + other
+
+    def render(self, others: Iterable[Dict[Tuple[str, ...], object]] = ()) -> List[str]:
+        """Text exposition lines, adding up the samples of ``others`` with this process's own"""
+        samples = self.collect()
+        for other in others:
+            for values, sample in other.items():
+                samples[values] = self._merge(samples[values], sample) if values in samples else sample
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, sample in sorted(samples.items()):
+            lines.extend(self._render_sample(values, sample))
+        return lines
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def _render_sample(self, values, sample) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(sample)}"]
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be read from ``function`` at scrape time"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default().dec(amount)
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def collect(self) -> Dict[Tuple[str, ...], object]:
+        if self.function is not None:
+            try:
+                for values, value in self.function().items():
+                    self.labels(*values).set(value)
+            except Exception:
+                pass
+        return super().collect()
+
+    def _render_sample(self, values, sample) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(sample)}"]
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # One slot per bucket plus +Inf; made cumulative only when rendered
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+class Histogram(_Metric):
+    """Distribution of observations in fixed buckets"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def collect(self) -> Dict[Tuple[str, ...], object]:
+        samples = {}
+        for values, child in list(self._children.items()):
+            with child._lock:
+                samples[values] = (list(child.counts), child.sum)
+        return samples
+
+    @staticmethod
+    def _merge(current, other):
+        return [a + b for a, b in zip(current[0], other[0])], current[1] + other[1]
+
+    def _render_sample(self, values, sample) -> List[str]:
+        counts, total = sample
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """Holds every metric and renders them in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self) -> dict:
+        """Every sample of this process, JSON-serializable"""
+        return {name: [[list(values), sample] for values, sample in metric.collect().items()]
+                for name, metric in self._metrics.items()}
+
+    def render(self, snapshots: Iterable[dict] = ()) -> str:
+        """Exposition text for this process's metrics plus those in ``snapshots`` of other processes"""
+        others = {name: [] for name in self._metrics}
+        for snapshot in snapshots:
+            for name, samples in snapshot.items():
+                if name in others:
+                    others[name].append({tuple(values): sample for values, sample in samples})
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.extend(metric.render(others[name]))
+        return "\n".join(lines) + "\n"
+
+# Global registry
+registry = MetricsRegistry()
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return registry.register(Counter(name, documentation, labelnames))
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = (), function=None) -> Gauge:
+    return registry.register(Gauge(name, documentation, labelnames, function))
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+def _snapshot_path(worker: str) -> str:
+    return os.path.join(METRICS_SNAPSHOT_DIR, f"{worker}.json")
+
+def write_metrics_snapshot():
+    """Publish this process's samples for the other workers to include in their /metrics"""
+    os.makedirs(METRICS_SNAPSHOT_DIR, exist_ok=True)
+    path = _snapshot_path(worker_id())
+    with open(path + ".tmp", "w") as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(path + ".tmp", path)
+
+def _sibling_snapshots() -> List[dict]:
+    snapshots = []
+    for worker in live_workers() - {worker_id()}:
+        try:
+            with open(_snapshot_path(worker)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+def _remove_stale_snapshots():
+    live = live_workers()
+    cutoff = time.time() - 3 * METRICS_SNAPSHOT_INTERVAL
+    for name in os.listdir(METRICS_SNAPSHOT_DIR):
+        path = os.path.join(METRICS_SNAPSHOT_DIR, name)
+        try:
+            if name.endswith(".json") and name[:-5] not in live and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+def render_metrics() -> str:
+    """Exposition text for the whole deployment.
+
+    With several worker processes the scrape lands on any one of them, so it
+    adds the latest snapshots of the other live workers to its own samples.
+    Counters and histograms of a worker that exited drop out of the totals,
+    which Prometheus treats like a process restart.
+    """
+    if not MULTI_WORKER:
+        return registry.render()
+    return registry.render(_sibling_snapshots())
+
+_snapshot_task: Optional[asyncio.Task] = None
+
+async def _snapshot_loop():
+    while True:
+        try:
+            await asyncio.to_thread(write_metrics_snapshot)
+            await asyncio.to_thread(_remove_stale_snapshots)
+        except Exception as e:
+            logger.warning("Could not write the metrics snapshot: %s", e)
+        await asyncio.sleep(METRICS_SNAPSHOT_INTERVAL)
+
+def start_metrics_snapshots():
+    """Start publishing this worker's samples, when running several workers"""
+    global _snapshot_task
+    if MULTI_WORKER and METRICS_ENABLED and _snapshot_task is None:
+        _snapshot_task = asyncio.create_task(_snapshot_loop())
+
+async def stop_metrics_snapshots():
+    global _snapshot_task
+    if _snapshot_task is not None:
+        _snapshot_task.cancel()
+        await asyncio.gather(_snapshot_task, return_exceptions=True)
+        _snapshot_task = None
+        try:
+            os.remove(_snapshot_path(worker_id()))
+        except OSError:
+            pass
+
+# Upload pipeline metrics
+UPLOAD_STAGE_SECONDS = histogram(
+    "upload_stage_duration_seconds", "Time spent in each upload pipeline stage", ("stage", "outcome"))
+UPLOAD_SIZE_BYTES = histogram(
+    "upload_size_bytes", "Size of uploaded resume files", ("source",), buckets=SIZE_BUCKETS)
+UPLOADS_IN_FLIGHT = gauge(
+    "uploads_in_flight", "Uploads currently being accepted or processed", ("stage",))
+UPLOAD_REJECTIONS = counter(
+    "upload_rejections_total", "Uploads rejected by validation before being stored", ("reason",))
+AUTH_SECONDS = histogram(
+    "auth_duration_seconds", "Time spent authenticating a request", ("method", "outcome"))
+HTTP_REQUEST_SECONDS = histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status"))
+
+def _outcome_of_exception(e: BaseException) -> str:
+    status_code = getattr(e, "status_code", None)
+    if status_code is not None:
+        return "rejected" if 400 <= status_code < 500 else "error"
+    return "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+
+def timed(metric: Histogram, *labels: str, outcome: Optional[Callable[[object], str]] = None):
+    """Decorator recording how long each call takes in ``metric``.
+
+    ``labels`` are the fixed leading label values; the last label is the
+    outcome: "ok", ``outcome(result)`` when given, or for exceptions
+    "rejected" (HTTP 4xx), "timeout" or "error". Works on sync and async
+    functions and keeps their signature, so FastAPI dependencies can be
+    wrapped too.
+    """
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        def record(started: float, result_outcome: str):
+            metric.labels(*labels, result_outcome).observe(time.perf_counter() - started)
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    result = await func(*args, **kwargs)
+                except BaseException as e:
+                    record(started, _outcome_of_exception(e))
+                    raise
+                record(started, outcome(result) if outcome else "ok")
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as e:
+                record(started, _outcome_of_exception(e))
+                raise
+            record(started, outcome(result) if outcome else "ok")
+            return result
+        return wrapper
+    return decorator
+
+def in_flight(metric: Gauge, *labels: str):
+    """Decorator counting calls of an async function that have not finished yet"""
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            child = metric.labels(*labels)
+            child.inc()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                child.dec()
+        return wrapper
+    return decorator
+
+def observe_request(method: str, route: str, status_code: int, seconds: float):
+    if METRICS_ENABLED:
+        HTTP_REQUEST_SECONDS.labels(method, route, status_code).observe(seconds)
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency by route template.
+
+    The route comes from the matched FastAPI route (e.g. ``/jobs/{job_id}``)
+    so path parameters do not create a label per id.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            observe_request(scope["method"], getattr(route, "path", "unmatched"), status_code,
+                            time.perf_counter() - started)
@@ -0,0 +1,413 @@
+import os
+import json
+import time
+import uuid
+import random
+import sqlite3
+import asyncio
+import logging
+import threading
+from typing import List, Optional, Set
+from dotenv import load_dotenv
+
+from http_client import N8N_WEBHOOK_TIMEOUT, get_http_client
+from metrics import UPLOAD_STAGE_SECONDS, counter, gauge, timed
+from log_config import REQUEST_ID_HEADER, correlation_id
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+_basedir = os.path.abspath(os.path.dirname(__file__))
+
+# Webhook outbox configuration
+WEBHOOK_OUTBOX_PATH = os.getenv("WEBHOOK_OUTBOX_PATH", os.path.join(_basedir, "uploads", "webhook_outbox.sqlite3"))
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "8"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "10"))
+WEBHOOK_RETRY_BASE_DELAY = float(os.getenv("WEBHOOK_RETRY_BASE_DELAY", "2"))
+WEBHOOK_RETRY_MAX_DELAY = float(os.getenv("WEBHOOK_RETRY_MAX_DELAY", "600"))
+# Consecutive failures that open the circuit, and how long it stays open before a trial delivery
+WEBHOOK_BREAKER_THRESHOLD = int(os.getenv("WEBHOOK_BREAKER_THRESHOLD", "5"))
+WEBHOOK_BREAKER_COOLDOWN = float(os.getenv("WEBHOOK_BREAKER_COOLDOWN", "30"))
+# Delivered rows are kept this long for status lookups; dead letters are kept until retried
+WEBHOOK_OUTBOX_RETENTION = int(os.getenv("WEBHOOK_OUTBOX_RETENTION", str(7 * 24 * 3600)))
+# Upper bound on how long the worker sleeps, so rows added by other processes are picked up
+WEBHOOK_POLL_INTERVAL = 5.0
+# A claimed delivery is retried after this long if its process died before recording the outcome
+WEBHOOK_LEASE_SECONDS = N8N_WEBHOOK_TIMEOUT + 30
+
+DELIVERY_HEADER = "X-Delivery-ID"
+# Client errors that may succeed on a later attempt; any other 4xx answer is final
+RETRYABLE_CLIENT_ERRORS = {408, 409, 425, 429}
+
+WEBHOOK_DELIVERIES = counter(
+    "webhook_deliveries_total", "Webhook delivery attempts by outcome", ("outcome",))
+
+class WebhookDeliveryError(Exception):
+    pass
+
+class WebhookRejectedError(WebhookDeliveryError):
+    """n8n refused the payload; sending it again would get the same answer"""
+    pass
+
+class CircuitBreaker:
+    """Stops delivery attempts after repeated failures.
+
+    Closed: deliveries flow. After ``threshold`` consecutive failures the
+    circuit opens and nothing is sent for ``cooldown`` seconds; then a single
+    trial delivery is let through (half-open). Its success closes the
+    circuit, its failure opens it again.
+    """
+
+    def __init__(self, threshold: int = WEBHOOK_BREAKER_THRESHOLD, cooldown: float = WEBHOOK_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allowance(self, free_slots: int) -> int:
+        """How many deliveries may start now"""
+        state = self.state
+        if state == "closed":
+            return free_slots
+        if state == "half_open" and not self.trial_in_flight and free_slots:
+            self.trial_in_flight = True
+            return 1
+        return 0
+
+    def reopens_in(self) -> float:
+        return max(0.0, self.opened_at + self.cooldown - time.monotonic()) if self.opened_at is not None else 0.0
+
+    def release_trial(self):
+        """Give back a trial slot that found nothing to deliver"""
+        self.trial_in_flight = False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info("n8n webhook circuit closed")
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_in_flight or self.failures >= self.threshold:
+            if self.opened_at is None or self.trial_in_flight:
+                logger.warning("n8n webhook circuit opened after %d consecutive failures", self.failures)
+            self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+class WebhookOutbox:
+    """Durable SQLite outbox of n8n webhook deliveries.
+
+    ``enqueue`` commits the delivery before returning, so an accepted upload's
+    webhook survives n8n outages and restarts. A worker task claims due rows,
+    posts them with at most ``concurrency`` in flight and records the outcome:
+    failures are retried with exponential backoff and full jitter, and rows
+    that still fail after ``max_attempts`` are dead-lettered, as are payloads
+    n8n rejects with a permanent client error. Claiming pushes
+    a row's next attempt out by a lease, so several processes can share the
+    database and a delivery interrupted by a crash is retried.
+    """
+
+    def __init__(self, db_path: str = WEBHOOK_OUTBOX_PATH, concurrency: int = WEBHOOK_CONCURRENCY,
+                 max_attempts: int = WEBHOOK_MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.breaker = CircuitBreaker()
+        self._lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: Set[asyncio.Task] = set()
+        self._writes = 0
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS webhook_outbox (
+                delivery_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                correlation_id TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_webhook_outbox_due ON webhook_outbox(status, next_attempt_at)")
+
+    # Storage; these run on worker threads via asyncio.to_thread
+
+    def _insert(self, url: str, payload: dict, request_id: Optional[str]) -> str:
+        delivery_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO webhook_outbox (delivery_id, url, payload, correlation_id, next_attempt_at, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (delivery_id, url, json.dumps(payload, default=str), request_id, now, now, now)
+            )
+        return delivery_id
+
+    def _claim(self, limit: int) -> List[tuple]:
+        """Atomically take up to ``limit`` due deliveries, leasing them to this process"""
+        now = time.time()
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE webhook_outbox SET attempts = attempts + 1, next_attempt_at = ?, updated_at = ? "
+                "WHERE delivery_id IN (SELECT delivery_id FROM webhook_outbox WHERE status = 'pending' "
+                "AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?) "
+                "RETURNING delivery_id, url, payload, correlation_id, attempts",
+                (now + WEBHOOK_LEASE_SECONDS, now, now, limit)
+            ).fetchall()
+
+    def _next_due(self) -> Optional[float]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT MIN(next_attempt_at) FROM webhook_outbox WHERE status = 'pending'").fetchone()[0]
+
+    def _finish(self, delivery_id: str, status: str, error: Optional[str] = None,
+                next_attempt_at: Optional[float] = None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE webhook_outbox SET status = ?, last_error = ?, next_attempt_at = COALESCE(?, next_attempt_at), "
+                "updated_at = ? WHERE delivery_id = ?",
+                (status, error, next_attempt_at, now, delivery_id)
+            )
+            self._writes += 1
+            if self._writes % 500 == 0:
+                self._conn.execute("DELETE FROM webhook_outbox WHERE status = 'delivered' AND updated_at < ?",
+                                   (now - WEBHOOK_OUTBOX_RETENTION,))
+
+    def get(self, delivery_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT delivery_id, url, status, attempts, next_attempt_at, last_error, created_at, updated_at "
+                "FROM webhook_outbox WHERE delivery_id = ?", (delivery_id,)
+            ).fetchone()
+        return self._row(row) if row else None
+
+    def dead_letters(self, limit: int = 100) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT delivery_id, url, status, attempts, next_attempt_at, last_error, created_at, updated_at "
+                "FROM webhook_outbox WHERE status = 'dead' ORDER BY updated_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def _requeue(self, delivery_id: str) -> bool:
+        now = time.time()
+        with self._lock:
+            return bool(self._conn.execute(
+                "UPDATE webhook_outbox SET status = 'pending', attempts = 0, next_attempt_at = ?, updated_at = ? "
+                "WHERE delivery_id = ? AND status = 'dead'", (now, now, delivery_id)
+            ).rowcount)
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM webhook_outbox GROUP BY status").fetchall()
+        counts = {"pending": 0, "delivered": 0, "dead": 0}
+        counts.update(dict(rows))
+        return counts
+
+    @staticmethod
+    def _row(row: tuple) -> dict:
+        return {
+            "delivery_id": row[0],
+            "url": row[1],
+            "status": row[2],
+            "attempts": row[3],
+            "next_attempt_at": row[4] if row[2] == "pending" else None,
+            "last_error": row[5],
+            "created_at": row[6],
+            "updated_at": row[7]
+        }
+
+    # Delivery
+
+    async def enqueue(self, url: str, payload: dict) -> str:
+        """Durably record a webhook delivery and wake the worker; returns its delivery id"""
+        delivery_id = await asyncio.to_thread(self._insert, url, payload, correlation_id.get())
+        self._wake()
+        return delivery_id
+
+    async def retry(self, delivery_id: str) -> bool:
+        """Move a dead letter back to pending with a fresh attempt budget"""
+        requeued = await asyncio.to_thread(self._requeue, delivery_id)
+        if requeued:
+            self._wake()
+        return requeued
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+            logger.info("Webhook outbox started with %d delivery slots", self.concurrency)
+
+    async def stop(self):
+        """Stop the worker; deliveries still in flight are retried after their lease on the next start"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for task in list(self._in_flight):
+            task.cancel()
+        await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            allowance = self.breaker.allowance(self.concurrency - len(self._in_flight))
+            if allowance:
+                try:
+                    rows = await asyncio.to_thread(self._claim, allowance)
+                except sqlite3.Error as e:
+                    logger.error("Could not claim webhook deliveries: %s", e)
+                    rows = []
+                if not rows and self.breaker.state == "half_open":
+                    self.breaker.release_trial()
+                for row in rows:
+                    task = asyncio.create_task(self._deliver(*row))
+                    self._in_flight.add(task)
+                    task.add_done_callback(self._delivery_done)
+            # Computed first: a cancellation while it runs must not leave a wait() coroutine never awaited
+            timeout = await self._sleep_time()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _sleep_time(self) -> float:
+        state = self.breaker.state
+        if state == "open":
+            return min(WEBHOOK_POLL_INTERVAL, self.breaker.reopens_in()) or 0.01
+        # Finishing deliveries wake the worker, so there is nothing to poll for while slots are taken
+        if self.breaker.trial_in_flight or len(self._in_flight) >= self.concurrency:
+            return WEBHOOK_POLL_INTERVAL
+        next_due = await asyncio.to_thread(self._next_due)
+        if next_due is None:
+            return WEBHOOK_POLL_INTERVAL
+        return min(WEBHOOK_POLL_INTERVAL, max(0.0, next_due - time.time())) or 0.01
+
+    def _delivery_done(self, task: asyncio.Task):
+        self._in_flight.discard(task)
+        self._wake()
+
+    async def _deliver(self, delivery_id: str, url: str, payload: str, request_id: Optional[str], attempts: int):
+        token = correlation_id.set(request_id)
+        try:
+            await _post_webhook(url, payload, delivery_id, request_id)
+        except asyncio.CancelledError:
+            # Shutting down: release the lease so the next start retries it straight away
+            await asyncio.shield(asyncio.to_thread(self._finish, delivery_id, "pending", "Interrupted by shutdown",
+                                                   time.time()))
+            raise
+        except WebhookRejectedError as e:
+            # n8n is up and answered; a permanent rejection must not open the circuit for other deliveries
+            self.breaker.record_success()
+            WEBHOOK_DELIVERIES.labels("dead").inc()
+            logger.error("Webhook delivery %s dead-lettered after a permanent rejection: %s", delivery_id, e,
+                         extra={"delivery_id": delivery_id})
+            await asyncio.to_thread(self._finish, delivery_id, "dead", str(e))
+        except Exception as e:
+            self.breaker.record_failure()
+            error = str(e) or type(e).__name__
+            if attempts >= self.max_attempts:
+                WEBHOOK_DELIVERIES.labels("dead").inc()
+                logger.error("Webhook delivery %s dead-lettered after %d attempts: %s", delivery_id, attempts, error,
+                             extra={"delivery_id": delivery_id})
+                await asyncio.to_thread(self._finish, delivery_id, "dead", error)
+            else:
+                WEBHOOK_DELIVERIES.labels("retry").inc()
+                delay = _backoff(attempts)
+                logger.warning("Webhook delivery %s attempt %d failed: %s; retrying in %.1fs", delivery_id, attempts,
+                               error, delay, extra={"delivery_id": delivery_id})
+                await asyncio.to_thread(self._finish, delivery_id, "pending", error, time.time() + delay)
+        else:
+            self.breaker.record_success()
+            WEBHOOK_DELIVERIES.labels("delivered").inc()
+            logger.info("Webhook delivery %s succeeded", delivery_id, extra={"delivery_id": delivery_id})
+            await asyncio.to_thread(self._finish, delivery_id, "delivered")
+        finally:
+            correlation_id.reset(token)
+
+    def stats(self) -> dict:
+        return {
+            **self.counts(),
+            "in_flight": len(self._in_flight),
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def _backoff(attempt: int) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(WEBHOOK_RETRY_MAX_DELAY, WEBHOOK_RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+
+@timed(UPLOAD_STAGE_SECONDS, "webhook")
+async def _post_webhook(url: str, payload: str, delivery_id: str, request_id: Optional[str]):
+    """POST one stored payload; raises WebhookDeliveryError unless n8n answers 2xx.
+
+    Client errors other than ``RETRYABLE_CLIENT_ERRORS`` raise WebhookRejectedError.
+    """
+    headers = {"Content-Type": "application/json", DELIVERY_HEADER: delivery_id}
+    if request_id:
+        headers[REQUEST_ID_HEADER] = request_id
+    response = await get_http_client().post(url, content=payload, headers=headers)
+    if not 200 <= response.status_code < 300:
+        message = f"n8n webhook answered {response.status_code}: {response.text[:200]}"
+        if 400 <= response.status_code < 500 and response.status_code not in RETRYABLE_CLIENT_ERRORS:
+            raise WebhookRejectedError(message)
+        raise WebhookDeliveryError(message)
+
+# Global instance
+webhook_outbox: Optional[WebhookOutbox] = None
+
+def get_webhook_outbox() -> WebhookOutbox:
+    """Get or create the webhook outbox"""
+    global webhook_outbox
+    if webhook_outbox is None:
+        webhook_outbox = WebhookOutbox()
+    return webhook_outbox
+
+async def start_webhook_outbox():
+    """Start delivering pending webhooks, including those left over from a previous run"""
+    await get_webhook_outbox().start()
+
+async def stop_webhook_outbox():
+    """Stop the delivery worker and close the outbox database"""
+    global webhook_outbox
+    if webhook_outbox is not None:
+        await webhook_outbox.stop()
+        webhook_outbox.close()
+        webhook_outbox = None
+
+def _outbox_samples() -> dict:
+    if webhook_outbox is None:
+        return {}
+    return {(state,): count for state, count in webhook_outbox.counts().items()}
+
+WEBHOOK_OUTBOX_ROWS = gauge("webhook_outbox_deliveries", "Webhook deliveries in the outbox by state", ("state",),
+                            function=_outbox_samples)
@@ -0,0 +1,215 @@
+import os
+import io
+import signal
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Union
+from dotenv import load_dotenv
+
+from metrics import UPLOAD_STAGE_SECONDS, timed
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# PDF text extraction configuration
+PDF_EXTRACT_ENABLED = os.getenv("PDF_EXTRACT_ENABLED", "true").lower() in ("1", "true", "yes")
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "2"))
+PDF_EXTRACT_TIMEOUT = float(os.getenv("PDF_EXTRACT_TIMEOUT", "20"))
+PDF_EXTRACT_MAX_PAGES = int(os.getenv("PDF_EXTRACT_MAX_PAGES", "30"))
+PDF_EXTRACT_MAX_BYTES = int(os.getenv("PDF_EXTRACT_MAX_BYTES", str(20 * 1024 * 1024)))
+PDF_EXTRACT_MAX_CHARS = int(os.getenv("PDF_EXTRACT_MAX_CHARS", "100000"))
+# Upper bound on the structural pre-check run on every single upload
+PDF_PRECHECK_TIMEOUT = float(os.getenv("PDF_PRECHECK_TIMEOUT", "5"))
+# Address-space limit per worker process; 0 disables it
+PDF_EXTRACT_MAX_MEMORY_MB = int(os.getenv("PDF_EXTRACT_MAX_MEMORY_MB", "1024"))
+
+class ExtractionTimeout(Exception):
+    pass
+
+def _init_worker(max_memory_mb: int):
+    if resource is not None and max_memory_mb > 0:
+        limit = max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def _on_alarm(signum, frame):
+    raise ExtractionTimeout("PDF text extraction timed out")
+
+def _extract(source: Union[str, bytes], max_pages: int, max_chars: int, timeout: float) -> dict:
+    """Worker-side extraction. Runs in a pool process, so SIGALRM can interrupt a runaway parse.
+
+    The resume fields are extracted from the text in the same worker call.
+    """
+    from pypdf import PdfReader
+    from field_extractor import extract_fields
+
+    use_alarm = hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        reader = PdfReader(source if isinstance(source, str) else io.BytesIO(source))
+        page_count = len(reader.pages)
+        parts = []
+        length = 0
+        pages_extracted = 0
+        for index in range(min(page_count, max_pages)):
+            text = reader.pages[index].extract_text() or ""
+            parts.append(text)
+            length += len(text)
+            pages_extracted += 1
+            if length >= max_chars:
+                break
+        text = "\n".join(parts)
+        truncated = pages_extracted < page_count or len(text) > max_chars
+        text = text[:max_chars]
+        return {
+            "text": text,
+            "page_count": page_count,
+            "pages_extracted": pages_extracted,
+            "truncated": truncated,
+            "fields": extract_fields(text)
+        }
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+def _precheck(source: Union[str, bytes], timeout: float) -> dict:
+    """Worker-side structural check: parse the trailer, cross-reference table and page tree, but no content"""
+    from pypdf import PdfReader
+
+    use_alarm = hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        try:
+            reader = PdfReader(source if isinstance(source, str) else io.BytesIO(source))
+            if reader.is_encrypted:
+                return {"valid": False, "error": "Encrypted PDFs are not supported"}
+            return {"valid": True, "page_count": len(reader.pages)}
+        except ExtractionTimeout:
+            return {"valid": False, "error": f"PDF structure took more than {timeout}s to parse"}
+        except Exception as e:
+            return {"valid": False, "error": f"Not a readable PDF: {e}"}
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+class PdfTextExtractor:
+    """Extracts PDF text on a process pool so parsing never blocks the event loop.
+
+    Each extraction is bounded by a page limit, a character limit, a size cap
+    and a timeout enforced inside the worker; workers also run under an
+    address-space limit. If a worker still hangs or dies, the pool is replaced.
+    Failures return None so callers can fall back to node-side parsing.
+    """
+
+    def __init__(self, workers: int = PDF_EXTRACT_WORKERS, timeout: float = PDF_EXTRACT_TIMEOUT,
+                 max_pages: int = PDF_EXTRACT_MAX_PAGES, max_bytes: int = PDF_EXTRACT_MAX_BYTES,
+                 max_chars: int = PDF_EXTRACT_MAX_CHARS, max_memory_mb: int = PDF_EXTRACT_MAX_MEMORY_MB):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.max_chars = max_chars
+        self.max_memory_mb = max_memory_mb
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn avoids forking a process that already runs threads and an event loop
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.max_memory_mb,)
+            )
+        return self._executor
+
+    def _recycle(self):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            for process in list(getattr(executor, "_processes", {}).values()):
+                process.terminate()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @timed(UPLOAD_STAGE_SECONDS, "pdf_extract", outcome=lambda result: "ok" if result is not None else "skipped")
+    async def extract(self, source: Union[str, bytes], filename: str = "") -> Optional[dict]:
+        """Extract text from a PDF file path or bytes; returns None if it is skipped or fails"""
+        size = os.path.getsize(source) if isinstance(source, str) else len(source)
+        if size > self.max_bytes:
+            logger.info("Skipping text extraction for %s: %s bytes exceeds %s", filename, size, self.max_bytes)
+            return None
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._pool(), _extract, source, self.max_pages, self.max_chars, self.timeout)
+        try:
+            # The worker enforces the timeout itself; this is a backstop for workers that stop responding
+            return await asyncio.wait_for(future, self.timeout + 5)
+        except asyncio.TimeoutError:
+            logger.error("Text extraction for %s hung; recycling the extraction pool", filename)
+            self._recycle()
+        except BrokenProcessPool:
+            logger.error("Text extraction worker died on %s; recycling the extraction pool", filename)
+            self._recycle()
+        except ExtractionTimeout:
+            logger.warning("Text extraction for %s timed out after %ss", filename, self.timeout)
+        except Exception as e:
+            logger.warning("Text extraction failed for %s: %s", filename, e)
+        return None
+
+    @timed(UPLOAD_STAGE_SECONDS, "pdf_precheck", outcome=lambda result: "ok" if result is not None else "skipped")
+    async def precheck(self, source: Union[str, bytes], filename: str = "",
+                       timeout: float = PDF_PRECHECK_TIMEOUT) -> Optional[dict]:
+        """Check that a PDF parses and count its pages, without extracting text.
+
+        Returns ``{"valid": True, "page_count": n}`` or ``{"valid": False,
+        "error": ...}``, or None when the check could not run to completion.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._pool(), _precheck, source, timeout)
+        try:
+            return await asyncio.wait_for(future, timeout + 5)
+        except asyncio.TimeoutError:
+            logger.error("PDF pre-check for %s hung; recycling the extraction pool", filename)
+            self._recycle()
+        except BrokenProcessPool:
+            logger.error("PDF pre-check worker died on %s; recycling the extraction pool", filename)
+            self._recycle()
+        except Exception as e:
+            logger.warning("PDF pre-check failed for %s: %s", filename, e)
+        return None
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+# Global instance
+pdf_extractor: Optional[PdfTextExtractor] = None
+
+def get_pdf_extractor() -> Optional[PdfTextExtractor]:
+    """Get or create the PDF text extractor, or None when extraction is disabled"""
+    global pdf_extractor
+    if not PDF_EXTRACT_ENABLED:
+        return None
+    if pdf_extractor is None:
+        pdf_extractor = PdfTextExtractor()
+    return pdf_extractor
+
+def shutdown_pdf_extractor():
+    """Shut down the extraction process pool"""
+    global pdf_extractor
+    if pdf_extractor is not None:
+        pdf_extractor.shutdown()
+        pdf_extractor = None
@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import AsyncIterator, Dict, Iterable, Optional, Set, Tuple
+from dotenv import load_dotenv
+
+from database import get_resume_store
+from dedup import get_dedup_index
+from events import get_resume_events, listen_for_events
+from jobs import Job
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Upload progress streams
+PROGRESS_CHANNEL = "upload_progress"
+# Comment lines sent on idle streams so proxies and clients keep the connection open
+PROGRESS_HEARTBEAT_INTERVAL = float(os.getenv("PROGRESS_HEARTBEAT_INTERVAL", "15"))
+# A stream that has not seen its analysis by then ends with a "timeout" event
+PROGRESS_STREAM_TIMEOUT = float(os.getenv("PROGRESS_STREAM_TIMEOUT", "900"))
+# Events buffered per connection; a client that falls further behind loses the oldest
+PROGRESS_SUBSCRIBER_BUFFER = 64
+
+# Job states after which nothing more happens to the upload
+TERMINAL_STATUSES = {"failed"}
+
+def sse_frame(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'), default=str)}\n\n"
+
+# A buffered event: its type, the job status it reports (status events only) and the encoded frame
+Frame = Tuple[str, Optional[str], str]
+
+class Subscription:
+    """One connected client: a bounded buffer of encoded events for a set of keys"""
+
+    def __init__(self, keys: Set[str], buffer: int = PROGRESS_SUBSCRIBER_BUFFER):
+        self.keys = keys
+        self.frames: deque = deque(maxlen=buffer)
+        self.dropped = 0
+        self._ready = asyncio.Event()
+
+    def push(self, frame: Frame):
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped += 1
+        self.frames.append(frame)
+        self._ready.set()
+
+    async def next(self, timeout: float) -> Optional[Frame]:
+        """The next event, or None if none arrived within ``timeout`` seconds"""
+        if not self.frames:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.frames.popleft()
+
+class ProgressBroadcaster:
+    """Fans upload progress events out to the clients streaming them.
+
+    Clients subscribe to keys (a job id and the upload's content hash); an
+    event is encoded once and appended to the buffer of every subscription
+    holding its key, so publishing costs one dict lookup plus one append per
+    interested client and never waits on a slow one. Runs on the event loop
+    of one worker process; events published in the other workers arrive
+    through ``apply_remote``.
+    """
+
+    def __init__(self):
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, keys: Iterable[str]) -> Subscription:
+        subscription = Subscription({key for key in keys if key})
+        for key in subscription.keys:
+            self._subscriptions.setdefault(key, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for key in subscription.keys:
+            subscribers = self._subscriptions.get(key)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[key]
+
+    def publish(self, key: str, event: str, data: dict):
+        """Deliver an event to this process's subscribers of ``key``"""
+        self.published += 1
+        subscribers = self._subscriptions.get(key)
+        if not subscribers:
+            return
+        frame = (event, data.get("status") if event == "status" else None, sse_frame(event, data))
+        for subscription in subscribers:
+            subscription.push(frame)
+        self.delivered += len(subscribers)
+
+    def apply_remote(self, message: dict):
+        """Deliver an event published by another worker process"""
+        self.publish(message["key"], message["event"], message["data"])
+
+    def stats(self) -> dict:
+        subscriptions = set().union(*self._subscriptions.values()) if self._subscriptions else set()
+        return {
+            "subscribers": len(subscriptions),
+            "keys": len(self._subscriptions),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": sum(subscription.dropped for subscription in subscriptions)
+        }
+
+# Global instance
+broadcaster = ProgressBroadcaster()
+
+def get_progress_broadcaster() -> ProgressBroadcaster:
+    return broadcaster
+
+def start_progress_events():
+    """Receive the progress events of the other worker processes, when they are connected"""
+    listen_for_events(PROGRESS_CHANNEL, broadcaster.apply_remote)
+
+async def publish_progress(key: str, event: str, data: dict):
+    """Publish an event to the subscribers of ``key`` in every worker process"""
+    broadcaster.publish(key, event, data)
+    events = get_resume_events()
+    if events is not None:
+        try:
+            await events.notify(get_resume_store().pool, PROGRESS_CHANNEL, {"key": key, "event": event, "data": data})
+        except Exception as e:
+            logger.error("Could not send progress event for %s to the other workers: %s", key, e)
+
+def job_event(job: Job) -> dict:
+    return {
+        "job_id": job.job_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "page_count": job.page_count,
+        "drive_file_id": job.drive_file_id,
+        "error": job.error,
+        "updated_at": job.updated_at
+    }
+
+def analysis_event(resume: dict) -> dict:
+    return {key: resume.get(key) for key in ("id", "full_name", "email", "skills", "experience_years",
+                                             "last_job_title", "content_hash")}
+
+async def publish_job_status(job: Job):
+    """Job queue status listener: report each status change of an upload job"""
+    await publish_progress(job.job_id, "status", job_event(job))
+
+async def publish_analysis(resume_id: int, record: dict):
+    """Report a stored analysis to the streams waiting on its file's content hash"""
+    if record.get("content_hash"):
+        await publish_progress(record["content_hash"], "analysis", analysis_event({**record, "id": resume_id}))
+
+async def _stored_analysis(content_hash: Optional[str]) -> Optional[dict]:
+    """The analysis already stored for an upload's content, if any"""
+    if not content_hash:
+        return None
+    try:
+        resume = await get_resume_store().find_by_content_hash(content_hash)
+        if resume is not None:
+            return resume
+    except Exception as e:
+        logger.warning("Could not look up the stored analysis of %s: %s", content_hash, e)
+    dedup_index = get_dedup_index()
+    if dedup_index is not None:
+        entry = await asyncio.to_thread(dedup_index.lookup, content_hash)
+        if entry is not None and entry["analysis"]:
+            return {**entry["analysis"], "content_hash": content_hash}
+    return None
+
+async def stream_job_progress(job: Job) -> AsyncIterator[str]:
+    """Server-sent events for one upload job.
+
+    Starts with the job's current status; if its analysis is already stored
+    that follows and the stream ends. Otherwise status changes and finally
+    the ``analysis`` event are relayed as published, with heartbeat comments
+    while idle. The stream ends after the analysis, when the job fails, or
+    with a ``timeout`` event.
+
+    The subscription is made once the response starts streaming, so a
+    client gone before then leaves nothing behind, and before the stored
+    analysis is looked up, so an analysis stored in between is delivered
+    rather than missed.
+    """
+    subscription = broadcaster.subscribe([job.job_id, job.content_hash])
+    try:
+        stored = await _stored_analysis(job.content_hash)
+        yield f"retry: {int(PROGRESS_HEARTBEAT_INTERVAL * 1000)}\n" + sse_frame("status", job_event(job))
+        if stored is not None:
+            yield sse_frame("analysis", analysis_event(stored))
+            return
+        if job.status in TERMINAL_STATUSES:
+            return
+        deadline = time.monotonic() + PROGRESS_STREAM_TIMEOUT
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                yield sse_frame("timeout", {"job_id": job.job_id})
+                return
+            received = await subscription.next(min(PROGRESS_HEARTBEAT_INTERVAL, remaining))
+            if received is None:
+                yield ": heartbeat\n\n"
+                continue
+            event, job_status, frame = received
+            yield frame
+            if event == "analysis" or job_status in TERMINAL_STATUSES:
+                return
+    finally:
+        broadcaster.unsubscribe(subscription)
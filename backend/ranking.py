@@ -0,0 +1,434 @@
+import os
+import json
+import math
+import time
+import asyncio
+import logging
+import threading
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+
+from skills import SKILLS, canonicalize_skills
+from field_extractor import EXPLICIT_YEARS_RE, skill_matcher
+from workers import FileLock
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+_basedir = os.path.abspath(os.path.dirname(__file__))
+
+# Ranking configuration
+RANKING_ENABLED = os.getenv("RANKING_ENABLED", "true").lower() in ("1", "true", "yes")
+RANKING_DIR = os.getenv("RANKING_DIR", os.path.join(_basedir, "uploads", "ranking"))
+# Share of the score given to meeting the required years of experience
+RANKING_EXPERIENCE_WEIGHT = float(os.getenv("RANKING_EXPERIENCE_WEIGHT", "0.2"))
+# IDF is refit once the corpus has grown by this fraction since the last fit
+RANKING_REFIT_GROWTH = float(os.getenv("RANKING_REFIT_GROWTH", "0.2"))
+RANKING_INITIAL_CAPACITY = 4096
+# Readers poll this often for the writer to finish building a new index
+RANKING_READER_POLL_INTERVAL = 1.0
+RANKING_CHUNK_ROWS = 50000
+MATCH_MAX_TOP_K = 100
+MATCH_MAX_DESCRIPTION_CHARS = 20000
+
+# Feature columns: one per canonical skill
+VOCABULARY = tuple(SKILLS)
+_COLUMNS = {skill: column for column, skill in enumerate(VOCABULARY)}
+
+def skill_term_counts(text: str, skills: Iterable[str] = ()) -> Dict[int, int]:
+    """Mentions of each vocabulary skill in ``text``; listed ``skills`` count at least once"""
+    counts = {_COLUMNS[skill]: count for skill, count in skill_matcher.count(text or "").items() if skill in _COLUMNS}
+    for skill in canonicalize_skills(skills):
+        column = _COLUMNS.get(skill)
+        if column is not None:
+            counts.setdefault(column, 1)
+    return counts
+
+def term_frequencies(counts: Dict[int, int]) -> np.ndarray:
+    """Sublinear term frequency vector (1 + log count) over VOCABULARY"""
+    vector = np.zeros(len(VOCABULARY), dtype=np.float32)
+    for column, count in counts.items():
+        vector[column] = 1.0 + math.log(count)
+    return vector
+
+def required_experience(text: str) -> Optional[float]:
+    """Years of experience a job description asks for ("5+ years of experience"), if stated"""
+    years = [float(match) for match in EXPLICIT_YEARS_RE.findall(text)]
+    return min(years) if years else None
+
+def _normalize(rows: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(rows, axis=-1, keepdims=True)
+    return np.divide(rows, norms, out=np.zeros_like(rows), where=norms > 0)
+
+class RankingIndex:
+    """Memory-mapped TF-IDF skill vectors of every stored resume.
+
+    ``vectors`` holds one L2-normalized row per resume over VOCABULARY,
+    ``experience`` the years of experience (NaN when unknown) and ``ids`` the
+    resume ids. The arrays are .npy files in ``directory``, preallocated with
+    spare capacity and described by meta.json (row count, capacity, document
+    frequencies and the IDF the rows were weighted with), which is replaced
+    atomically after rows are written. Any number of processes can map the
+    files read-only and score against them; one process appends.
+
+    The IDF is kept fixed between refits so ranking a job description is a
+    single matrix-vector product. The matrix is stored column-major, so that
+    product only reads the columns of skills the description mentions. Rows
+    stay normalized, which makes a refit a rescale of the existing rows rather
+    than a rebuild from resume text. Rows are never rescaled in place: a
+    refit writes a new generation, so a ranking always scores against rows
+    weighted with the IDF it read alongside them.
+    """
+
+    def __init__(self, directory: str = RANKING_DIR, writable: bool = True):
+        self.directory = directory
+        self.writable = writable
+        self.count = 0
+        self.capacity = 0
+        self.generation = 0
+        self.df = np.zeros(len(VOCABULARY), dtype=np.int64)
+        self.idf = np.ones(len(VOCABULARY), dtype=np.float32)
+        self.fitted_count = 0
+        self.ready = False
+        self._vectors: Optional[np.ndarray] = None
+        self._experience: Optional[np.ndarray] = None
+        self._ids: Optional[np.ndarray] = None
+        self._meta_mtime: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+    def _path(self, name: str, generation: int) -> str:
+        return os.path.join(self.directory, f"{name}.{generation}.npy")
+
+    def last_id(self) -> int:
+        return int(self._ids[:self.count].max()) if self.count else 0
+
+    def missing(self, resume_ids: List[int]) -> List[int]:
+        """The ids among ``resume_ids`` that have no row yet"""
+        present = np.isin(resume_ids, self._ids[:self.count])
+        return [resume_id for resume_id, found in zip(resume_ids, present) if not found]
+
+    def open(self) -> bool:
+        """Map the arrays described by meta.json; returns False if there is no usable index"""
+        try:
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+            self._meta_mtime = os.stat(self._meta_path).st_mtime_ns
+        except (OSError, ValueError):
+            return False
+        if meta.get("vocabulary") != list(VOCABULARY):
+            logger.info("Ranking index vocabulary changed; it will be rebuilt")
+            return False
+        mode = "r+" if self.writable else "r"
+        if meta["generation"] != self.generation or self._vectors is None:
+            self._vectors = np.load(self._path("vectors", meta["generation"]), mmap_mode=mode)
+            self._experience = np.load(self._path("experience", meta["generation"]), mmap_mode=mode)
+            self._ids = np.load(self._path("ids", meta["generation"]), mmap_mode=mode)
+        self.generation = meta["generation"]
+        self.capacity = meta["capacity"]
+        self.count = meta["count"]
+        self.fitted_count = meta["fitted_count"]
+        self.df = np.asarray(meta["df"], dtype=np.int64)
+        self.idf = np.asarray(meta["idf"], dtype=np.float32)
+        self.ready = True
+        return True
+
+    def refresh(self):
+        """Pick up rows appended by another process since the last look"""
+        try:
+            mtime = os.stat(self._meta_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._meta_mtime:
+            self.open()
+
+    def create(self):
+        """Start an empty index, replacing any existing files"""
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if name.endswith(".npy"):
+                os.remove(os.path.join(self.directory, name))
+        self.count = 0
+        self.fitted_count = 0
+        self.df = np.zeros(len(VOCABULARY), dtype=np.int64)
+        self.idf = np.ones(len(VOCABULARY), dtype=np.float32)
+        self._allocate(RANKING_INITIAL_CAPACITY)
+        self._save_meta()
+        self.ready = True
+
+    def _allocate(self, capacity: int, scale: Optional[np.ndarray] = None) -> int:
+        """Create arrays of ``capacity`` rows under a new generation, copying the current rows.
+
+        With ``scale`` the copied rows are reweighted by it and renormalized.
+        The previous arrays are left as they are for rankings still reading
+        them; returns their generation.
+        """
+        generation = self.generation + 1
+        vectors = np.lib.format.open_memmap(self._path("vectors", generation), mode="w+", dtype=np.float32,
+                                            shape=(capacity, len(VOCABULARY)), fortran_order=True)
+        experience = np.lib.format.open_memmap(self._path("experience", generation), mode="w+", dtype=np.float32,
+                                               shape=(capacity,))
+        ids = np.lib.format.open_memmap(self._path("ids", generation), mode="w+", dtype=np.int64, shape=(capacity,))
+        if self.count:
+            for start in range(0, self.count, RANKING_CHUNK_ROWS):
+                end = min(start + RANKING_CHUNK_ROWS, self.count)
+                rows = self._vectors[start:end]
+                vectors[start:end] = rows if scale is None else _normalize(rows * scale)
+            experience[:self.count] = self._experience[:self.count]
+            ids[:self.count] = self._ids[:self.count]
+        previous = self.generation
+        self._vectors, self._experience, self._ids = vectors, experience, ids
+        self.generation = generation
+        self.capacity = capacity
+        return previous
+
+    def _save_meta(self):
+        meta = {
+            "generation": self.generation,
+            "capacity": self.capacity,
+            "count": self.count,
+            "fitted_count": self.fitted_count,
+            "vocabulary": list(VOCABULARY),
+            "df": self.df.tolist(),
+            "idf": [float(value) for value in self.idf]
+        }
+        for array in (self._vectors, self._experience, self._ids):
+            array.flush()
+        temporary = self._meta_path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(meta, f)
+        os.replace(temporary, self._meta_path)
+        self._meta_mtime = os.stat(self._meta_path).st_mtime_ns
+
+    def _remove_generation(self, generation: int):
+        for name in ("vectors", "experience", "ids"):
+            try:
+                os.remove(self._path(name, generation))
+            except OSError:
+                pass
+
+    def add_many(self, rows: List[Tuple[int, np.ndarray, Optional[float]]]):
+        """Append ``(resume_id, term_frequencies, experience_years)`` rows and publish them"""
+        if not rows:
+            return
+        with self._lock:
+            replaced = []
+            if self.count + len(rows) > self.capacity:
+                replaced.append(self._allocate(max(self.capacity * 2, self.count + len(rows))))
+            start = self.count
+            tf = np.stack([row[1] for row in rows])
+            self.df += (tf > 0).sum(axis=0)
+            self._vectors[start:start + len(rows)] = _normalize(tf * self.idf)
+            self._experience[start:start + len(rows)] = [
+                np.nan if row[2] is None else row[2] for row in rows
+            ]
+            self._ids[start:start + len(rows)] = [row[0] for row in rows]
+            self.count += len(rows)
+            if self.count >= max(self.fitted_count * (1 + RANKING_REFIT_GROWTH), self.fitted_count + 100):
+                replaced.append(self._refit())
+            self._save_meta()
+            for previous in replaced:
+                if previous:
+                    # Readers switch to the new files on their next refresh; mapped files stay valid after unlink
+                    self._remove_generation(previous)
+
+    def _refit(self) -> int:
+        """Recompute the IDF from the current document frequencies and reweight every row into a new generation"""
+        idf = (np.log((1 + self.count) / (1 + self.df)) + 1).astype(np.float32)
+        previous = self._allocate(self.capacity, scale=idf / self.idf)
+        self.idf = idf
+        self.fitted_count = self.count
+        logger.info("Ranking index refit over %s resumes", self.count)
+        return previous
+
+    def rank(self, counts: Dict[int, int], top_k: int = 20, min_experience: Optional[float] = None,
+             required_years: Optional[float] = None) -> List[Tuple[int, float]]:
+        """Top ``top_k`` ``(resume_id, score)`` for a job description's skill counts, best first.
+
+        The score is the cosine similarity of the TF-IDF skill vectors, blended
+        with how far the candidate meets ``required_years`` when that is known.
+        Reads the memory-mapped arrays, so run it off the event loop.
+        """
+        # Rows and IDF are taken together; appends and refits after this do not touch what is read below
+        with self._lock:
+            self.refresh()
+            count, idf = self.count, self.idf
+            vectors, experience, ids = self._vectors, self._experience, self._ids
+        if not count:
+            return []
+        query = _normalize(term_frequencies(counts) * idf)
+        # Only the job description's skill columns can contribute to the product
+        columns = np.fromiter(sorted(counts), dtype=np.intp)
+        scores = vectors[:count, columns] @ query[columns]
+        # Resumes sharing no skill with the description are out; the rest of the work is on candidates only
+        candidates = np.flatnonzero(scores > 0)
+        scores = scores[candidates]
+        experience = experience[candidates]
+        if required_years:
+            fit = np.nan_to_num(np.minimum(experience / required_years, 1.0), nan=0.0)
+            scores = (1 - RANKING_EXPERIENCE_WEIGHT) * scores + RANKING_EXPERIENCE_WEIGHT * fit
+        if min_experience is not None:
+            keep = experience >= min_experience
+            candidates, scores = candidates[keep], scores[keep]
+        top_k = min(top_k, len(candidates))
+        if not top_k:
+            return []
+        top = np.argpartition(scores, -top_k)[-top_k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(int(ids[candidates[i]]), float(scores[i])) for i in top]
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "resumes": self.count,
+            "capacity": self.capacity,
+            "fitted_count": self.fitted_count,
+            "vocabulary": len(VOCABULARY),
+            "bytes": self.capacity * (len(VOCABULARY) * 4 + 4 + 8)
+        }
+
+def _features(rows: List[Tuple[int, List[str], Optional[float], str]]) -> List[Tuple[int, np.ndarray, Optional[float]]]:
+    return [(resume_id, term_frequencies(skill_term_counts(text, skills)), experience)
+            for resume_id, skills, experience, text in rows]
+
+def _add_rows(index: RankingIndex, rows: List[Tuple[int, List[str], Optional[float], str]],
+              skip_present: bool = False):
+    if skip_present and rows:
+        missing = set(index.missing([row[0] for row in rows]))
+        rows = [row for row in rows if row[0] in missing]
+    index.add_many(_features(rows))
+
+async def sync_ranking_index(index: RankingIndex, rows: AsyncIterator[Tuple[int, List[str], Optional[float], str]],
+                             batch_size: int = 500, skip_present: bool = False):
+    """Append resumes streamed from the database, extracting features off the event loop"""
+    batch = []
+    async for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            await asyncio.to_thread(_add_rows, index, batch, skip_present)
+            batch = []
+    if batch:
+        await asyncio.to_thread(_add_rows, index, batch, skip_present)
+
+# Global instance, opened or built by the app startup hook
+ranking_index: Optional[RankingIndex] = None
+_sync_task: Optional[asyncio.Task] = None
+# Resumes stored while the index is still catching up
+_pending_rows: Optional[List[Tuple[int, List[str], Optional[float], str]]] = None
+# Held by the one worker process that appends to the index
+_writer_lock: Optional[FileLock] = None
+_rows_after = None
+
+async def _load_ranking_index(index: RankingIndex, rows_after):
+    global ranking_index, _pending_rows
+    started = time.perf_counter()
+    try:
+        if not await asyncio.to_thread(index.open):
+            await asyncio.to_thread(index.create)
+        await sync_ranking_index(index, rows_after(index.last_id()))
+        # The catch-up may already have streamed some of the pending rows
+        pending, _pending_rows = _pending_rows or [], None
+        missing = set(index.missing([row[0] for row in pending])) if pending else set()
+        await asyncio.to_thread(_add_rows, index, [row for row in pending if row[0] in missing])
+        logger.info("Ranking index ready in %.2fs: %s", time.perf_counter() - started, index.stats())
+    except Exception as e:
+        _pending_rows = None
+        ranking_index = None
+        logger.error("Could not load the ranking index: %s", e)
+
+async def _open_ranking_reader(index: RankingIndex):
+    """Map the index read-only once the writer process has published it"""
+    while not await asyncio.to_thread(index.open):
+        await asyncio.sleep(RANKING_READER_POLL_INTERVAL)
+    logger.info("Ranking index mapped read-only: %s", index.stats())
+
+def _start_writer():
+    global ranking_index, _sync_task, _pending_rows
+    ranking_index = RankingIndex()
+    _pending_rows = []
+    _sync_task = asyncio.create_task(_load_ranking_index(ranking_index, _rows_after))
+
+async def _stop_sync_task():
+    global _sync_task
+    if _sync_task is not None:
+        _sync_task.cancel()
+        try:
+            await _sync_task
+        except asyncio.CancelledError:
+            pass
+        _sync_task = None
+
+def start_ranking_index(rows_after):
+    """Open the ranking index and catch up with resumes stored since it was last written.
+
+    ``rows_after(last_id)`` must stream the feature rows of resumes with a
+    larger id. The first start builds the whole index in the background;
+    later starts only map the existing files. With several worker processes
+    one of them holds the writer lock and appends; the others map the files
+    read-only and pick up its appends.
+    """
+    global ranking_index, _sync_task, _writer_lock, _rows_after
+    if not RANKING_ENABLED or ranking_index is not None:
+        return
+    _rows_after = rows_after
+    _writer_lock = FileLock(os.path.join(RANKING_DIR, "writer.lock"))
+    if _writer_lock.acquire(blocking=False):
+        _start_writer()
+    else:
+        ranking_index = RankingIndex(writable=False)
+        _sync_task = asyncio.create_task(_open_ranking_reader(ranking_index))
+
+async def close_ranking_index():
+    """Stop a pending catch-up and unmap the ranking index"""
+    global ranking_index, _pending_rows, _writer_lock
+    await _stop_sync_task()
+    ranking_index = None
+    _pending_rows = None
+    if _writer_lock is not None:
+        _writer_lock.release()
+        _writer_lock = None
+
+def get_ranking_index() -> Optional[RankingIndex]:
+    """Get the ranking index, or None while it is still loading"""
+    if ranking_index is None or _pending_rows is not None or not ranking_index.ready:
+        return None
+    return ranking_index
+
+async def index_resumes_for_ranking(rows: List[Tuple[int, List[str], Optional[float], str]]):
+    """Add newly stored resumes to the ranking index, or queue them while it loads.
+
+    Only the writer process appends. A reader takes over as the writer if the
+    lock has been released, i.e. the previous writer exited; its catch-up
+    then covers whatever was stored in between.
+    """
+    global ranking_index
+    if ranking_index is None:
+        return
+    if not ranking_index.writable:
+        if _writer_lock is None or not _writer_lock.acquire(blocking=False):
+            return
+        logger.info("Taking over as the ranking index writer")
+        await _stop_sync_task()
+        _start_writer()
+    if _pending_rows is not None:
+        _pending_rows.extend(rows)
+    else:
+        await asyncio.to_thread(_add_rows, ranking_index, rows)
+
+async def catch_up_ranking_index():
+    """Append any resumes the writer has missed, e.g. while it could not hear the other workers"""
+    if ranking_index is None or not ranking_index.writable or _pending_rows is not None:
+        return
+    # Rows may also be arriving from the other workers meanwhile
+    await sync_ranking_index(ranking_index, _rows_after(ranking_index.last_id()), skip_present=True)
+
+def ranking_index_stats() -> Optional[dict]:
+    if ranking_index is None:
+        return None
+    return dict(ranking_index.stats(), role="writer" if ranking_index.writable else "reader")
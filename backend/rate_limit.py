@@ -0,0 +1,213 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from typing import Optional
+from dotenv import load_dotenv
+
+from workers import MULTI_WORKER
+
+load_dotenv()
+
+_basedir = os.path.abspath(os.path.dirname(__file__))
+
+# Login rate limiting configuration
+LOGIN_RATE_LIMIT_WINDOW = float(os.getenv("LOGIN_RATE_LIMIT_WINDOW", "60"))
+# Login attempts allowed per client IP within the window
+LOGIN_RATE_LIMIT_PER_IP = int(os.getenv("LOGIN_RATE_LIMIT_PER_IP", "20"))
+# Failed logins allowed per username within the window
+LOGIN_RATE_LIMIT_PER_USER = int(os.getenv("LOGIN_RATE_LIMIT_PER_USER", "5"))
+RATE_LIMIT_MAX_KEYS = 10000
+# "memory" counts per process; "sqlite" shares the counts between the worker processes on a host
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "sqlite" if MULTI_WORKER else "memory").lower()
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", os.path.join(_basedir, "uploads", "rate_limit.sqlite3"))
+# Events older than the window are purged once every this many hits
+RATE_LIMIT_PURGE_INTERVAL = 500
+
+class SlidingWindowLimiter:
+    """In-memory sliding-window counter per key.
+
+    ``acquire`` reserves an event before the expensive work it guards and
+    rejects once the key is at its limit; ``release`` and ``reset`` take
+    reservations back when the outcome should not count. At most
+    ``max_keys`` keys are tracked; the least recently used ones are dropped
+    beyond that.
+    """
+
+    def __init__(self, limit: int, window: float, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self.rejected = 0
+        self._events: "OrderedDict[str, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _prune(self, key: str, now: float) -> Optional[deque]:
+        events = self._events.get(key)
+        if events is None:
+            return None
+        while events and events[0] <= now - self.window:
+            events.popleft()
+        if not events:
+            del self._events[key]
+            return None
+        return events
+
+    def acquire(self, key: str) -> Optional[float]:
+        """Record one event for ``key`` if it is under the limit.
+
+        Returns None when the event was recorded, otherwise the seconds until
+        ``key`` may try again. Checking and recording happen under one lock,
+        so concurrent callers cannot all pass a check made before any of
+        them was counted.
+        """
+        if self.limit <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            events = self._prune(key, now)
+            if events is not None and len(events) >= self.limit:
+                self.rejected += 1
+                return max(events[0] + self.window - now, 0.0)
+            if events is None:
+                events = self._events[key] = deque()
+            events.append(now)
+            self._events.move_to_end(key)
+            while len(self._events) > self.max_keys:
+                self._events.popitem(last=False)
+            return None
+
+    def release(self, key: str):
+        """Take back the latest event recorded for ``key``"""
+        with self._lock:
+            events = self._events.get(key)
+            if events:
+                events.pop()
+
+    def reset(self, key: str):
+        with self._lock:
+            self._events.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"tracked_keys": len(self._events), "rejected": self.rejected}
+
+class SqliteWindowLimiter:
+    """Sliding-window counter kept in a SQLite file shared by the worker processes.
+
+    Same interface and semantics as ``SlidingWindowLimiter``, but every
+    process on the host counts against the same events, so the configured
+    limit holds regardless of how many workers serve the requests. Several
+    limiters can share one database under different names. The connection is
+    opened on first use, so a limiter created before a fork is still safe.
+    """
+
+    def __init__(self, name: str, limit: int, window: float, db_path: str = RATE_LIMIT_DB_PATH):
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.db_path = db_path
+        self.rejected = 0
+        self._hits = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rate_limit_events (
+                    limiter TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rate_limit_events_key ON rate_limit_events(limiter, key, at)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def acquire(self, key: str) -> Optional[float]:
+        """Record one event for ``key`` if it is under the limit; see ``SlidingWindowLimiter.acquire``"""
+        if self.limit <= 0:
+            return None
+        # Wall-clock time, since the events are compared across processes
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            # The write lock makes the check and the insert atomic across processes too
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                count, oldest = conn.execute(
+                    "SELECT COUNT(*), MIN(at) FROM rate_limit_events WHERE limiter = ? AND key = ? AND at > ?",
+                    (self.name, key, now - self.window)
+                ).fetchone()
+                if count >= self.limit:
+                    conn.execute("COMMIT")
+                    self.rejected += 1
+                    return max(oldest + self.window - now, 0.0)
+                conn.execute("INSERT INTO rate_limit_events (limiter, key, at) VALUES (?, ?, ?)",
+                             (self.name, key, now))
+                self._hits += 1
+                if self._hits % RATE_LIMIT_PURGE_INTERVAL == 0:
+                    conn.execute("DELETE FROM rate_limit_events WHERE limiter = ? AND at <= ?",
+                                 (self.name, now - self.window))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return None
+
+    def release(self, key: str):
+        """Take back the latest event recorded for ``key``"""
+        with self._lock:
+            self._connection().execute(
+                "DELETE FROM rate_limit_events WHERE rowid = (SELECT rowid FROM rate_limit_events "
+                "WHERE limiter = ? AND key = ? ORDER BY at DESC LIMIT 1)", (self.name, key)
+            )
+
+    def reset(self, key: str):
+        with self._lock:
+            self._connection().execute("DELETE FROM rate_limit_events WHERE limiter = ? AND key = ?", (self.name, key))
+
+    def stats(self) -> dict:
+        with self._lock:
+            tracked = self._connection().execute(
+                "SELECT COUNT(DISTINCT key) FROM rate_limit_events WHERE limiter = ? AND at > ?",
+                (self.name, time.time() - self.window)
+            ).fetchone()[0]
+            return {"tracked_keys": tracked, "rejected": self.rejected}
+
+def _limiter(name: str, limit: int, window: float):
+    if RATE_LIMIT_BACKEND == "sqlite":
+        return SqliteWindowLimiter(name, limit, window)
+    return SlidingWindowLimiter(limit, window)
+
+# Global instances
+login_ip_limiter = _limiter("login_ip", LOGIN_RATE_LIMIT_PER_IP, LOGIN_RATE_LIMIT_WINDOW)
+login_user_limiter = _limiter("login_user", LOGIN_RATE_LIMIT_PER_USER, LOGIN_RATE_LIMIT_WINDOW)
+
+def reserve_login_attempt(client_ip: str, username: str) -> Optional[float]:
+    """Count a login attempt before the password is checked.
+
+    Returns None when the attempt may go ahead, otherwise the seconds until
+    this IP or username may try again; a rejected attempt is not counted.
+    The attempt counts against the IP and, until ``record_login_success``
+    reports a success, as a failure against the username. Blocking on the
+    shared SQLite backend, so call it off the event loop.
+    """
+    retry_after = login_ip_limiter.acquire(client_ip)
+    if retry_after is not None:
+        return retry_after
+    retry_after = login_user_limiter.acquire(username.strip().lower())
+    if retry_after is not None:
+        login_ip_limiter.release(client_ip)
+    return retry_after
+
+def record_login_success(username: str):
+    """Reconcile a reserved attempt that succeeded: the username's failures are cleared"""
+    login_user_limiter.reset(username.strip().lower())
@@ -0,0 +1,216 @@
+import time
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+from fastapi import HTTPException, status
+
+from database import BufferFullError, ResumeRecord, ResumeStore, get_batch_writer, get_resume_store
+from dedup import get_dedup_index
+from analysis_cache import ANALYSIS_FIELDS, get_analysis_cache
+from cache import get_result_cache, make_key
+from events import RESUME_EVENTS_ENABLED, get_resume_events, start_resume_events
+from progress import publish_analysis
+from skills import canonicalize_skills, fold_skill, get_skill_index, index_resume
+from ranking import (VOCABULARY, catch_up_ranking_index, get_ranking_index, index_resumes_for_ranking,
+                     required_experience, skill_term_counts)
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Cache tag carried by searches without a skills filter; every insert can change them
+ANY_SKILL_TAG = "skill:*"
+
+def _skill_tag(skill: str) -> str:
+    return f"skill:{fold_skill(skill)}"
+
+def _email_tag(email: str) -> str:
+    return f"email:{email.strip().lower()}"
+
+# Highest resume id this process has indexed, for catching up after missed notifications
+_last_indexed_id = 0
+
+def _store() -> ResumeStore:
+    try:
+        return get_resume_store()
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+async def ingest_resumes(records: List[ResumeRecord]) -> dict:
+    """Store analyzed resumes through the batch writer.
+
+    Returns once the rows are committed; rows from concurrent calls share a
+    COPY. The analysis of each resume is also attached to its dedup entry so
+    later uploads of the same file can be answered with it directly, and to
+    the analysis cache under the record's ``analysis_key`` so the same text is
+    not sent to the LLM again. Cached lookups that the new rows could change
+    are invalidated, and clients streaming the progress of an upload of the
+    same file are sent the result.
+    """
+    try:
+        writer = get_batch_writer()
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+    try:
+        ids = await writer.submit([record.to_row() for record in records])
+    except BufferFullError as e:
+        logger.warning("Rejecting %s resumes: %s", len(records), e)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    except Exception as e:
+        logger.error("Failed to store %s resumes: %s", len(records), e)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Failed to store resumes")
+
+    await _index_stored([(resume_id, record.skills, record.experience_years, record.resume_text or "", record.email)
+                         for resume_id, record in zip(ids, records)], invalidate=True)
+    events = get_resume_events()
+    if events is not None:
+        try:
+            await events.publish(get_resume_store().pool, ids)
+        except Exception as e:
+            logger.error("Could not notify other workers of %s stored resumes: %s", len(ids), e)
+
+    dedup_index = get_dedup_index()
+    if dedup_index is not None:
+        for record in records:
+            if record.content_hash:
+                analysis = record.dict(exclude={"filename", "content_hash", "resume_text", "uploaded_at",
+                                                "analysis_key"})
+                await asyncio.to_thread(dedup_index.record_analysis, record.content_hash, analysis)
+
+    analysis_cache = get_analysis_cache()
+    if analysis_cache is not None:
+        for record in records:
+            if record.analysis_key:
+                analysis = record.dict(include=set(ANALYSIS_FIELDS))
+                await asyncio.to_thread(analysis_cache.put, record.analysis_key, analysis)
+
+    for resume_id, record in zip(ids, records):
+        await publish_analysis(resume_id, record.dict(exclude={"resume_text", "analysis_key"}))
+
+    return {"stored": len(ids), "ids": ids}
+
+async def _index_stored(rows: List[Tuple[int, List[str], Optional[float], str, Optional[str]]], invalidate: bool):
+    """Add stored ``(id, skills, experience_years, resume_text, email)`` rows to this process's indexes.
+
+    Cached lookups the rows could change are invalidated when ``invalidate``
+    is set; a shared cache only needs that once, from the storing process.
+    """
+    global _last_indexed_id
+    for resume_id, skills, *_ in rows:
+        index_resume(resume_id, skills)
+    await index_resumes_for_ranking([row[:4] for row in rows])
+    _last_indexed_id = max([_last_indexed_id] + [row[0] for row in rows])
+
+    if invalidate:
+        tags = {ANY_SKILL_TAG}
+        for _, skills, _, _, email in rows:
+            tags.update(_skill_tag(skill) for skill in skills)
+            if email:
+                tags.add(_email_tag(email))
+        await get_result_cache().invalidate(tags)
+
+async def apply_stored_elsewhere(ids: List[int]):
+    """Index resumes another worker process stored and drop what it made stale in a local cache"""
+    rows = await _store().get_index_rows(ids)
+    await _index_stored(rows, invalidate=not get_result_cache().shared)
+
+async def catch_up_stored_elsewhere():
+    """Index resumes stored while this process could not hear the other workers"""
+    ids = await _store().ids_after(_last_indexed_id)
+    for start in range(0, len(ids), 500):
+        await apply_stored_elsewhere(ids[start:start + 500])
+    await catch_up_ranking_index()
+    if ids:
+        logger.info("Caught up with %s resumes stored by other workers", len(ids))
+
+async def start_resume_sync():
+    """Keep this process's indexes in step with resumes stored by the other worker processes"""
+    global _last_indexed_id
+    if not RESUME_EVENTS_ENABLED:
+        return
+    _last_indexed_id = await _store().max_id()
+    start_resume_events(apply_stored_elsewhere, catch_up_stored_elsewhere)
+
+async def get_resume(resume_id: int) -> dict:
+    """Fetch one resume by id through the result cache"""
+    store = _store()
+    resume = await get_result_cache().get_or_load(
+        make_key("resume", {"id": resume_id}), lambda: store.get_by_id(resume_id)
+    )
+    if resume is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Resume not found")
+    return resume
+
+async def find_resumes_by_email(email: str) -> dict:
+    """Resumes for an email address through the result cache"""
+    store = _store()
+    email = email.strip().lower()
+    items = await get_result_cache().get_or_load(
+        make_key("email", {"email": email}), lambda: store.find_by_email(email), tags=[_email_tag(email)]
+    )
+    return {"items": items, "count": len(items)}
+
+async def search_resumes(skills: Optional[List[str]], match: str, min_experience: Optional[float],
+                         max_experience: Optional[float], q: Optional[str], limit: int,
+                         cursor: Optional[int]) -> dict:
+    """Run a candidate search through the result cache and shape the paginated response"""
+    if min_experience is not None and max_experience is not None and min_experience > max_experience:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="min_experience must not be greater than max_experience")
+    store = _store()
+
+    # Normalize so equivalent queries share a cache entry
+    skills = sorted(canonicalize_skills(skills or []))
+    text = " ".join(q.lower().split()) if q else None
+    params = {
+        "skills": skills or None,
+        "match": match if len(skills) > 1 else None,
+        "min_experience": float(min_experience) if min_experience is not None else None,
+        "max_experience": float(max_experience) if max_experience is not None else None,
+        "q": text or None,
+        "limit": limit,
+        "cursor": cursor
+    }
+
+    async def load() -> dict:
+        index = get_skill_index()
+        if skills and index is not None and min_experience is None and max_experience is None and not text:
+            # Skills-only filters are answered from the in-memory postings
+            ids, next_cursor = index.match(skills, match_all=match == "all", limit=limit, cursor=cursor)
+            items = await store.get_many(ids) if ids else []
+            return {"items": items, "count": len(items), "next_cursor": next_cursor}
+        items, next_cursor = await store.search(
+            skills=skills, match_all_skills=match == "all", min_experience=min_experience,
+            max_experience=max_experience, text=text, limit=limit, cursor=cursor
+        )
+        return {"items": items, "count": len(items), "next_cursor": next_cursor}
+
+    tags = [_skill_tag(skill) for skill in skills] or [ANY_SKILL_TAG]
+    return await get_result_cache().get_or_load(make_key("search", params), load, tags=tags)
+
+async def match_resumes(job_description: str, top_k: int, min_experience: Optional[float]) -> dict:
+    """Rank stored resumes against a job description by skill TF-IDF similarity and experience"""
+    index = get_ranking_index()
+    if index is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Ranking index is not ready")
+    store = _store()
+
+    started = time.perf_counter()
+    counts = await asyncio.to_thread(skill_term_counts, job_description)
+    if not counts:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="No known skills found in the job description")
+    required_years = required_experience(job_description)
+    ranked = await asyncio.to_thread(index.rank, counts, top_k, min_experience, required_years)
+    ranked_ms = (time.perf_counter() - started) * 1000
+
+    rows = {row["id"]: row for row in await store.get_many([resume_id for resume_id, _ in ranked])} if ranked else {}
+    items = [dict(rows[resume_id], score=round(score, 4)) for resume_id, score in ranked if resume_id in rows]
+    return {
+        "items": items,
+        "count": len(items),
+        "skills": [VOCABULARY[column] for column in sorted(counts, key=counts.get, reverse=True)],
+        "required_experience": required_years,
+        "candidates": index.count,
+        "rank_ms": round(ranked_ms, 3)
+    }
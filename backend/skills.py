@@ -0,0 +1,373 @@
+import os
+import re
+import time
+import heapq
+import asyncio
+import logging
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Skill index configuration
+SKILL_INDEX_ENABLED = os.getenv("SKILL_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+# Resume ids per compressed postings block; block maxima act as skip pointers
+POSTINGS_BLOCK_SIZE = 128
+
+# Canonical skill names. Text matching is case-insensitive on whole words, so
+# very short or ambiguous names ("C", "R", "Go") are deliberately left out.
+SKILLS = [
+    "Python", "Java", "JavaScript", "TypeScript", "C++", "C#", "Golang", "Rust", "Ruby", "PHP", "Kotlin",
+    "Swift", "Objective-C", "Scala", "Perl", "MATLAB", "Dart", "Elixir", "Haskell", "Lua", "Bash",
+    "PowerShell", "SQL", "NoSQL", "GraphQL", "HTML", "CSS", "Sass",
+    "React", "React Native", "Angular", "Vue.js", "Svelte", "Next.js", "Node.js", "Express", "jQuery",
+    "Redux", "Tailwind CSS", "Bootstrap", "Django", "Flask", "FastAPI", "Spring", "Spring Boot",
+    "Ruby on Rails", "Laravel", ".NET", "ASP.NET", "Flutter",
+    "PostgreSQL", "MySQL", "SQLite", "MongoDB", "Redis", "Cassandra", "DynamoDB", "Elasticsearch",
+    "Oracle", "SQL Server", "MariaDB", "Snowflake", "BigQuery", "Neo4j",
+    "AWS", "Azure", "Google Cloud", "Docker", "Kubernetes", "Terraform", "Ansible", "Jenkins",
+    "GitHub Actions", "GitLab CI", "CI/CD", "Linux", "Nginx", "Helm", "Prometheus", "Grafana",
+    "Kafka", "RabbitMQ", "Celery", "Airflow", "Spark", "Hadoop", "dbt", "ETL",
+    "Git", "REST", "gRPC", "Microservices", "Serverless",
+    "Machine Learning", "Deep Learning", "NLP", "Computer Vision", "TensorFlow", "PyTorch", "Keras",
+    "scikit-learn", "Pandas", "NumPy", "SciPy", "OpenCV", "LLM", "Data Analysis", "Data Science",
+    "Statistics", "Tableau", "Power BI", "Excel",
+    "Agile", "Scrum", "Kanban", "Jira", "TDD", "Unit Testing", "Selenium", "Cypress", "Jest", "Pytest",
+    "Figma", "UI/UX", "Project Management", "Product Management",
+]
+
+# Alternative spellings mapped to their canonical name. Variants that only
+# differ in case, spacing or punctuation ("NodeJS", "node js") need no entry.
+SYNONYMS = {
+    "postgres": "PostgreSQL", "psql": "PostgreSQL", "pgsql": "PostgreSQL",
+    "go": "Golang",
+    "js": "JavaScript", "ecmascript": "JavaScript", "es6": "JavaScript",
+    "ts": "TypeScript",
+    "cpp": "C++", "csharp": "C#", "c sharp": "C#", "objc": "Objective-C",
+    "shell scripting": "Bash", "bash scripting": "Bash",
+    "html5": "HTML", "css3": "CSS", "scss": "Sass",
+    "reactjs": "React", "vue": "Vue.js", "angularjs": "Angular", "node": "Node.js", "expressjs": "Express",
+    "tailwind": "Tailwind CSS", "rails": "Ruby on Rails", "ror": "Ruby on Rails", "dotnet": ".NET",
+    "mongo": "MongoDB", "sqlite3": "SQLite", "mssql": "SQL Server", "microsoft sql server": "SQL Server",
+    "amazon web services": "AWS", "microsoft azure": "Azure", "gcp": "Google Cloud",
+    "google cloud platform": "Google Cloud", "k8s": "Kubernetes", "gitlab ci/cd": "GitLab CI",
+    "apache kafka": "Kafka", "apache spark": "Spark", "pyspark": "Spark", "apache airflow": "Airflow",
+    "restful": "REST", "rest api": "REST", "restful api": "REST",
+    "ml": "Machine Learning", "natural language processing": "NLP", "large language models": "LLM",
+    "llms": "LLM", "sklearn": "scikit-learn", "torch": "PyTorch",
+    "ms excel": "Excel", "microsoft excel": "Excel", "test driven development": "TDD",
+    "unit tests": "Unit Testing", "ux/ui": "UI/UX",
+}
+
+# Synonyms too ambiguous to look for in free text; they still canonicalize
+# explicit skill lists
+AMBIGUOUS_SYNONYMS = {"go", "js", "ts", "ml", "node", "vue", "rails", "torch", "ror"}
+
+FOLD_RE = re.compile(r"[^0-9a-z+#]")
+
+def fold_skill(name: str) -> str:
+    """Case and punctuation folded key of a skill name ("Node.js" -> "nodejs")"""
+    return FOLD_RE.sub("", unicodedata.normalize("NFKC", name).lower())
+
+def _build_canonical() -> Dict[str, str]:
+    canonical = {fold_skill(skill): skill for skill in SKILLS}
+    for alias, skill in SYNONYMS.items():
+        canonical.setdefault(fold_skill(alias), skill)
+    return canonical
+
+CANONICAL_SKILLS = _build_canonical()
+
+def canonicalize_skill(name: str) -> str:
+    """Canonical name of a skill; unknown skills keep their spelling with whitespace collapsed"""
+    return CANONICAL_SKILLS.get(fold_skill(name)) or " ".join(name.split())
+
+def canonicalize_skills(names: Iterable[str]) -> List[str]:
+    """Canonicalize a skill list, dropping blanks and duplicates but keeping order"""
+    skills = {}
+    for name in names:
+        skill = canonicalize_skill(name)
+        if skill:
+            skills.setdefault(fold_skill(skill), skill)
+    return list(skills.values())
+
+def text_aliases() -> Dict[str, str]:
+    """Synonyms that are safe to match in resume text"""
+    return {alias: skill for alias, skill in SYNONYMS.items() if alias not in AMBIGUOUS_SYNONYMS}
+
+# Smallest array type that holds every gap in a block
+GAP_TYPECODES = [(code, 256 ** array(code).itemsize) for code in ("B", "H", "I", "Q")]
+
+def _encode_block(ids: List[int]) -> bytes:
+    """Pack ascending ids as gaps from the first id, one fixed width per block"""
+    gaps = [b - a for a, b in zip(ids, ids[1:])]
+    largest = max(gaps, default=0)
+    code = next(code for code, limit in GAP_TYPECODES if largest < limit)
+    return code.encode() + array(code, gaps).tobytes()
+
+def _decode_block(first: int, data: bytes) -> List[int]:
+    return list(accumulate(array(chr(data[0]), data[1:]), initial=first))
+
+class PostingList:
+    """Sorted resume ids compressed into blocks of gaps.
+
+    Ids normally arrive in ascending order and go to an uncompressed tail that
+    is sealed into a block every POSTINGS_BLOCK_SIZE ids. A block stores the
+    gaps between its ids at the narrowest byte width that fits them; its first
+    and last ids are kept alongside as skip pointers, so lookups only decode
+    the blocks that overlap the ids they need.
+    """
+
+    __slots__ = ("_blocks", "_block_min", "_block_max", "_tail", "_count", "_decoded")
+
+    def __init__(self):
+        self._blocks: List[bytes] = []
+        self._block_min: List[int] = []
+        self._block_max: List[int] = []
+        self._tail: List[int] = []
+        self._count = 0
+        # The last decoded block; consecutive lookups tend to hit it again
+        self._decoded: Tuple[int, List[int]] = (-1, [])
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _block(self, index: int) -> List[int]:
+        if index == len(self._blocks):
+            return self._tail
+        if self._decoded[0] != index:
+            self._decoded = (index, _decode_block(self._block_min[index], self._blocks[index]))
+        return self._decoded[1]
+
+    def _seal(self, index: int, ids: List[int]):
+        self._blocks[index] = _encode_block(ids)
+        self._block_min[index] = ids[0]
+        self._block_max[index] = ids[-1]
+        self._decoded = (-1, [])
+
+    def add(self, resume_id: int) -> bool:
+        """Add an id; returns False if it was already present"""
+        last = self._tail[-1] if self._tail else (self._block_max[-1] if self._block_max else None)
+        if last is None or resume_id > last:
+            self._tail.append(resume_id)
+            if len(self._tail) >= POSTINGS_BLOCK_SIZE:
+                self._blocks.append(b"")
+                self._block_min.append(0)
+                self._block_max.append(0)
+                self._seal(len(self._blocks) - 1, self._tail)
+                self._tail = []
+            self._count += 1
+            return True
+
+        # Out of order: rewrite the block the id falls into
+        index = bisect_left(self._block_max, resume_id)
+        ids = list(self._block(index))
+        position = bisect_left(ids, resume_id)
+        if position < len(ids) and ids[position] == resume_id:
+            return False
+        ids.insert(position, resume_id)
+        if index == len(self._blocks):
+            self._tail = ids
+        else:
+            self._seal(index, ids)
+        self._count += 1
+        return True
+
+    def __contains__(self, resume_id: int) -> bool:
+        ids = self._block(bisect_left(self._block_max, resume_id))
+        position = bisect_left(ids, resume_id)
+        return position < len(ids) and ids[position] == resume_id
+
+    def chunks(self, below: Optional[int] = None) -> Iterator[List[int]]:
+        """Ascending runs of ids, newest run first, only ids smaller than ``below`` if given"""
+        start = len(self._blocks) if below is None else bisect_left(self._block_max, below)
+        for index in range(min(start, len(self._blocks)), -1, -1):
+            ids = self._block(index)
+            if below is not None and ids and ids[-1] >= below:
+                ids = ids[:bisect_left(ids, below)]
+            if ids:
+                yield ids
+
+    def descending(self, below: Optional[int] = None) -> Iterator[int]:
+        """Ids in descending order, only those smaller than ``below`` if given"""
+        for ids in self.chunks(below):
+            yield from reversed(ids)
+
+    def between(self, low: int, high: int) -> List[int]:
+        """Ids from ``low`` to ``high`` inclusive, ascending"""
+        found: List[int] = []
+        for index in range(bisect_left(self._block_max, low), len(self._blocks) + 1):
+            if index < len(self._blocks) and self._block_min[index] > high:
+                break
+            ids = self._block(index)
+            found.extend(ids[bisect_left(ids, low):bisect_right(ids, high)])
+        return found
+
+    def nbytes(self) -> int:
+        """Approximate payload size: compressed blocks, skip pointers and the raw tail"""
+        return sum(len(block) for block in self._blocks) + 16 * len(self._blocks) + 8 * len(self._tail)
+
+class SkillIndex:
+    """In-memory inverted index from skill to the resumes that list it.
+
+    Skills are keyed by their folded canonical name and assigned small integer
+    ids; each id owns a PostingList of resume ids. ``match`` answers all-of
+    queries by intersecting the shortest postings list with the others block
+    by block, newest first, and any-of queries by merging the lists, so
+    neither touches the resumes table.
+    """
+
+    def __init__(self):
+        self._skill_ids: Dict[str, int] = {}
+        self._postings: List[PostingList] = []
+        self._resumes = 0
+        # Inserts that arrive while the index is loaded from the database
+        self._pending: Optional[List[Tuple[int, List[str]]]] = None
+        self.ready = False
+
+    def _skill_id(self, skill: str, create: bool = False) -> Optional[int]:
+        key = fold_skill(canonicalize_skill(skill))
+        skill_id = self._skill_ids.get(key)
+        if skill_id is None and create and key:
+            skill_id = self._skill_ids[key] = len(self._postings)
+            self._postings.append(PostingList())
+        return skill_id
+
+    def _add(self, resume_id: int, skills: Iterable[str]):
+        added = False
+        for skill in skills or []:
+            skill_id = self._skill_id(skill, create=True)
+            if skill_id is not None and self._postings[skill_id].add(resume_id):
+                added = True
+        if added:
+            self._resumes += 1
+
+    def add(self, resume_id: int, skills: Iterable[str]):
+        """Index one stored resume"""
+        if self._pending is not None:
+            self._pending.append((resume_id, list(skills or [])))
+        else:
+            self._add(resume_id, skills)
+
+    async def load(self, rows: AsyncIterator[Tuple[int, List[str]]]):
+        """Build the index from ``(id, skills)`` rows in ascending id order"""
+        self._pending = []
+        try:
+            async for resume_id, skills in rows:
+                self._add(resume_id, skills)
+        finally:
+            pending, self._pending = self._pending, None
+            for resume_id, skills in pending:
+                self._add(resume_id, skills)
+        self.ready = True
+
+    def match(self, skills: List[str], match_all: bool = True, limit: int = 20,
+              cursor: Optional[int] = None) -> Tuple[List[int], Optional[int]]:
+        """Resume ids with all (or any) of ``skills``, newest first, keyset paginated like ResumeStore.search"""
+        skill_ids = {self._skill_id(skill) for skill in skills}
+        if match_all and None in skill_ids:
+            return [], None
+        postings = sorted((self._postings[skill_id] for skill_id in skill_ids if skill_id is not None), key=len)
+        if not postings:
+            return [], None
+
+        ids: List[int] = []
+        if match_all:
+            # Intersect one block of the shortest list at a time with the
+            # overlapping ranges of the others, newest block first
+            shortest, others = postings[0], postings[1:]
+            for chunk in shortest.chunks(cursor):
+                ids.extend(_intersect(chunk, others))
+                if len(ids) > limit:
+                    break
+        else:
+            merged = heapq.merge(*(posting.descending(cursor) for posting in postings), reverse=True)
+            for resume_id, previous in _with_previous(merged):
+                if resume_id != previous:
+                    ids.append(resume_id)
+                    if len(ids) > limit:
+                        break
+        next_cursor = ids[limit - 1] if len(ids) > limit else None
+        return ids[:limit], next_cursor
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "skills": len(self._postings),
+            "resumes": self._resumes,
+            "postings": sum(len(posting) for posting in self._postings),
+            "postings_bytes": sum(posting.nbytes() for posting in self._postings)
+        }
+
+def _intersect(chunk: List[int], others: List[PostingList]) -> List[int]:
+    """Ids of the ascending ``chunk`` present in every other list, descending"""
+    common = set(chunk)
+    for other in others:
+        common.intersection_update(other.between(chunk[0], chunk[-1]))
+        if not common:
+            return []
+    return sorted(common, reverse=True)
+
+def _with_previous(values: Iterable[int]) -> Iterator[Tuple[int, Optional[int]]]:
+    previous = None
+    for value in values:
+        yield value, previous
+        previous = value
+
+# Global instance, loaded in the background by the app startup hook
+skill_index: Optional[SkillIndex] = None
+_load_task: Optional[asyncio.Task] = None
+
+async def _load_skill_index(index: SkillIndex, rows: AsyncIterator[Tuple[int, List[str]]]):
+    global skill_index
+    started = time.perf_counter()
+    try:
+        await index.load(rows)
+        logger.info("Skill index loaded in %.2fs: %s", time.perf_counter() - started, index.stats())
+    except Exception as e:
+        skill_index = None
+        logger.error("Could not load the skill index: %s", e)
+
+def start_skill_index(rows: AsyncIterator[Tuple[int, List[str]]]):
+    """Start building the skill index from the stored resumes.
+
+    Searches fall back to SQL until the load finishes; resumes stored in the
+    meantime are queued and indexed right after it.
+    """
+    global skill_index, _load_task
+    if not SKILL_INDEX_ENABLED or skill_index is not None:
+        return
+    skill_index = SkillIndex()
+    _load_task = asyncio.create_task(_load_skill_index(skill_index, rows))
+
+async def close_skill_index():
+    """Stop a pending load and drop the skill index"""
+    global skill_index, _load_task
+    if _load_task is not None:
+        _load_task.cancel()
+        try:
+            await _load_task
+        except asyncio.CancelledError:
+            pass
+        _load_task = None
+    skill_index = None
+
+def get_skill_index() -> Optional[SkillIndex]:
+    """Get the skill index, or None until it is loaded"""
+    if skill_index is None or not skill_index.ready:
+        return None
+    return skill_index
+
+def index_resume(resume_id: int, skills: Iterable[str]):
+    """Add a newly stored resume to the skill index, if there is one"""
+    if skill_index is not None:
+        skill_index.add(resume_id, skills)
+
+def skill_index_stats() -> Optional[dict]:
+    return skill_index.stats() if skill_index is not None else None
@@ -0,0 +1,73 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Optional
+from dotenv import load_dotenv
+
+from auth import load_password_hasher
+from storage import check_storage_backend, get_storage
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Fast start: begin accepting requests before the storage client is built, and build it in the background
+FAST_START = os.getenv("FAST_START", "false").lower() in ("1", "true", "yes")
+
+# Background warm-up state of this process
+_warm_up_task: Optional[asyncio.Task] = None
+_warm_up_seconds: Optional[float] = None
+_warm_up_errors = 0
+
+async def warm_up():
+    """Build the clients the first requests would otherwise wait for.
+
+    Each step runs in a thread, so requests keep being served meanwhile; a
+    request that needs the Drive client first simply builds it itself,
+    under the same lock.
+    """
+    global _warm_up_seconds, _warm_up_errors
+    started = time.perf_counter()
+    for name, step in (("storage backend", lambda: get_storage().warm_up()), ("password hasher", load_password_hasher)):
+        try:
+            await asyncio.to_thread(step)
+        except Exception as e:
+            _warm_up_errors += 1
+            logger.error("Could not warm up the %s: %s", name, e)
+    _warm_up_seconds = time.perf_counter() - started
+    logger.info("Warm-up finished in %.2fs", _warm_up_seconds)
+
+def start_warm_up():
+    """Initialize the storage backend now, or schedule the background warm-up in fast-start mode"""
+    global _warm_up_task
+    # A misconfigured backend stops the server here rather than failing every upload later
+    check_storage_backend()
+    if FAST_START:
+        # Runs once the event loop is free, i.e. after startup, when the server accepts connections
+        if _warm_up_task is None:
+            _warm_up_task = asyncio.create_task(warm_up())
+        return
+    storage = get_storage()
+    logger.info("Starting up and initializing the %s storage backend...", storage.name)
+    try:
+        storage.warm_up()
+        logger.info("Storage backend initialized on startup.")
+    except Exception as e:
+        logger.error("Could not initialize the %s storage backend on startup: %s", storage.name, e)
+
+async def stop_warm_up():
+    global _warm_up_task
+    if _warm_up_task is not None:
+        _warm_up_task.cancel()
+        await asyncio.gather(_warm_up_task, return_exceptions=True)
+        _warm_up_task = None
+
+def startup_stats() -> dict:
+    return {
+        "fast_start": FAST_START,
+        "warmed_up": _warm_up_seconds is not None if FAST_START else True,
+        "warm_up_seconds": round(_warm_up_seconds, 3) if _warm_up_seconds is not None else None,
+        "warm_up_errors": _warm_up_errors
+    }
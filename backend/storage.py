@@ -0,0 +1,295 @@
+import os
+import re
+import uuid
+import shutil
+import asyncio
+import importlib.util
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Optional
+from fastapi import HTTPException, status
+from fastapi.responses import FileResponse, RedirectResponse, Response
+from dotenv import load_dotenv
+
+from dedup import HASH_CHUNK_SIZE, hash_file
+from google_drive import get_drive_service
+from metrics import UPLOAD_STAGE_SECONDS, timed
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+_basedir = os.path.abspath(os.path.dirname(__file__))
+
+# Where uploaded resumes are kept: "drive" (Google Drive), "local" (a content-addressed
+# directory on this host) or "s3" (any S3-compatible object store, e.g. MinIO)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "drive").lower()
+STORAGE_BACKENDS = ("drive", "local", "s3")
+# Base URL under which n8n reaches this API; download links in webhooks are built from it
+STORAGE_PUBLIC_URL = os.getenv("STORAGE_PUBLIC_URL", "http://backend:8000").rstrip("/")
+STORAGE_LOCAL_DIR = os.getenv("STORAGE_LOCAL_DIR", os.path.join(_basedir, "uploads", "storage"))
+# Internal location under which a front proxy (nginx) serves STORAGE_LOCAL_DIR, e.g. /protected-files/.
+# When set, downloads are answered with X-Accel-Redirect and the proxy sends the file with sendfile.
+STORAGE_ACCEL_REDIRECT_PREFIX = os.getenv("STORAGE_ACCEL_REDIRECT_PREFIX", "")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_BUCKET = os.getenv("S3_BUCKET", "resumes")
+S3_KEY_PREFIX = os.getenv("S3_KEY_PREFIX", "resumes/")
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID") or None
+S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY") or None
+# Lifetime of the presigned URLs downloads are redirected to
+S3_PRESIGN_TTL = int(os.getenv("S3_PRESIGN_TTL", "900"))
+
+# Content-addressed backends name files by their SHA-256 digest
+CONTENT_ID = re.compile(r"^[0-9a-f]{64}$")
+
+def is_content_id(file_id: str) -> bool:
+    return bool(CONTENT_ID.match(file_id or ""))
+
+def download_url(file_id: str) -> str:
+    return f"{STORAGE_PUBLIC_URL}/files/{file_id}"
+
+class StorageBackend(ABC):
+    """Where the API puts uploaded resumes for n8n to read back.
+
+    ``store`` returns a file description shaped like the Drive one
+    (``file_id``, ``web_view_link``, ``size``, ...) plus ``storage`` and, for
+    backends served through this API, ``download_url``. ``path`` may name a
+    file on local disk holding the same bytes as ``file_obj``, which lets a
+    backend link or copy it in the kernel instead of reading it.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self.stored = 0
+        self.reused = 0
+        self.bytes_stored = 0
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        """Create clients and directories ahead of the first upload"""
+
+    @abstractmethod
+    async def store(self, file_obj: BinaryIO, filename: str, content_type: str = "application/pdf",
+                    content_hash: Optional[str] = None, path: Optional[str] = None,
+                    timeout: Optional[float] = None) -> dict:
+        """Store an upload and describe the stored file"""
+
+    def _count(self, size: int, reused: bool):
+        with self._lock:
+            if reused:
+                self.reused += 1
+            else:
+                self.stored += 1
+                self.bytes_stored += size
+
+    def _describe(self, content_hash: str, filename: str, size: int) -> dict:
+        url = download_url(content_hash)
+        return {
+            'file_id': content_hash,
+            'filename': filename,
+            'web_view_link': url,
+            'web_content_link': url,
+            'download_url': url,
+            'size': str(size),
+            'storage': self.name
+        }
+
+    @abstractmethod
+    async def download(self, file_id: str) -> Response:
+        """Response that delivers a stored file"""
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "stored": self.stored,
+            "reused": self.reused,
+            "bytes_stored": self.bytes_stored
+        }
+
+class DriveStorage(StorageBackend):
+    """Google Drive, through the Drive worker pool"""
+
+    name = "drive"
+
+    def warm_up(self):
+        get_drive_service()
+
+    async def store(self, file_obj: BinaryIO, filename: str, content_type: str = "application/pdf",
+                    content_hash: Optional[str] = None, path: Optional[str] = None,
+                    timeout: Optional[float] = None) -> dict:
+        file_info = await get_drive_service().upload_stream_async(file_obj, filename=filename, mime_type=content_type,
+                                                                  timeout=timeout)
+        self._count(int(file_info.get('size') or 0), reused=False)
+        return {**file_info, 'storage': self.name}
+
+    async def download(self, file_id: str) -> Response:
+        # Drive serves its own files; send the caller to the Drive download link
+        file_info = await get_drive_service().get_file_info_async(file_id)
+        if file_info is None or not file_info.get('web_content_link'):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+        return RedirectResponse(file_info['web_content_link'])
+
+class LocalStorage(StorageBackend):
+    """Content-addressed directory: each file lives at ``<root>/<ab>/<sha256>``.
+
+    Identical uploads share one file, and a stored file is never rewritten,
+    so it can be served by a proxy without coordination. A staged file on
+    the same filesystem is hard-linked in; otherwise it is copied with
+    ``shutil.copyfile``, which uses the kernel's copy_file_range/sendfile.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str = STORAGE_LOCAL_DIR):
+        super().__init__()
+        self.root = root
+
+    def warm_up(self):
+        os.makedirs(self.root, exist_ok=True)
+
+    def path_of(self, content_hash: str) -> str:
+        return os.path.join(self.root, content_hash[:2], content_hash)
+
+    def relative_path(self, content_hash: str) -> str:
+        return f"{content_hash[:2]}/{content_hash}"
+
+    def _store(self, file_obj: BinaryIO, content_hash: Optional[str], path: Optional[str]):
+        content_hash = content_hash or hash_file(file_obj)
+        target = self.path_of(content_hash)
+        if os.path.exists(target):
+            return content_hash, os.path.getsize(target), True
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+        try:
+            if path is not None:
+                try:
+                    os.link(path, temp_path)
+                except OSError:
+                    shutil.copyfile(path, temp_path)
+            else:
+                file_obj.seek(0)
+                with open(temp_path, "wb") as out:
+                    shutil.copyfileobj(file_obj, out, HASH_CHUNK_SIZE)
+            os.replace(temp_path, target)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return content_hash, os.path.getsize(target), False
+
+    @timed(UPLOAD_STAGE_SECONDS, "local_store")
+    async def store(self, file_obj: BinaryIO, filename: str, content_type: str = "application/pdf",
+                    content_hash: Optional[str] = None, path: Optional[str] = None,
+                    timeout: Optional[float] = None) -> dict:
+        content_hash, size, reused = await asyncio.to_thread(self._store, file_obj, content_hash, path)
+        self._count(size, reused)
+        return self._describe(content_hash, filename, size)
+
+    async def download(self, file_id: str) -> Response:
+        if not is_content_id(file_id) or not os.path.exists(self.path_of(file_id)):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+        filename = f"{file_id}.pdf"
+        if STORAGE_ACCEL_REDIRECT_PREFIX:
+            # The proxy serves the file itself, straight from the page cache with sendfile
+            return Response(headers={
+                "X-Accel-Redirect": STORAGE_ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + self.relative_path(file_id),
+                "Content-Type": "application/pdf",
+                "Content-Disposition": f'attachment; filename="{filename}"'
+            })
+        return FileResponse(self.path_of(file_id), media_type="application/pdf", filename=filename)
+
+class S3Storage(StorageBackend):
+    """S3-compatible object store with content-addressed keys.
+
+    An object that already exists is not uploaded again. Downloads are
+    redirected to a presigned URL, so the bytes never pass through the API.
+    """
+
+    name = "s3"
+
+    def __init__(self, bucket: str = S3_BUCKET, prefix: str = S3_KEY_PREFIX):
+        super().__init__()
+        import boto3  # optional dependency, only needed for STORAGE_BACKEND=s3
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=S3_ENDPOINT_URL, region_name=S3_REGION,
+                                   aws_access_key_id=S3_ACCESS_KEY_ID, aws_secret_access_key=S3_SECRET_ACCESS_KEY)
+
+    def key_of(self, content_hash: str) -> str:
+        return f"{self.prefix}{content_hash[:2]}/{content_hash}"
+
+    def _exists(self, key: str) -> Optional[int]:
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)["ContentLength"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def _store(self, file_obj: BinaryIO, content_type: str, content_hash: Optional[str], path: Optional[str]):
+        content_hash = content_hash or hash_file(file_obj)
+        key = self.key_of(content_hash)
+        size = self._exists(key)
+        if size is not None:
+            return content_hash, size, True
+        extra_args = {"ContentType": content_type}
+        if path is not None:
+            self.client.upload_file(path, self.bucket, key, ExtraArgs=extra_args)
+        else:
+            file_obj.seek(0)
+            self.client.upload_fileobj(file_obj, self.bucket, key, ExtraArgs=extra_args)
+        return content_hash, self._exists(key) or 0, False
+
+    @timed(UPLOAD_STAGE_SECONDS, "s3_upload")
+    async def store(self, file_obj: BinaryIO, filename: str, content_type: str = "application/pdf",
+                    content_hash: Optional[str] = None, path: Optional[str] = None,
+                    timeout: Optional[float] = None) -> dict:
+        content_hash, size, reused = await asyncio.wait_for(
+            asyncio.to_thread(self._store, file_obj, content_type, content_hash, path), timeout)
+        self._count(size, reused)
+        return self._describe(content_hash, filename, size)
+
+    def _presigned_url(self, content_hash: str) -> Optional[str]:
+        """A time-limited GET URL for the object, or None if it does not exist"""
+        key = self.key_of(content_hash)
+        if self._exists(key) is None:
+            return None
+        return self.client.generate_presigned_url("get_object", Params={"Bucket": self.bucket, "Key": key},
+                                                  ExpiresIn=S3_PRESIGN_TTL)
+
+    async def download(self, file_id: str) -> Response:
+        url = await asyncio.to_thread(self._presigned_url, file_id) if is_content_id(file_id) else None
+        if url is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+        return RedirectResponse(url)
+
+# Global instance
+storage: Optional[StorageBackend] = None
+
+def check_storage_backend():
+    """Raise RuntimeError if the backend selected by STORAGE_BACKEND cannot be built"""
+    if STORAGE_BACKEND not in STORAGE_BACKENDS:
+        raise RuntimeError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}; expected one of {', '.join(STORAGE_BACKENDS)}")
+    if STORAGE_BACKEND == "s3" and importlib.util.find_spec("boto3") is None:
+        raise RuntimeError("STORAGE_BACKEND=s3 needs the boto3 package (pip install boto3)")
+
+def get_storage() -> StorageBackend:
+    """Get or create the storage backend selected by STORAGE_BACKEND"""
+    global storage
+    if storage is None:
+        check_storage_backend()
+        if STORAGE_BACKEND == "local":
+            storage = LocalStorage()
+            logger.info("Storing uploads in %s", STORAGE_LOCAL_DIR)
+        elif STORAGE_BACKEND == "s3":
+            storage = S3Storage()
+            logger.info("Storing uploads in S3 bucket %s", S3_BUCKET)
+        else:
+            storage = DriveStorage()
+    return storage
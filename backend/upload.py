@@ -1,12 +1,20 @@
 import os
+import asyncio
 import logging
 from datetime import datetime
+from typing import List, Optional
 from fastapi import UploadFile, HTTPException, status
 from fastapi.responses import JSONResponse
-import httpx
 from dotenv import load_dotenv
 
-from google_drive import GoogleDriveService
+from storage import download_url, get_storage
+from jobs import Job, JobQueue, QueueFullError
+from dedup import DedupIndex, get_dedup_index
+from pdf_extract import get_pdf_extractor
+from field_extractor import split_by_confidence
+from outbox import get_webhook_outbox
+from validation import precheck_pdf, validate_upload
+from metrics import UPLOAD_SIZE_BYTES, UPLOAD_STAGE_SECONDS, UPLOADS_IN_FLIGHT, in_flight, timed
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -15,74 +23,213 @@ load_dotenv()
 
 # Configuration
 N8N_WEBHOOK_URL = os.getenv("N8N_WEBHOOK_URL", "https://samvodmask.app.n8n.cloud/webhook-test/resume-upload")
+N8N_BATCH_WEBHOOK_URL = os.getenv("N8N_BATCH_WEBHOOK_URL", N8N_WEBHOOK_URL)
 ALLOWED_EXTENSIONS = {".pdf"}
 
-async def trigger_n8n_webhook(drive_file_info: dict, original_filename: str) -> dict:
-    """Trigger n8n webhook with Google Drive file information."""
-    logger.info(f"Triggering n8n webhook for file: {original_filename}")
+def webhook_file_entry(drive_file_info: dict, original_filename: str, content_hash: Optional[str] = None,
+                       extracted: Optional[dict] = None) -> dict:
+    """Build the webhook description of one uploaded file.
+
+    ``storage_backend`` says where the file was stored; for backends other
+    than Drive the workflow fetches it from ``download_url`` rather than by
+    ``drive_file_id``.
+
+    When the backend already extracted the PDF text it is included as
+    ``pdf_text``, and the workflow skips the Drive download and pdf-parse.
+    Locally extracted fields at or above FIELD_CONFIDENCE_THRESHOLD are sent
+    as ``local_fields``; only the fields named in ``llm_fields`` are left for
+    OpenAI, and the workflow skips the OpenAI call when that list is empty.
+    """
+    entry = {
+        "drive_file_id": drive_file_info.get('file_id'),
+        "drive_link": drive_file_info.get('web_view_link'),
+        "original_filename": original_filename,
+        "uploaded_at": datetime.utcnow().isoformat(),
+        "file_size": drive_file_info.get('size'),
+        "content_hash": content_hash,
+        "storage_backend": drive_file_info.get('storage', 'drive'),
+        "download_url": drive_file_info.get('download_url')
+    }
+    if extracted is not None:
+        entry["pdf_text"] = extracted["text"]
+        entry["page_count"] = extracted["page_count"]
+        entry["text_truncated"] = extracted["truncated"]
+        if extracted.get("fields"):
+            entry["local_fields"], entry["llm_fields"] = split_by_confidence(extracted["fields"])
+            entry["field_confidence"] = {name: field["confidence"] for name, field in extracted["fields"].items()}
+    return entry
+
+async def _queue_webhook(url: str, payload: dict, message: str) -> dict:
+    """Record the webhook in the durable outbox; the outbox worker delivers it with retries"""
+    # Payloads carry resume text, so they are only logged at DEBUG and formatted only then
+    logger.debug("Webhook payload: %s", payload)
+    delivery_id = await get_webhook_outbox().enqueue(url, payload)
+    return {"status": "queued", "message": message, "delivery_id": delivery_id}
+
+async def trigger_n8n_webhook(drive_file_info: dict, original_filename: str, content_hash: Optional[str] = None,
+                              extracted: Optional[dict] = None) -> dict:
+    """Queue the n8n webhook with the stored file's information."""
+    logger.info("Triggering n8n webhook for file: %s", original_filename)
+    payload = webhook_file_entry(drive_file_info, original_filename, content_hash, extracted)
+    return await _queue_webhook(N8N_WEBHOOK_URL, payload, "File processing will start via the stored file link")
+
+async def trigger_n8n_batch_webhook(batch_id: str, files: List[dict]) -> dict:
+    """Queue one n8n webhook for a batch of uploaded files.
+
+    ``files`` holds ``webhook_file_entry`` dicts; the payload carries them
+    under ``files`` and the workflow fans them out per resume.
+    """
+    logger.info("Triggering n8n batch webhook for batch %s (%d files)", batch_id, len(files))
+    payload = {
+        "batch_id": batch_id,
+        "files": files
+    }
+    return await _queue_webhook(N8N_BATCH_WEBHOOK_URL, payload, f"Processing will start for {len(files)} files")
+
+@in_flight(UPLOADS_IN_FLIGHT, "job")
+@timed(UPLOAD_STAGE_SECONDS, "job")
+async def process_upload_job(job: Job, staged_path: str):
+    """Job handler: push a staged upload to the storage backend and queue the n8n webhook.
+
+    Steps that already succeeded are recorded on the job and skipped on retry,
+    so a failed attempt never stores the file twice. The webhook itself
+    is delivered by the outbox, so a slow or unavailable n8n does not hold up
+    or fail the job.
+    """
+    # Text extraction runs on the process pool while the file is stored
+    extraction = None
+    pdf_extractor = get_pdf_extractor()
+    if pdf_extractor is not None:
+        extraction = asyncio.create_task(pdf_extractor.extract(staged_path, job.filename))
     try:
-        async with httpx.AsyncClient() as client:
-            payload = {
-                "drive_file_id": drive_file_info.get('file_id'),
-                "drive_link": drive_file_info.get('web_view_link'),
-                "original_filename": original_filename,
-                "uploaded_at": datetime.utcnow().isoformat(),
-                "file_size": drive_file_info.get('size')
-            }
-            
-            logger.info(f"Webhook payload: {payload}")
-            response = await client.post(N8N_WEBHOOK_URL, json=payload, timeout=30.0)
-            
-            if response.status_code == 200:
-                logger.info("Webhook triggered successfully")
-                return {"status": "success", "message": "File processing started via Google Drive link"}
-            else:
-                logger.warning(f"n8n webhook failed with status: {response.status_code}")
-                return {"status": "warning", "message": f"n8n webhook failed: {response.status_code} {response.text}"}
-                
-    except Exception as e:
-        logger.error(f"Webhook error: {str(e)}")
-        return {"status": "error", "message": f"Failed to trigger n8n webhook: {str(e)}"}
-
-async def upload_resume(upload_file: UploadFile, drive_service: GoogleDriveService) -> JSONResponse:
-    """Uploads file to Google Drive and triggers n8n webhook."""
-    logger.info(f"Starting upload process for file: {upload_file.filename}")
+        if not job.drive_file_id:
+            storage = get_storage()
+            with open(staged_path, "rb") as staged_file:
+                drive_file_info = await storage.store(
+                    staged_file,
+                    filename=job.filename,
+                    content_type=job.content_type or "application/pdf",
+                    content_hash=job.content_hash,
+                    path=staged_path
+                )
+            job.drive_file_id = drive_file_info.get('file_id')
+            job.drive_link = drive_file_info.get('web_view_link')
+            job.storage_backend = storage.name
+            logger.info("Job %s: stored %s in %s storage (%s)", job.job_id, job.filename, storage.name,
+                        job.drive_file_id, extra={"job_id": job.job_id, "drive_file_id": job.drive_file_id})
+            dedup_index = get_dedup_index()
+            if dedup_index is not None and job.content_hash:
+                await asyncio.to_thread(dedup_index.record_upload, job.content_hash, drive_file_info, job.filename, job.job_id)
+        extracted = await extraction if extraction is not None else None
+    finally:
+        if extraction is not None:
+            extraction.cancel()
+
+    if extracted is not None:
+        job.page_count = extracted["page_count"]
+    drive_file_info = {'file_id': job.drive_file_id, 'web_view_link': job.drive_link, 'size': str(job.size)}
+    if job.storage_backend not in (None, "drive"):
+        drive_file_info.update(storage=job.storage_backend, download_url=download_url(job.drive_file_id))
+    job.webhook_status = await trigger_n8n_webhook(drive_file_info, job.filename, job.content_hash, extracted)
+
+@in_flight(UPLOADS_IN_FLIGHT, "request")
+@timed(UPLOAD_STAGE_SECONDS, "accept")
+async def upload_resume(upload_file: UploadFile, job_queue: JobQueue) -> JSONResponse:
+    """Validates and stages the upload and queues it for storage and n8n processing.
+
+    Oversized request bodies are already cut off by UploadLimitMiddleware;
+    here the size and PDF signature are checked before staging, and the
+    staged file's structure and page count before the job is queued.
+    """
+    logger.info("Starting upload process for file: %s", upload_file.filename)
     
     if not upload_file:
         logger.error("No file provided")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No file provided")
     
-    file_content = await upload_file.read()
-    logger.info(f"File read successfully: {upload_file.filename}, Size: {len(file_content)} bytes")
-    
     file_extension = os.path.splitext(upload_file.filename)[1].lower()
     if file_extension not in ALLOWED_EXTENSIONS:
-        logger.error(f"Invalid file extension: {file_extension}")
+        logger.warning("Invalid file extension: %s", file_extension)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"File type not allowed. Only {', '.join(ALLOWED_EXTENSIONS)} files are accepted."
         )
     
+    await validate_upload(upload_file)
+    
     try:
-        drive_file_info = drive_service.upload_file(
-            file_content=file_content,
-            filename=upload_file.filename,
-            mime_type=upload_file.content_type
-        )
-    except Exception as e:
-        logger.error(f"Google Drive upload failed: {e}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+        job = await job_queue.stage(upload_file.file, upload_file.filename, upload_file.content_type)
+    except QueueFullError as e:
+        logger.warning("Rejecting upload %s: %s", upload_file.filename, e)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    UPLOAD_SIZE_BYTES.labels("single").observe(job.size)
+    
+    dedup_index = get_dedup_index()
+    if dedup_index is not None:
+        duplicate = await _find_duplicate(dedup_index, job_queue, job.content_hash)
+        if duplicate is not None:
+            await job_queue.discard(job)
+            return duplicate
+    try:
+        job.page_count = await precheck_pdf(job_queue.staged_path(job), job.filename)
+    except HTTPException:
+        await job_queue.discard(job)
+        raise
+    if dedup_index is not None:
+        await asyncio.to_thread(dedup_index.reserve, job.content_hash, job.job_id, job.filename)
+    await job_queue.enqueue(job)
+    
+    logger.info("Upload accepted: %s (job %s)", upload_file.filename, job.job_id, extra={"job_id": job.job_id})
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={
+            "message": "Resume accepted for processing",
+            "job_id": job.job_id,
+            "filename": job.filename,
+            "content_hash": job.content_hash,
+            "status": job.status,
+            "status_url": f"/jobs/{job.job_id}",
+            "events_url": f"/jobs/{job.job_id}/events"
+        }
+    )
 
-    webhook_result = await trigger_n8n_webhook(drive_file_info, upload_file.filename)
+async def _find_duplicate(dedup_index: DedupIndex, job_queue: JobQueue, content_hash: str) -> Optional[JSONResponse]:
+    """Answer an upload from the dedup index if identical content was already accepted"""
+    entry = await asyncio.to_thread(dedup_index.lookup, content_hash)
+    if entry is None:
+        return None
+    
+    if entry["drive_file_id"]:
+        logger.info("Duplicate upload of %s (%s); reusing stored file %s", entry["filename"], content_hash,
+                    entry["drive_file_id"])
+        return JSONResponse(
+            status_code=status.HTTP_200_OK,
+            content={
+                "message": "Identical resume already uploaded",
+                "duplicate": True,
+                "content_hash": content_hash,
+                "job_id": entry["job_id"],
+                "drive_file_id": entry["drive_file_id"],
+                "drive_link": entry["drive_link"],
+                "analysis": entry["analysis"]
+            }
+        )
     
-    logger.info("Upload process completed successfully")
+    # The first copy is still being processed; point the client at its job
+    pending_job = job_queue.get(entry["job_id"]) if entry["job_id"] else None
+    if pending_job is None or pending_job.status == "failed":
+        return None
+    logger.info("Duplicate upload of %s (%s); attaching to job %s", entry["filename"], content_hash, pending_job.job_id)
     return JSONResponse(
-        status_code=status.HTTP_200_OK,
+        status_code=status.HTTP_202_ACCEPTED,
         content={
-            "message": "Resume uploaded to Google Drive successfully",
-            "filename": upload_file.filename,
-            "drive_file_id": drive_file_info.get('file_id'),
-            "drive_link": drive_file_info.get('web_view_link'),
-            "webhook_status": webhook_result
+            "message": "Identical resume already accepted for processing",
+            "duplicate": True,
+            "content_hash": content_hash,
+            "job_id": pending_job.job_id,
+            "filename": pending_job.filename,
+            "status": pending_job.status,
+            "status_url": f"/jobs/{pending_job.job_id}",
+            "events_url": f"/jobs/{pending_job.job_id}/events"
         }
     )
@@ -0,0 +1,152 @@
+import os
+import asyncio
+import logging
+from typing import BinaryIO, Dict, Optional
+from fastapi import HTTPException, UploadFile, status
+from fastapi.responses import JSONResponse
+from dotenv import load_dotenv
+
+from pdf_extract import get_pdf_extractor
+from metrics import UPLOAD_REJECTIONS
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Upload validation configuration
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_MAX_PAGES = int(os.getenv("UPLOAD_MAX_PAGES", "50"))
+UPLOAD_PRECHECK_ENABLED = os.getenv("UPLOAD_PRECHECK_ENABLED", "true").lower() in ("1", "true", "yes")
+# Whole-request cap for /upload/batch, whose individual files are limited by BATCH_MAX_ENTRY_SIZE
+BATCH_MAX_REQUEST_BYTES = int(os.getenv("BATCH_MAX_REQUEST_BYTES", str(200 * 1024 * 1024)))
+# Allowance for multipart boundaries, part headers and form fields around the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# A PDF header may be preceded by junk, but readers only look within the first kilobyte
+PDF_MAGIC = b"%PDF-"
+PDF_MAGIC_WINDOW = 1024
+
+class RequestTooLarge(HTTPException):
+    """Raised while the body is being received; FastAPI passes HTTPExceptions from body parsing through"""
+
+    def __init__(self, limit: int):
+        super().__init__(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                         detail=f"Request body exceeds the maximum of {limit} bytes")
+
+def upload_request_limits() -> Dict[str, int]:
+    """Maximum request body size per upload route"""
+    return {
+        "/upload": UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD_BYTES,
+        "/upload/batch": BATCH_MAX_REQUEST_BYTES
+    }
+
+class UploadLimitMiddleware:
+    """Rejects oversized upload requests before their body is parsed.
+
+    A declared Content-Length over the route's limit is answered with 413
+    without reading the body. Chunked or understated bodies are counted as
+    they arrive and the request fails with 413 as soon as the limit is
+    passed, so the multipart parser never spools more than the limit.
+    """
+
+    def __init__(self, app, limits: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.limits = limits if limits is not None else upload_request_limits()
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None:
+            try:
+                too_large = int(declared) > limit
+            except ValueError:
+                response = JSONResponse({"detail": "Invalid Content-Length header"},
+                                        status_code=status.HTTP_400_BAD_REQUEST)
+                await response(scope, receive, send)
+                return
+            if too_large:
+                UPLOAD_REJECTIONS.labels("too_large").inc()
+                logger.warning("Rejecting %s: Content-Length %s exceeds %d bytes", scope["path"], declared.decode(),
+                               limit)
+                # The body is never read, so the connection cannot be reused
+                response = JSONResponse({"detail": RequestTooLarge(limit).detail},
+                                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                        headers={"Connection": "close"})
+                await response(scope, receive, send)
+                return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    UPLOAD_REJECTIONS.labels("too_large").inc()
+                    logger.warning("Rejecting %s: body exceeds %d bytes", scope["path"], limit)
+                    raise RequestTooLarge(limit)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+def has_pdf_magic(file_obj: BinaryIO) -> bool:
+    """Whether a seekable file starts like a PDF; leaves the position at the start"""
+    file_obj.seek(0)
+    head = file_obj.read(PDF_MAGIC_WINDOW)
+    file_obj.seek(0)
+    return PDF_MAGIC in head
+
+def _reject(reason: str, status_code: int, detail: str):
+    UPLOAD_REJECTIONS.labels(reason).inc()
+    raise HTTPException(status_code=status_code, detail=detail)
+
+def _file_size(file_obj: BinaryIO) -> int:
+    file_obj.seek(0, os.SEEK_END)
+    size = file_obj.tell()
+    file_obj.seek(0)
+    return size
+
+async def validate_upload(upload_file: UploadFile):
+    """Cheap checks on a received upload before it is staged: size and PDF signature"""
+    size = getattr(upload_file, "size", None)
+    if size is None:
+        size = await asyncio.to_thread(_file_size, upload_file.file)
+    if size > UPLOAD_MAX_BYTES:
+        logger.warning("Rejecting %s: %d bytes exceeds %d", upload_file.filename, size, UPLOAD_MAX_BYTES)
+        _reject("too_large", status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                f"File exceeds the maximum size of {UPLOAD_MAX_BYTES} bytes.")
+    if size == 0:
+        _reject("empty", status.HTTP_400_BAD_REQUEST, "File is empty.")
+    if not await asyncio.to_thread(has_pdf_magic, upload_file.file):
+        logger.warning("Rejecting %s: no PDF signature", upload_file.filename)
+        _reject("not_pdf", status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, "File is not a PDF document.")
+
+async def precheck_pdf(path: str, filename: str) -> Optional[int]:
+    """Parse the PDF structure on the extraction pool and return its page count.
+
+    Unreadable, encrypted and over-long PDFs are rejected with 422. If the
+    check cannot run (extraction disabled, or the pool failed) the upload
+    is let through and None is returned.
+    """
+    pdf_extractor = get_pdf_extractor()
+    if not UPLOAD_PRECHECK_ENABLED or pdf_extractor is None:
+        return None
+    result = await pdf_extractor.precheck(path, filename)
+    if result is None:
+        return None
+    if not result["valid"]:
+        logger.warning("Rejecting %s: %s", filename, result["error"])
+        _reject("invalid_pdf", status.HTTP_422_UNPROCESSABLE_ENTITY, result["error"])
+    if result["page_count"] > UPLOAD_MAX_PAGES:
+        logger.warning("Rejecting %s: %d pages exceeds %d", filename, result["page_count"], UPLOAD_MAX_PAGES)
+        _reject("too_many_pages", status.HTTP_422_UNPROCESSABLE_ENTITY,
+                f"PDF has {result['page_count']} pages; the maximum is {UPLOAD_MAX_PAGES}.")
+    if result["page_count"] == 0:
+        _reject("invalid_pdf", status.HTTP_422_UNPROCESSABLE_ENTITY, "PDF has no pages.")
+    return result["page_count"]
@@ -0,0 +1,164 @@
+import os
+import uuid
+import logging
+from contextlib import contextmanager
+from typing import Iterator, Optional, Set
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock; every lock is then granted
+    fcntl = None
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+_basedir = os.path.abspath(os.path.dirname(__file__))
+
+# Worker process configuration. WEB_CONCURRENCY is also what uvicorn --workers defaults to.
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+MULTI_WORKER = WEB_CONCURRENCY > 1
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+# Lock files through which the worker processes of one deployment find each other
+WORKER_RUN_DIR = os.getenv("WORKER_RUN_DIR", os.path.join(_basedir, "uploads", "run"))
+
+class FileLock:
+    """Exclusive advisory lock (flock) on a file, held through an open descriptor.
+
+    The kernel releases it when the holding process exits, however it exits,
+    which is what lets the other workers notice a dead process. Locks are per
+    open file, so a second FileLock on the same path in the same process
+    conflicts with the first.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if self._fd is not None:
+            return True
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+def _is_locked(path: str) -> bool:
+    """Whether another open file currently holds the lock on ``path``"""
+    probe = FileLock(path)
+    try:
+        if probe.acquire(blocking=False):
+            probe.release()
+            return False
+    except OSError:
+        return False
+    return True
+
+# Identity of this process, regenerated if the module was imported before a fork
+_worker_id: Optional[str] = None
+_worker_pid: Optional[int] = None
+_worker_lock: Optional[FileLock] = None
+
+def worker_id() -> str:
+    """Unique id of this worker process"""
+    global _worker_id, _worker_pid
+    if _worker_pid != os.getpid():
+        _worker_id, _worker_pid = uuid.uuid4().hex, os.getpid()
+    return _worker_id
+
+def _workers_dir() -> str:
+    return os.path.join(WORKER_RUN_DIR, "workers")
+
+def _registry_lock() -> FileLock:
+    return FileLock(os.path.join(WORKER_RUN_DIR, "registry.lock"))
+
+def register_worker():
+    """Announce this process to the other workers by holding a lock file named after it"""
+    global _worker_lock
+    if _worker_lock is not None and _worker_lock.held:
+        return
+    # Under the registry lock, so a reaper never sees the file before it is locked
+    with _registry_lock():
+        _worker_lock = FileLock(os.path.join(_workers_dir(), f"{worker_id()}.lock"))
+        _worker_lock.acquire()
+    logger.info("Worker %s registered (pid %s, %s configured workers)", worker_id(), os.getpid(), WEB_CONCURRENCY)
+
+def unregister_worker():
+    """Release and remove this process's lock file"""
+    global _worker_lock
+    if _worker_lock is None:
+        return
+    with _registry_lock():
+        try:
+            os.remove(_worker_lock.path)
+        except OSError:
+            pass
+        _worker_lock.release()
+    _worker_lock = None
+
+def live_workers() -> Set[str]:
+    """Ids of the registered workers whose process is still running, this one included"""
+    live = {worker_id()} if _worker_lock is not None else set()
+    try:
+        names = os.listdir(_workers_dir())
+    except FileNotFoundError:
+        return live
+    for name in names:
+        if name.endswith(".lock") and name[:-5] not in live and _is_locked(os.path.join(_workers_dir(), name)):
+            live.add(name[:-5])
+    return live
+
+@contextmanager
+def worker_registry() -> Iterator[Set[str]]:
+    """Hold the registry lock and yield the ids of live workers.
+
+    No worker can register or be reaped meanwhile, so state owned by workers
+    outside the set can be taken over without racing the other processes.
+    Lock files of dead workers are removed on exit.
+    """
+    with _registry_lock():
+        live = live_workers()
+        yield live
+        try:
+            names = os.listdir(_workers_dir())
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            if name.endswith(".lock") and name[:-5] not in live:
+                try:
+                    os.remove(os.path.join(_workers_dir(), name))
+                except OSError:
+                    pass
+
+def worker_stats() -> dict:
+    return {
+        "worker_id": worker_id(),
+        "pid": os.getpid(),
+        "configured_workers": WEB_CONCURRENCY,
+        "live_workers": len(live_workers())
+    }
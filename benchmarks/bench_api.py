@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test of the API: boots the FastAPI app under uvicorn in a
+child process with a fake Google Drive service and a local stub n8n webhook,
+then drives /auth/login, /test-auth and /upload at a fixed concurrency.
+
+The fake Drive service subclasses GoogleDriveService, so uploads still go
+through the Drive worker pool; it reads each file in upload-sized chunks and
+can add a per-upload delay to stand in for network time. Upload files are
+small valid PDFs padded to sizes drawn from --file-sizes (size:weight pairs).
+
+For each endpoint the results report throughput and p50/p95/p99 latency;
+the run also reports how long the background job queue took to drain after
+the upload phase, how many webhooks the stub received and the largest
+server process's peak RSS. --storage picks the storage backend; "local"
+stores uploads in the run's temporary directory. With --workers the server runs that many worker
+processes, each installing the fake Drive service itself. Output is JSON, so
+runs can be saved and compared between commits.
+
+Usage:
+    python benchmarks/bench_api.py --requests 500 --concurrency 32
+    python benchmarks/bench_api.py --scenarios upload --file-sizes 50k:6,500k:3,5m:1 --drive-latency 0.05
+    python benchmarks/bench_api.py --scenarios test-auth,upload --workers 4
+    python benchmarks/bench_api.py --scenarios upload --storage local
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(BENCH_DIR, "..", "backend")
+
+from bench_webhook import StubWebhookHandler  # noqa: E402
+
+USERNAME = "admin"
+PASSWORD = "admin123"
+SCENARIOS = ("login", "test-auth", "upload")
+
+class CountingWebhookHandler(StubWebhookHandler):
+    """The stub webhook from bench_webhook, counting the calls it receives."""
+    received = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        with CountingWebhookHandler.lock:
+            CountingWebhookHandler.received += 1
+        super().do_POST()
+
+def start_webhook_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CountingWebhookHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def create_app():
+    """App factory run in each server worker process: install the fake Drive service and load the app"""
+    sys.path.insert(0, BACKEND_DIR)
+    import google_drive
+
+    drive_latency = float(os.environ.get("BENCH_DRIVE_LATENCY", "0"))
+
+    class FakeDriveService(google_drive.GoogleDriveService):
+        """GoogleDriveService that reads uploads locally instead of sending them to Drive"""
+
+        def __init__(self):
+            self.folder_id = None
+            self._uploads = 0
+            self._lock = threading.Lock()
+
+        def upload_stream(self, file_obj, filename, mime_type="application/pdf", chunk_size=None):
+            chunk_size = google_drive.resolve_chunk_size(chunk_size)
+            file_obj.seek(0)
+            size = 0
+            for chunk in iter(lambda: file_obj.read(chunk_size), b""):
+                size += len(chunk)
+            if drive_latency:
+                time.sleep(drive_latency)
+            with self._lock:
+                self._uploads += 1
+                file_id = f"bench-{self._uploads}"
+            return {
+                "file_id": file_id,
+                "filename": filename,
+                "web_view_link": f"https://drive.google.com/file/d/{file_id}/view",
+                "web_content_link": None,
+                "size": str(size),
+                "drive_url": f"https://drive.google.com/file/d/{file_id}/view"
+            }
+
+        def delete_file(self, file_id):
+            return True
+
+        def get_file_info(self, file_id):
+            return None
+
+    google_drive.drive_service = FakeDriveService()
+    from main import app
+    return app
+
+def serve(port: int, drive_latency: float, workers: int):
+    """Child process: run the app under uvicorn with the fake Drive service"""
+    import uvicorn
+
+    os.environ["BENCH_DRIVE_LATENCY"] = str(drive_latency)
+    uvicorn.run("bench_api:create_app", factory=True, host="127.0.0.1", port=port, log_level="warning",
+                app_dir=BENCH_DIR, workers=workers)
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(args, webhook_url: str, workdir: str) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "N8N_WEBHOOK_URL": webhook_url,
+        "N8N_BATCH_WEBHOOK_URL": webhook_url,
+        "UPLOAD_STAGING_DIR": os.path.join(workdir, "staging"),
+        "DEDUP_DB_PATH": os.path.join(workdir, "dedup.sqlite3"),
+        "WEBHOOK_OUTBOX_PATH": os.path.join(workdir, "webhook_outbox.sqlite3"),
+        "RATE_LIMIT_DB_PATH": os.path.join(workdir, "rate_limit.sqlite3"),
+        "CACHE_DB_PATH": os.path.join(workdir, "result_cache.sqlite3"),
+        "ANALYSIS_CACHE_DB_PATH": os.path.join(workdir, "analysis.sqlite3"),
+        "WORKER_RUN_DIR": os.path.join(workdir, "run"),
+        "METRICS_SNAPSHOT_DIR": os.path.join(workdir, "metrics"),
+        "RANKING_DIR": os.path.join(workdir, "ranking"),
+        "WEB_CONCURRENCY": str(args.workers),
+        "STORAGE_BACKEND": args.storage,
+        "STORAGE_LOCAL_DIR": os.path.join(workdir, "storage"),
+        # The load generator logs in from one address; keep the login limiter out of the numbers
+        "LOGIN_RATE_LIMIT_PER_IP": str(10 ** 9),
+        "LOGIN_RATE_LIMIT_PER_USER": str(10 ** 9),
+        # The resume indexes are not exercised here and would only compete for CPU
+        "SKILL_INDEX_ENABLED": "false",
+        "RANKING_ENABLED": "false"
+    })
+    if args.database_url:
+        env["DATABASE_URL"] = args.database_url
+    command = [sys.executable, os.path.abspath(__file__), "--serve", str(args.port), "--drive-latency",
+               str(args.drive_latency), "--workers", str(args.workers)]
+    output = None if args.server_output else subprocess.DEVNULL
+    return subprocess.Popen(command, env=env, stdout=output, stderr=output)
+
+async def wait_until_ready(client: httpx.AsyncClient, process: subprocess.Popen, timeout: float = 60.0) -> float:
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"API server exited with status {process.returncode}")
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return time.perf_counter() - started
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("API server did not become ready")
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower()
+    multiplier = {"k": 1024, "m": 1024 * 1024}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * multiplier)
+
+def parse_distribution(text: str):
+    sizes, weights = [], []
+    for part in text.split(","):
+        size, _, weight = part.partition(":")
+        sizes.append(parse_size(size))
+        weights.append(float(weight or 1))
+    return sizes, weights
+
+def make_pdf(size: int, rng: random.Random) -> bytes:
+    """A one-page PDF with a line of text, padded with a random binary stream to about ``size`` bytes"""
+    text = b"BT /F1 12 Tf 72 720 Td (Benchmark Resume - Python, FastAPI, PostgreSQL) Tj ET"
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R"
+        b" /Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(text), text),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+    padding = max(0, size - 900)
+    objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (padding, rng.randbytes(padding)))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def run_scenario(client, scenario, total, concurrency, headers, files, job_ids):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = {}
+    errors = 0
+    uploaded_bytes = 0
+
+    async def one(i):
+        nonlocal errors, uploaded_bytes
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                if scenario == "login":
+                    response = await client.post("/auth/login", json={"username": USERNAME, "password": PASSWORD})
+                elif scenario == "test-auth":
+                    response = await client.get("/test-auth", headers=headers)
+                else:
+                    content = files[i % len(files)]
+                    response = await client.post("/upload", headers=headers,
+                                                 files={"file": (f"resume-{i}.pdf", content, "application/pdf")})
+                    uploaded_bytes += len(content)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                if response.status_code >= 400:
+                    errors += 1
+                elif scenario == "upload" and "job_id" in response.json():
+                    job_ids.append(response.json()["job_id"])
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    wall_started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - wall_started
+
+    result = {
+        "endpoint": scenario,
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3)
+    }
+    if scenario == "upload":
+        result["throughput_mb_s"] = round(uploaded_bytes / elapsed / (1024 * 1024), 2)
+    return result
+
+async def wait_for_jobs(client, headers, job_ids, timeout: float) -> dict:
+    """Wait for every upload job to finish and report how long it took.
+
+    Jobs are polled by id rather than through /health, whose queue stats
+    only cover the worker process that answers.
+    """
+    started = time.perf_counter()
+    pending = list(job_ids)
+    finished = {}
+    while True:
+        responses = await asyncio.gather(*(client.get(f"/jobs/{job_id}", headers=headers) for job_id in pending))
+        still_pending = []
+        for job_id, response in zip(pending, responses):
+            status = response.json().get("status") if response.status_code == 200 else "missing"
+            if status in ("completed", "failed"):
+                finished[status] = finished.get(status, 0) + 1
+            else:
+                still_pending.append(job_id)
+        pending = still_pending
+        if not pending or time.perf_counter() - started > timeout:
+            return {
+                "drain_seconds": round(time.perf_counter() - started, 3),
+                "pending": len(pending),
+                "completed": finished.get("completed", 0),
+                "failed": finished.get("failed", 0)
+            }
+        await asyncio.sleep(0.05)
+
+def server_peak_rss_mb():
+    """Peak RSS of the largest server process, read once they have exited"""
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+async def run(args, base_url: str, process: subprocess.Popen) -> dict:
+    rng = random.Random(args.seed)
+    sizes, weights = parse_distribution(args.file_sizes)
+    # A fixed pool of distinct files keeps generation out of the timings; random padding avoids dedup hits
+    files = [make_pdf(rng.choices(sizes, weights)[0], rng) for _ in range(min(args.requests, args.distinct_files))]
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120.0) as client:
+        startup_seconds = await wait_until_ready(client, process)
+        response = await client.post("/auth/login", json={"username": USERNAME, "password": PASSWORD})
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        results = []
+        jobs = None
+        for scenario in args.scenarios.split(","):
+            job_ids = []
+            results.append(await run_scenario(client, scenario, args.requests, args.concurrency, headers, files,
+                                              job_ids))
+            if scenario == "upload":
+                jobs = await wait_for_jobs(client, headers, job_ids, args.drain_timeout)
+    return {"startup_seconds": round(startup_seconds, 3), "results": results, "upload_jobs": jobs}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated subset of {SCENARIOS}")
+    parser.add_argument("--file-sizes", default="20k:5,200k:4,2m:1", help="Upload size distribution as size:weight")
+    parser.add_argument("--distinct-files", type=int, default=200, help="Distinct upload files to generate")
+    parser.add_argument("--drive-latency", type=float, default=0.0, help="Simulated seconds per Drive upload")
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    parser.add_argument("--database-url", help="DATABASE_URL for the server (defaults to the environment)")
+    parser.add_argument("--port", type=int, default=0, help="Server port (default: a free port)")
+    parser.add_argument("--workers", type=int, default=1, help="Server worker processes (WEB_CONCURRENCY)")
+    parser.add_argument("--storage", choices=("drive", "local"), default="drive",
+                        help="Storage backend; drive uses the fake Drive service")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--server-output", action="store_true", help="Show the server's log output")
+    parser.add_argument("--serve", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        serve(args.serve, args.drive_latency, args.workers)
+        return
+
+    unknown = set(args.scenarios.split(",")) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    args.port = args.port or free_port()
+
+    webhook = start_webhook_server()
+    webhook_url = f"http://127.0.0.1:{webhook.server_address[1]}/webhook/resume-upload"
+    with tempfile.TemporaryDirectory() as workdir:
+        process = start_server(args, webhook_url, workdir)
+        try:
+            report = asyncio.run(run(args, f"http://127.0.0.1:{args.port}", process))
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+    webhook.shutdown()
+
+    print(json.dumps({
+        "benchmark": "api_load",
+        "revision": git_revision(),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "file_sizes": args.file_sizes,
+            "drive_latency": args.drive_latency,
+            "workers": args.workers,
+            "storage": args.storage
+        },
+        **report,
+        "webhooks_received": CountingWebhookHandler.received,
+        "server_peak_rss_mb": server_peak_rss_mb()
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
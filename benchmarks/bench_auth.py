@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-request JWT authentication overhead of get_current_user:
+the previous implementation (full decode, INFO payload logging and a fresh
+UserInDB per request) versus the current one with and without its
+verified-token cache.
+
+Logging is configured at INFO into a file handler on os.devnull, so the cost
+of formatting and emitting log records is included, as it is in production.
+
+Usage:
+    python benchmarks/bench_auth.py --requests 20000 --tokens 10
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from fastapi.security import HTTPAuthorizationCredentials  # noqa: E402
+from jose import jwt  # noqa: E402
+
+import auth  # noqa: E402
+
+async def legacy_get_current_user(credentials: HTTPAuthorizationCredentials):
+    # The pre-cache behaviour, kept here as the baseline
+    logger = auth.logger
+    logger.info(f"Validating JWT token: {credentials.credentials[:20]}...")
+    payload = jwt.decode(credentials.credentials, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
+    username = payload.get("sub")
+    logger.info(f"Token payload: {payload}")
+    token_data = auth.TokenData(username=username)
+    logger.info(f"Token data: {token_data}")
+    user = auth.UserInDB(**auth.HARDCODED_USER)
+    logger.info(f"User authenticated successfully: {user.username}")
+    return user
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def run_mode(mode, tokens, total):
+    if mode == "legacy":
+        authenticate = legacy_get_current_user
+    else:
+        auth.token_cache = auth.TokenCache(max_size=0 if mode == "uncached" else auth.AUTH_TOKEN_CACHE_SIZE)
+        authenticate = auth.get_current_user
+
+    credentials = [HTTPAuthorizationCredentials(scheme="Bearer", credentials=token) for token in tokens]
+    latencies = []
+    wall_started = time.perf_counter()
+    for i in range(total):
+        started = time.perf_counter()
+        await authenticate(credentials[i % len(credentials)])
+        latencies.append(time.perf_counter() - started)
+    elapsed = time.perf_counter() - wall_started
+
+    result = {
+        "mode": mode,
+        "requests": total,
+        "distinct_tokens": len(tokens),
+        "throughput_rps": round(total / elapsed, 1),
+        "p50_us": round(percentile(latencies, 50) * 1e6, 2),
+        "p99_us": round(percentile(latencies, 99) * 1e6, 2),
+        "mean_us": round(statistics.mean(latencies) * 1e6, 2)
+    }
+    if mode == "cached":
+        result["cache"] = auth.token_cache.stats()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--tokens", type=int, default=10, help="Number of distinct users' tokens to rotate through")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, handlers=[logging.FileHandler(os.devnull)], force=True)
+
+    tokens = [
+        auth.create_access_token({"sub": auth.HARDCODED_USER["username"], "sid": i}, timedelta(minutes=30))
+        for i in range(args.tokens)
+    ]
+    results = [asyncio.run(run_mode(mode, tokens, args.requests)) for mode in ("legacy", "uncached", "cached")]
+    print(json.dumps({"benchmark": "jwt_auth", "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark the logging cost of one upload request on the request path: the
+previous setup (logging.basicConfig at INFO writing synchronously, f-string
+messages and the full webhook payload logged at INFO) versus the queue-based
+JSON pipeline from backend/log_config.py with lazy %-style messages.
+
+Both modes write to a temporary file. "caller" latencies are what the
+request thread pays per simulated request; "total_seconds" also includes
+waiting for the writer thread to drain the queue.
+
+Usage:
+    python benchmarks/bench_logging.py --requests 20000
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import log_config  # noqa: E402
+
+logger = logging.getLogger("upload")
+
+PAYLOAD = {
+    "drive_file_id": "bench-file-id",
+    "drive_link": "https://drive.google.com/file/d/bench-file-id/view",
+    "original_filename": "resume.pdf",
+    "uploaded_at": "2024-01-01T00:00:00",
+    "file_size": "123456",
+    "content_hash": "0" * 64,
+    "pdf_text": "Experienced backend engineer. " * 200,
+    "local_fields": {"skills": ["Python", "FastAPI", "PostgreSQL"]}
+}
+
+def legacy_request(i):
+    # The log lines one upload used to write, eagerly formatted
+    filename = f"resume-{i}.pdf"
+    job_id = f"{i:032x}"
+    logger.info(f"Starting upload process for file: {filename}")
+    logger.info(f"Queued upload job {job_id} for {filename} (123456 bytes)")
+    logger.info(f"Upload accepted: {filename} (job {job_id})")
+    logger.info(f"Job {job_id}: uploaded {filename} to Google Drive (bench-file-id)")
+    logger.info(f"Triggering n8n webhook for file: {filename}")
+    logger.info(f"Webhook payload: {PAYLOAD}")
+    logger.info("Webhook triggered successfully")
+    logger.info(f"Job {job_id} completed")
+
+def structured_request(i):
+    filename = f"resume-{i}.pdf"
+    job_id = f"{i:032x}"
+    token = log_config.correlation_id.set(job_id)
+    logger.info("Starting upload process for file: %s", filename)
+    logger.info("Queued upload job %s for %s (%d bytes)", job_id, filename, 123456, extra={"job_id": job_id})
+    logger.info("Upload accepted: %s (job %s)", filename, job_id, extra={"job_id": job_id})
+    logger.info("Job %s: uploaded %s to Google Drive (%s)", job_id, filename, "bench-file-id",
+                extra={"job_id": job_id, "drive_file_id": "bench-file-id"})
+    logger.info("Triggering n8n webhook for file: %s", filename)
+    logger.debug("Webhook payload: %s", PAYLOAD)
+    logger.info("Webhook triggered successfully")
+    logger.info("Job %s completed", job_id, extra={"job_id": job_id})
+    log_config.correlation_id.reset(token)
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def run_mode(mode, total, path):
+    with open(path, "w") as output:
+        if mode == "legacy":
+            logging.basicConfig(level=logging.INFO, stream=output, force=True)
+            request = legacy_request
+        else:
+            # configure_logging writes to sys.stderr; point it at the output file for the run
+            stderr, sys.stderr = sys.stderr, output
+            try:
+                log_config.configure_logging()
+            finally:
+                sys.stderr = stderr
+            request = structured_request
+
+        latencies = []
+        wall_started = time.perf_counter()
+        for i in range(total):
+            started = time.perf_counter()
+            request(i)
+            latencies.append(time.perf_counter() - started)
+        stats = None
+        if mode == "structured":
+            stats = log_config.logging_stats()
+            log_config.stop_logging()
+        elapsed = time.perf_counter() - wall_started
+        output.flush()
+
+    return {
+        "mode": mode,
+        "requests": total,
+        "total_seconds": round(elapsed, 3),
+        "caller_p50_us": round(percentile(latencies, 50) * 1e6, 2),
+        "caller_p99_us": round(percentile(latencies, 99) * 1e6, 2),
+        "caller_mean_us": round(statistics.mean(latencies) * 1e6, 2),
+        "bytes_written": os.path.getsize(path),
+        "logging": stats
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = [run_mode(mode, args.requests, os.path.join(directory, f"{mode}.log"))
+                   for mode in ("legacy", "structured")]
+    print(json.dumps({"benchmark": "request_logging", "rate_limit": log_config.LOG_RATE_LIMIT,
+                      "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
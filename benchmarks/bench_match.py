@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark /match ranking: RankingIndex.rank over synthetic resume vectors at
+several corpus sizes, against a baseline that scores the same rows from an
+in-memory row-major matrix and fully sorts them.
+
+Vectors are generated directly (3-12 skills per resume with 1-4 mentions
+each), so resume text extraction is not part of the timings. The index is
+written to a temporary directory and removed afterwards.
+
+Usage:
+    python benchmarks/bench_match.py --sizes 1000,10000,100000,300000 --queries 50
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from ranking import VOCABULARY, RankingIndex, _normalize, term_frequencies  # noqa: E402
+
+def synthetic_rows(count, rng):
+    for resume_id in range(1, count + 1):
+        counts = {rng.randrange(len(VOCABULARY)): rng.randint(1, 4) for _ in range(rng.randint(3, 12))}
+        experience = None if rng.random() < 0.2 else round(rng.uniform(0, 25), 1)
+        yield resume_id, term_frequencies(counts), experience
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def summarize(latencies):
+    return {
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3)
+    }
+
+def naive_rank(matrix, ids, idf, counts, top_k):
+    # Row-major scoring of every column followed by a full sort
+    query = _normalize(term_frequencies(counts) * idf)
+    scores = matrix @ query
+    order = np.argsort(-scores)[:top_k]
+    return [(int(ids[i]), float(scores[i])) for i in order if scores[i] > 0]
+
+def run_size(size, queries, top_k, directory):
+    rng = random.Random(size)
+    index = RankingIndex(os.path.join(directory, str(size)))
+    index.create()
+    started = time.perf_counter()
+    batch = []
+    for row in synthetic_rows(size, rng):
+        batch.append(row)
+        if len(batch) == 5000:
+            index.add_many(batch)
+            batch = []
+    index.add_many(batch)
+    build_seconds = time.perf_counter() - started
+
+    reader = RankingIndex(index.directory, writable=False)
+    started = time.perf_counter()
+    reader.open()
+    open_seconds = time.perf_counter() - started
+    matrix = np.ascontiguousarray(reader._vectors[:reader.count])
+    ids = np.array(reader._ids[:reader.count])
+
+    job_descriptions = [{rng.randrange(len(VOCABULARY)): 1 for _ in range(rng.randint(3, 10))} for _ in range(queries)]
+    indexed, naive = [], []
+    for counts in job_descriptions:
+        started = time.perf_counter()
+        reader.rank(counts, top_k=top_k, required_years=5)
+        indexed.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        naive_rank(matrix, ids, reader.idf, counts, top_k)
+        naive.append(time.perf_counter() - started)
+    return {
+        "resumes": size,
+        "build_seconds": round(build_seconds, 2),
+        "open_ms": round(open_seconds * 1000, 3),
+        "rank": summarize(indexed),
+        "row_major_full_sort": summarize(naive)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=20)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        results = [run_size(int(size), args.queries, args.top_k, directory) for size in args.sizes.split(",")]
+    print(json.dumps({"benchmark": "match_ranking", "vocabulary": len(VOCABULARY), "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Benchmark API cold start: how long `import main` takes in a fresh
+interpreter, which top-level modules dominate it, and, for the standard and
+the fast-start (FAST_START) modes, how long a freshly spawned uvicorn
+server takes to answer its first request, its first login and to finish
+building the Drive client.
+
+The server builds a real Drive client with anonymous credentials against an
+unused local DRIVE_API_ENDPOINT, so the client libraries and the discovery
+document are loaded as in production without touching the network. Each
+measurement is repeated --runs times and the median is reported as JSON.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --modes fast --database-url postgresql://localhost/resume_analyzer
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.abspath(os.path.join(BENCH_DIR, "..", "backend"))
+
+USERNAME = "admin"
+PASSWORD = "admin123"
+MODES = ("standard", "fast")
+
+IMPORT_SCRIPT = """
+import sys, time
+sys.path.insert(0, %r)
+started = time.perf_counter()
+import main
+print(time.perf_counter() - started)
+"""
+
+def measure_import() -> float:
+    output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT % BACKEND_DIR], cwd=BACKEND_DIR,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+def slowest_imports(limit: int) -> list:
+    """Modules imported directly by main, by cumulative import time (python -X importtime)"""
+    script = f"import sys; sys.path.insert(0, {BACKEND_DIR!r}); import main"
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", script], cwd=BACKEND_DIR,
+                            capture_output=True, text=True, check=True).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Depth is the indentation of the name: main's own imports are one level below it
+        if name.startswith("   ") and not name.startswith("    ") and cumulative.strip().isdigit():
+            modules.append({"module": name.strip(), "ms": round(int(cumulative) / 1000, 1)})
+    return sorted(modules, key=lambda module: module["ms"], reverse=True)[:limit]
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(args, mode: str, port: int, workdir: str) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "FAST_START": "true" if mode == "fast" else "false",
+        # Anonymous credentials; the client is built but never sends a request
+        "DRIVE_API_ENDPOINT": f"http://127.0.0.1:{free_port()}/",
+        "GOOGLE_SERVICE_ACCOUNT_KEY": "",
+        "UPLOAD_STAGING_DIR": os.path.join(workdir, "staging"),
+        "DEDUP_DB_PATH": os.path.join(workdir, "dedup.sqlite3"),
+        "WEBHOOK_OUTBOX_PATH": os.path.join(workdir, "webhook_outbox.sqlite3"),
+        "RATE_LIMIT_DB_PATH": os.path.join(workdir, "rate_limit.sqlite3"),
+        "CACHE_DB_PATH": os.path.join(workdir, "result_cache.sqlite3"),
+        "ANALYSIS_CACHE_DB_PATH": os.path.join(workdir, "analysis.sqlite3"),
+        "WORKER_RUN_DIR": os.path.join(workdir, "run"),
+        "METRICS_SNAPSHOT_DIR": os.path.join(workdir, "metrics"),
+        "RANKING_DIR": os.path.join(workdir, "ranking"),
+        "STORAGE_LOCAL_DIR": os.path.join(workdir, "storage"),
+        "WEB_CONCURRENCY": "1"
+    })
+    if args.database_url:
+        env["DATABASE_URL"] = args.database_url
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_DIR, "--host", "127.0.0.1",
+               "--port", str(port), "--log-level", "warning"]
+    output = None if args.server_output else subprocess.DEVNULL
+    return subprocess.Popen(command, env=env, stdout=output, stderr=output)
+
+def measure_server(args, mode: str) -> dict:
+    """Seconds from spawning the server to its first response, first login and finished warm-up"""
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir, httpx.Client(base_url=f"http://127.0.0.1:{port}",
+                                                                timeout=60.0) as client:
+        started = time.perf_counter()
+        process = start_server(args, mode, port, workdir)
+        try:
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"API server exited with status {process.returncode}")
+                if time.perf_counter() - started > args.timeout:
+                    raise RuntimeError("API server did not become ready")
+                try:
+                    client.get("/")
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.005)
+            first_response = time.perf_counter() - started
+            client.post("/auth/login", json={"username": USERNAME, "password": PASSWORD}).raise_for_status()
+            first_login = time.perf_counter() - started
+            while not client.get("/health").json()["startup"]["warmed_up"]:
+                if time.perf_counter() - started > args.timeout:
+                    raise RuntimeError("API server did not finish warming up")
+                time.sleep(0.005)
+            warmed_up = time.perf_counter() - started
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+    return {"first_response": first_response, "first_login": first_login, "warmed_up": warmed_up}
+
+def median_ms(samples) -> float:
+    return round(statistics.median(samples) * 1000, 1)
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modes", default=",".join(MODES), help=f"Comma-separated subset of {MODES}")
+    parser.add_argument("--top-imports", type=int, default=10, help="Slowest imports of main to list")
+    parser.add_argument("--database-url", help="DATABASE_URL for the server (defaults to the environment)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--server-output", action="store_true", help="Show the server's log output")
+    args = parser.parse_args()
+
+    modes = args.modes.split(",")
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"Unknown modes: {', '.join(sorted(unknown))}")
+
+    imports = [measure_import() for _ in range(args.runs)]
+    servers = {}
+    for mode in modes:
+        runs = [measure_server(args, mode) for _ in range(args.runs)]
+        servers[mode] = {f"{key}_ms": median_ms([run[key] for run in runs]) for key in runs[0]}
+
+    print(json.dumps({
+        "benchmark": "startup",
+        "revision": git_revision(),
+        "config": {"runs": args.runs},
+        "import_main_ms": median_ms(imports),
+        "slowest_imports": slowest_imports(args.top_imports),
+        "server": servers
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark n8n webhook dispatch: a new httpx.AsyncClient per call versus the
+shared pooled client from backend/http_client.py, against a local stub webhook.
+
+Usage:
+    python benchmarks/bench_webhook.py --requests 2000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from http_client import create_http_client  # noqa: E402
+
+PAYLOAD = {
+    "drive_file_id": "bench-file-id",
+    "drive_link": "https://drive.google.com/file/d/bench-file-id/view",
+    "original_filename": "resume.pdf",
+    "uploaded_at": "2024-01-01T00:00:00",
+    "file_size": "123456"
+}
+
+class StubWebhookHandler(BaseHTTPRequestHandler):
+    """Accepts any POST and answers 200 over a keep-alive connection."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b'{"status":"ok"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubWebhookHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def post_per_call(url):
+    # The pre-pooling behaviour: a fresh client and connection for every webhook
+    async with httpx.AsyncClient() as client:
+        return await client.post(url, json=PAYLOAD, timeout=30.0)
+
+async def run_mode(mode, url, total, concurrency):
+    shared = create_http_client() if mode == "shared" else None
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                if shared is not None:
+                    response = await shared.post(url, json=PAYLOAD)
+                else:
+                    response = await post_per_call(url)
+                if response.status_code != 200:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    wall_started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - wall_started
+    if shared is not None:
+        await shared.aclose()
+
+    return {
+        "mode": mode,
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--url", help="Webhook URL to target instead of the built-in stub server")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if not url:
+        server = start_stub_server()
+        url = f"http://127.0.0.1:{server.server_address[1]}/webhook/resume-upload"
+
+    results = []
+    for mode in ("per-call", "shared"):
+        results.append(asyncio.run(run_mode(mode, url, args.requests, args.concurrency)))
+
+    if server is not None:
+        server.shutdown()
+    print(json.dumps({"benchmark": "webhook_dispatch", "url": url, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -8,14 +8,36 @@ CREATE TABLE IF NOT EXISTS resumes (
     skills TEXT[],
     experience_years FLOAT,
     last_job_title TEXT,
+    content_hash TEXT,
+    resume_text TEXT,
     uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- SHA-256 of the uploaded PDF, used to deduplicate resubmitted resumes
+ALTER TABLE resumes ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+-- Extracted resume text, searched together with name and job title
+ALTER TABLE resumes ADD COLUMN IF NOT EXISTS resume_text TEXT;
+ALTER TABLE resumes ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(full_name, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(last_job_title, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(resume_text, '')), 'C')
+) STORED;
+
 -- Create index on uploaded_at for better query performance
 CREATE INDEX IF NOT EXISTS idx_resumes_uploaded_at ON resumes(uploaded_at);
 
 -- Create index on email for searching
 CREATE INDEX IF NOT EXISTS idx_resumes_email ON resumes(email);
+CREATE INDEX IF NOT EXISTS idx_resumes_email_lower ON resumes(lower(email));
+
+-- Create index on content_hash for duplicate lookups
+CREATE INDEX IF NOT EXISTS idx_resumes_content_hash ON resumes(content_hash);
+
+-- Indexes for /resumes/search: skills containment/overlap, experience range and full text
+CREATE INDEX IF NOT EXISTS idx_resumes_skills ON resumes USING GIN (skills);
+CREATE INDEX IF NOT EXISTS idx_resumes_experience_years ON resumes(experience_years);
+CREATE INDEX IF NOT EXISTS idx_resumes_search_vector ON resumes USING GIN (search_vector);
 
 -- Insert sample data for testing (optional)
 INSERT INTO resumes (filename, full_name, email, phone, skills, experience_years, last_job_title) 
@@ -6,6 +6,7 @@ Test script for Resume Analyzer API
 import requests
 import json
 import os
+import time
 from pathlib import Path
 
 # Configuration
@@ -13,6 +14,28 @@ BASE_URL = "http://localhost:8000"
 USERNAME = "admin"
 PASSWORD = "admin123"
 
+def minimal_pdf(text: str = "Test Resume") -> bytes:
+    """One-page PDF with a valid cross-reference table, so the upload pre-check accepts it"""
+    content = b"BT /F1 12 Tf 72 720 Td (%s) Tj ET" % text.encode("latin-1")
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return pdf
+
 def test_health():
     """Test health endpoint"""
     print("🔍 Testing health endpoint...")
@@ -51,10 +74,9 @@ def test_upload_without_token():
     """Test upload without authentication"""
     print("\n🚫 Testing upload without authentication...")
     try:
-        # Create a dummy file for testing
+        # Create a small valid PDF for testing
         test_file = Path("test_resume.pdf")
-        if not test_file.exists():
-            test_file.write_bytes(b"%PDF-1.4\n%Test PDF content")
+        test_file.write_bytes(minimal_pdf())
         
         response = requests.post(
             f"{BASE_URL}/upload",
@@ -71,10 +93,9 @@ def test_upload_with_token(token):
     """Test upload with authentication"""
     print("\n📤 Testing upload with authentication...")
     try:
-        # Create a dummy file for testing
+        # Create a small valid PDF for testing
         test_file = Path("test_resume.pdf")
-        if not test_file.exists():
-            test_file.write_bytes(b"%PDF-1.4\n%Test PDF content")
+        test_file.write_bytes(minimal_pdf())
         
         headers = {"Authorization": f"Bearer {token}"}
         response = requests.post(
@@ -83,17 +104,85 @@ def test_upload_with_token(token):
             files={"file": ("test_resume.pdf", test_file.open("rb"), "application/pdf")}
         )
         
-        if response.status_code == 200:
+        if response.status_code in (200, 202):
+            # 202: staged and queued; 200: identical content was uploaded before
             result = response.json()
-            print("✅ Upload successful")
-            print(f"   Filename: {result['filename']}")
-            print(f"   Webhook status: {result['webhook_status']['status']}")
+            print("✅ Upload accepted")
+            print(f"   Job id: {result['job_id']}")
+            print(f"   Status: {result.get('status', 'duplicate')}")
+            job = requests.get(f"{BASE_URL}/jobs/{result['job_id']}", headers=headers)
+            if job.status_code == 200:
+                print(f"   Job status: {job.json()['status']}")
+            else:
+                print(f"❌ Job status lookup failed: {job.status_code}")
         else:
             print(f"❌ Upload failed: {response.status_code}")
             print(f"   Response: {response.text}")
     except Exception as e:
         print(f"❌ Upload test error: {e}")
 
+def outbox_total():
+    """Webhook deliveries recorded in the outbox, whatever their state, once earlier upload jobs are done"""
+    for _ in range(30):
+        health = requests.get(f"{BASE_URL}/health").json()
+        if not health["job_queue"]["pending"]:
+            break
+        time.sleep(1)
+    outbox = health["webhook_outbox"]
+    return outbox["pending"] + outbox["delivered"] + outbox["dead"]
+
+def test_batch_disconnect(token):
+    """Test that a batch the client abandons still queues the webhook for the files it stored"""
+    print("\n📦 Testing batch upload with an early disconnect...")
+    try:
+        headers = {"Authorization": f"Bearer {token}"}
+        pdfs = [minimal_pdf(f"Batch Resume {os.urandom(4).hex()}") for _ in range(10)]
+        files = [("files", (f"batch_resume_{i}.pdf", pdf, "application/pdf")) for i, pdf in enumerate(pdfs)]
+        before = outbox_total()
+        with requests.post(f"{BASE_URL}/upload/batch", headers=headers, files=files, stream=True) as response:
+            first = json.loads(next(response.iter_lines()))
+        # Give the server time to notice the disconnect and queue the webhook
+        time.sleep(3)
+        queued = outbox_total() - before
+        # Stored files are recorded for deduplication only once their webhook is queued,
+        # so every file answered as a duplicate now must be covered by the queued batch
+        stored = 0
+        for i, pdf in enumerate(pdfs):
+            upload = requests.post(f"{BASE_URL}/upload", headers=headers,
+                                   files={"file": (f"batch_resume_{i}.pdf", pdf, "application/pdf")})
+            if upload.status_code == 200 and upload.json().get("duplicate"):
+                stored += 1
+        print(f"   First result: {first['status']}; stored before the disconnect: {stored}")
+        if (stored and queued == 1) or (not stored and queued == 0):
+            print("✅ Webhook queued for every stored file")
+        else:
+            print(f"❌ {stored} stored files but {queued} webhooks queued")
+    except Exception as e:
+        print(f"❌ Batch disconnect test error: {e}")
+
+def test_analysis_lookup_blank_text(token):
+    """Test that blank resume texts get no analysis cache key"""
+    print("\n🗂️  Testing analysis cache lookup of blank texts...")
+    try:
+        headers = {"Authorization": f"Bearer {token}"}
+        resume_text = "Jane Doe, jane@example.com. Senior Python developer with 8 years of experience " * 3
+        response = requests.post(
+            f"{BASE_URL}/analysis/lookup",
+            headers=headers,
+            json={"texts": ["", " \n\u200b", resume_text]}
+        )
+        if response.status_code != 200:
+            print(f"❌ Analysis lookup failed: {response.status_code}")
+            return
+        blank, invisible, text = response.json()["results"]
+        if (blank["analysis_key"] is None and invisible["analysis_key"] is None and not blank["hit"]
+                and not invisible["hit"] and text["analysis_key"]):
+            print("✅ Blank texts are never served a cached analysis")
+        else:
+            print(f"❌ Unexpected lookup results: {response.json()['results']}")
+    except Exception as e:
+        print(f"❌ Analysis lookup test error: {e}")
+
 def test_api_documentation():
     """Test API documentation endpoint"""
     print("\n📚 Testing API documentation...")
@@ -123,6 +212,8 @@ def main():
     # Test upload with token
     if token:
         test_upload_with_token(token)
+        test_batch_disconnect(token)
+        test_analysis_lookup_blank_text(token)
     
     # Test API documentation
     test_api_documentation()